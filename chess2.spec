@@ -13,9 +13,10 @@ a = Analysis(
         ('src/assets/**/*', 'assets/'),
         ('src/assets/FreeSerif.ttf', 'assets/'),
         ('src/assets/menu_background.jpg', 'assets/'),
-        ('src/assets/sounds/*.ogg', 'assets/sounds/')
+        ('src/assets/sounds/*.ogg', 'assets/sounds/'),
+        ('src/assets/tablebases/*.c2tb', 'assets/tablebases/')
     ],
-    hiddenimports=['pygame', 'game', 'core', 'utils'],
+    hiddenimports=['pygame', 'game', 'core', 'utils', 'profiling'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
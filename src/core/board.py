@@ -1,7 +1,36 @@
 import logging
+import random
 from typing import List, Optional, Set, Tuple
 
-from core.piece import Piece, PieceType
+from core.piece import MATERIAL_VALUES, Piece, PieceType
+
+# Random bits per (piece type, colour, has-moved) and square, for position keys.
+# Seeded, so a key means the same position in every process and every run --
+# anything written to disk under a key stays valid. Whether a king or rook has
+# moved decides castling, so it is part of the position; for every other piece
+# it makes no difference and is left out.
+_ZOBRIST_RNG = random.Random(0xC4E552)
+_ZOBRIST = {
+    (piece_type, is_white, moved): [_ZOBRIST_RNG.getrandbits(64) for _ in range(64)]
+    for piece_type in PieceType
+    for is_white in (True, False)
+    for moved in (True, False)
+}
+_ZOBRIST_BLACK_TO_MOVE = _ZOBRIST_RNG.getrandbits(64)
+_CASTLING_PIECES = (PieceType.KING, PieceType.ROOK)
+
+# The move generators' jump and line patterns, for attack detection.
+_SPY_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+_KNIGHT_JUMPS = _SPY_JUMPS + ((-2, 0), (2, 0), (0, -2), (0, 2))
+_KING_STEPS = (
+    (-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)
+)
+_ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+_BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+# The king has no material value, but in an exchange it must be the last piece
+# sent in, so it sorts after everything else.
+_KING_EXCHANGE_VALUE = 100_000
 
 
 class ChessBoard:
@@ -61,6 +90,22 @@ class ChessBoard:
             for row in self.board
         )
 
+    def zobrist_key(self, is_white: bool) -> int:
+        """64-bit key for the position with `is_white` to move.
+
+        Equal positions get equal keys in any process, which is what the
+        search's transposition table relies on.
+        """
+        key = 0 if is_white else _ZOBRIST_BLACK_TO_MOVE
+        square = 0
+        for row in self.board:
+            for piece in row:
+                if piece is not None:
+                    moved = piece.has_moved and piece.type in _CASTLING_PIECES
+                    key ^= _ZOBRIST[piece.type, piece.is_white, moved][square]
+                square += 1
+        return key
+
     def restore(self, snap: Tuple):
         """Restore a position produced by snapshot()."""
         for r, row in enumerate(snap):
@@ -74,15 +119,34 @@ class ChessBoard:
         start: Tuple[int, int],
         end: Tuple[int, int],
         promotion: PieceType = PieceType.QUEEN,
-    ):
+    ) -> List[Tuple]:
         """Apply a move including Chess 2's special cases.
 
         Shared by GameState and the AI search so both obey exactly the same
         rules. Assumes the move has already been validated.
+
+        Returns what undo_move() needs to take the move back. Much cheaper
+        than a snapshot for the search, which takes back every move it tries.
         """
         piece = self.get_piece(start)
         if not piece:
-            return
+            return []
+
+        touched = [start, end]
+        if piece.type == PieceType.KING and abs(end[1] - start[1]) == 2:
+            row = start[0]
+            if end[1] > start[1]:
+                touched += [(row, 7), (row, end[1] - 1)]
+            else:
+                touched += [(row, 0), (row, end[1] + 1)]
+        undo = []
+        for r, c in touched:
+            square = self.board[r][c]
+            undo.append(
+                (r, c, square)
+                if square is None
+                else (r, c, square, square.is_white, square.has_moved)
+            )
 
         # Spy conversion: the spy flips an enemy piece and dies doing it.
         if piece.type == PieceType.SPY:
@@ -90,36 +154,72 @@ class ChessBoard:
             if target and target.is_white != piece.is_white:
                 target.is_white = piece.is_white
                 self.board[start[0]][start[1]] = None
-                return
+                return undo
 
         self.move_piece(start, end)
 
         # Castling moves the rook alongside the king.
-        if piece.type == PieceType.KING and abs(end[1] - start[1]) == 2:
-            row = start[0]
-            if end[1] > start[1]:
-                self.move_piece((row, 7), (row, end[1] - 1))
-            else:
-                self.move_piece((row, 0), (row, end[1] + 1))
+        if len(touched) == 4:
+            self.move_piece(touched[2], touched[3])
 
         # Pawn promotion.
         if piece.type == PieceType.PAWN and end[0] in (0, 7):
             self.board[end[0]][end[1]] = Piece(promotion, piece.is_white, True)
-
-    def legal_moves_for(self, is_white: bool) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
-        """Every legal (start, end) for a colour, ignoring whose turn it is."""
+        return undo
+
+    def undo_move(self, undo: List[Tuple]):
+        """Take back a move, given what apply_move() returned for it."""
+        for entry in reversed(undo):
+            r, c, piece = entry[0], entry[1], entry[2]
+            self.board[r][c] = piece
+            if piece is not None:
+                piece.is_white = entry[3]
+                piece.has_moved = entry[4]
+
+    def legal_moves_for(
+        self, is_white: bool, captures_only: bool = False
+    ) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        """Every legal (start, end) for a colour, ignoring whose turn it is.
+
+        `captures_only` keeps just the moves onto an enemy piece -- captures
+        and spy conversions -- which is all the AI's quiescence search needs.
+        """
         moves = []
+        king_pos = self._king_position(is_white)
+        in_check = king_pos is not None and self._is_square_attacked(
+            king_pos, not is_white
+        )
+        # Unless the king is already in check, only king moves and pinned
+        # pieces can leave it attacked; everything else needs no testing.
+        pinned = self._pinned(king_pos, is_white) if king_pos and not in_check else ()
         for r in range(8):
             for c in range(8):
                 piece = self.board[r][c]
                 if not piece or piece.is_white != is_white:
                     continue
+                needs_test = (
+                    in_check
+                    or king_pos is None
+                    or piece.type == PieceType.KING
+                    or (r, c) in pinned
+                )
                 for end in self.get_moves((r, c)):
+                    if captures_only and self.board[end[0]][end[1]] is None:
+                        continue
+                    if not needs_test:
+                        moves.append(((r, c), end))
+                        continue
+
                     captured = self.board[end[0]][end[1]]
                     self.board[end[0]][end[1]] = piece
                     self.board[r][c] = None
 
-                    safe = not self.is_in_check(is_white)
+                    if piece.type == PieceType.KING:
+                        safe = not self._is_square_attacked(end, not is_white)
+                    else:
+                        safe = king_pos is None or not self._is_square_attacked(
+                            king_pos, not is_white
+                        )
 
                     self.board[r][c] = piece
                     self.board[end[0]][end[1]] = captured
@@ -128,6 +228,47 @@ class ChessBoard:
                         moves.append(((r, c), end))
         return moves
 
+    def _pinned(self, king_pos: Tuple[int, int], is_white: bool) -> Set[Tuple[int, int]]:
+        """Pieces of the king's colour standing between it and an enemy slider.
+
+        Only these can expose the king by moving, so they are the only moves
+        besides the king's own that need testing for legality.
+        """
+        pinned = set()
+        row, col = king_pos
+        for directions, sliders in (
+            (_ROOK_DIRECTIONS, (PieceType.QUEEN, PieceType.ROOK)),
+            (_BISHOP_DIRECTIONS, (PieceType.QUEEN, PieceType.BISHOP)),
+        ):
+            for dr, dc in directions:
+                r, c = row + dr, col + dc
+                shield = None
+                while 0 <= r < 8 and 0 <= c < 8:
+                    piece = self.board[r][c]
+                    if piece is not None:
+                        if piece.is_white == is_white:
+                            if shield is not None:
+                                break
+                            shield = (r, c)
+                        else:
+                            if shield is not None and piece.type in sliders:
+                                pinned.add(shield)
+                            break
+                    r += dr
+                    c += dc
+        return pinned
+
+    def _king_position(self, is_white: bool) -> Optional[Tuple[int, int]]:
+        for r, row in enumerate(self.board):
+            for c, piece in enumerate(row):
+                if (
+                    piece is not None
+                    and piece.type == PieceType.KING
+                    and piece.is_white == is_white
+                ):
+                    return (r, c)
+        return None
+
     def move_piece(
         self, start: Tuple[int, int], end: Tuple[int, int], convert: bool = False
     ):
@@ -403,14 +544,182 @@ class ChessBoard:
         )
 
     def _is_square_attacked(self, pos: Tuple[int, int], by_white: bool) -> bool:
-        for r in range(8):
-            for c in range(8):
-                piece = self.get_piece((r, c))
-                if piece and piece.is_white == by_white:
-                    if pos in self.get_moves((r, c), check_castling=False):
+        """Could any `by_white` piece move onto `pos` (castling aside)?
+
+        Works outward from the square -- jump offsets, then the first piece
+        along each line -- instead of generating every enemy move, which made
+        this the most expensive call in both the game and the AI search.
+
+        A pawn's two-square push is the one move left out: it never captures,
+        and the empty squares asked about here (the ones a castling king
+        crosses) are on the back ranks, which a push never reaches.
+        """
+        row, col = pos
+        board = self.board
+        target = board[row][col]
+        if target is not None and target.is_white == by_white:
+            return False
+
+        # Pawns reach the three squares in front of them.
+        pawn_row = row + 1 if by_white else row - 1
+        if 0 <= pawn_row < 8:
+            for c in (col - 1, col, col + 1):
+                if 0 <= c < 8:
+                    piece = board[pawn_row][c]
+                    if (
+                        piece is not None
+                        and piece.type == PieceType.PAWN
+                        and piece.is_white == by_white
+                    ):
                         return True
+
+        for offsets, piece_type in (
+            (_KNIGHT_JUMPS, PieceType.KNIGHT),
+            (_SPY_JUMPS, PieceType.SPY),
+            (_KING_STEPS, PieceType.KING),
+        ):
+            for dr, dc in offsets:
+                r, c = row + dr, col + dc
+                if 0 <= r < 8 and 0 <= c < 8:
+                    piece = board[r][c]
+                    if (
+                        piece is not None
+                        and piece.type == piece_type
+                        and piece.is_white == by_white
+                    ):
+                        return True
+
+        # Bishops cannot take queens, so a queen standing on the square is safe
+        # from them, though not from a queen on the same diagonal.
+        queen_on_square = target is not None and target.type == PieceType.QUEEN
+        diagonal = (
+            (PieceType.QUEEN,)
+            if queen_on_square
+            else (PieceType.QUEEN, PieceType.BISHOP)
+        )
+        for directions, sliders in (
+            (_ROOK_DIRECTIONS, (PieceType.QUEEN, PieceType.ROOK)),
+            (_BISHOP_DIRECTIONS, diagonal),
+        ):
+            for dr, dc in directions:
+                r, c = row + dr, col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    piece = board[r][c]
+                    if piece is not None:
+                        if piece.is_white == by_white and piece.type in sliders:
+                            return True
+                        break
+                    r += dr
+                    c += dc
         return False
 
+    def static_exchange(self, start: Tuple[int, int], end: Tuple[int, int]) -> int:
+        """Centipawns the mover comes out ahead if both sides trade off on `end`.
+
+        After start -> end, each side in turn may recapture on the square with
+        its cheapest piece or stop, whichever is better for it. The result is
+        what that exchange nets the side that started it: negative means the
+        move loses material.
+
+        Chess 2 changes the arithmetic. A spy converts rather than captures:
+        the target swings to the spy's side -- twice its value -- and stays on
+        the square, while the spy itself dies. Bishops cannot take a queen, so
+        they drop out of the exchange while one stands on the square. Pawns
+        take on all three squares ahead of them. Pins are ignored, as usual
+        for this kind of estimate; the king only joins in if it would be safe.
+        """
+        piece = self.board[start[0]][start[1]]
+        if piece is None:
+            return 0
+        gain = self._capture_gain(piece, self.board[end[0]][end[1]], end)
+        undo = self.apply_move(start, end)
+        reply = self._exchange(end, not piece.is_white)
+        self.undo_move(undo)
+        return gain - reply
+
+    def _exchange(self, pos: Tuple[int, int], is_white: bool) -> int:
+        """Best `is_white` can make by capturing on `pos`, or 0 by declining."""
+        attacker = self._least_valuable_attacker(pos, is_white)
+        if attacker is None:
+            return 0
+        piece = self.board[attacker[0]][attacker[1]]
+        gain = self._capture_gain(piece, self.board[pos[0]][pos[1]], pos)
+        undo = self.apply_move(attacker, pos)
+        if piece.type == PieceType.KING and self._is_square_attacked(pos, not is_white):
+            self.undo_move(undo)
+            return 0
+        result = max(0, gain - self._exchange(pos, not is_white))
+        self.undo_move(undo)
+        return result
+
+    @staticmethod
+    def _capture_gain(
+        piece: Piece, target: Optional[Piece], pos: Tuple[int, int]
+    ) -> int:
+        """Material `piece` gains by moving onto `pos`, where `target` stands."""
+        if target is None:
+            return 0
+        value = MATERIAL_VALUES.get(target.type, 0)
+        if piece.type == PieceType.SPY:
+            # The target changes sides and the spy is spent.
+            return 2 * value - MATERIAL_VALUES[PieceType.SPY]
+        if piece.type == PieceType.PAWN and pos[0] in (0, 7):
+            value += MATERIAL_VALUES[PieceType.QUEEN] - MATERIAL_VALUES[PieceType.PAWN]
+        return value
+
+    def _least_valuable_attacker(
+        self, pos: Tuple[int, int], by_white: bool
+    ) -> Optional[Tuple[int, int]]:
+        """Square of the cheapest `by_white` piece that can capture on `pos`."""
+        row, col = pos
+        board = self.board
+        target = board[row][col]
+        candidates = []
+
+        pawn_row = row + 1 if by_white else row - 1
+        if 0 <= pawn_row < 8:
+            for c in (col - 1, col, col + 1):
+                if 0 <= c < 8:
+                    candidates.append((pawn_row, c, (PieceType.PAWN,)))
+        for offsets, piece_type in (
+            (_KNIGHT_JUMPS, PieceType.KNIGHT),
+            (_SPY_JUMPS, PieceType.SPY),
+            (_KING_STEPS, PieceType.KING),
+        ):
+            for dr, dc in offsets:
+                r, c = row + dr, col + dc
+                if 0 <= r < 8 and 0 <= c < 8:
+                    candidates.append((r, c, (piece_type,)))
+
+        queen_on_square = target is not None and target.type == PieceType.QUEEN
+        diagonal = (
+            (PieceType.QUEEN,)
+            if queen_on_square
+            else (PieceType.QUEEN, PieceType.BISHOP)
+        )
+        for directions, sliders in (
+            (_ROOK_DIRECTIONS, (PieceType.QUEEN, PieceType.ROOK)),
+            (_BISHOP_DIRECTIONS, diagonal),
+        ):
+            for dr, dc in directions:
+                r, c = row + dr, col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    if board[r][c] is not None:
+                        candidates.append((r, c, sliders))
+                        break
+                    r += dr
+                    c += dc
+
+        best, best_value = None, None
+        for r, c, types in candidates:
+            piece = board[r][c]
+            if piece is None or piece.is_white != by_white or piece.type not in types:
+                continue
+            value = MATERIAL_VALUES.get(piece.type, _KING_EXCHANGE_VALUE)
+            if best_value is None or value < best_value:
+                best, best_value = (r, c), value
+        return best
+
     def _get_sliding_moves(
         self, pos: Tuple[int, int], dr: int, dc: int
     ) -> Set[Tuple[int, int]]:
@@ -440,53 +749,65 @@ class ChessBoard:
         return 0 <= row < 8 and 0 <= col < 8
 
     def is_in_check(self, is_white: bool) -> bool:
-        # Find king
-        king_pos = None
-        for r in range(8):
-            for c in range(8):
-                piece = self.get_piece((r, c))
-                if (
-                    piece
-                    and piece.type == PieceType.KING
-                    and piece.is_white == is_white
-                ):
-                    king_pos = (r, c)
-                    break
-            if king_pos:
-                break
-
-        if not king_pos:
+        king_pos = self._king_position(is_white)
+        if king_pos is None:
             return False
-
-        # Check if any enemy piece can capture the king. Castling targets are
-        # empty squares by definition, so skipping castling generation here
-        # cannot change the answer -- it just avoids a lot of wasted work.
-        for r in range(8):
-            for c in range(8):
-                piece = self.board[r][c]
-                if piece and piece.is_white != is_white:
-                    if king_pos in self.get_moves((r, c), check_castling=False):
-                        return True
-        return False
+        return self._is_square_attacked(king_pos, not is_white)
 
     def has_legal_moves(self, is_white: bool) -> bool:
-        for r in range(8):
-            for c in range(8):
-                piece = self.get_piece((r, c))
-                if piece and piece.is_white == is_white:
-                    possible_moves = self.get_moves((r, c))
-                    for move in possible_moves:
-                        # Try move and check if it leaves king in check
-                        temp_piece = self.board[move[0]][move[1]]
-                        self.board[move[0]][move[1]] = piece
-                        self.board[r][c] = None
-
-                        in_check = self.is_in_check(is_white)
-
-                        # Restore board
-                        self.board[r][c] = piece
-                        self.board[move[0]][move[1]] = temp_piece
-
-                        if not in_check:
-                            return True
-        return False
+        return bool(self.legal_moves_for(is_white))
+
+    def get_unmoves(self, pos: Tuple[int, int]) -> Set[Tuple[int, int]]:
+        """Squares the piece on `pos` could have just come from.
+
+        The reverse of get_moves() for moves that captured nothing, converted
+        nothing and did not promote, which is what retrograde analysis walks
+        back along. Castling is left out: it is never available in the
+        endgames that is used for.
+        """
+        piece = self.get_piece(pos)
+        if not piece:
+            return set()
+        row, col = pos
+
+        if piece.type == PieceType.PAWN:
+            # Pawns came from one of the three squares behind them, or two
+            # straight back if that is their starting row.
+            back = 1 if piece.is_white else -1
+            start_row = 6 if piece.is_white else 1
+            squares = {(row + back, col + dc) for dc in (-1, 0, 1)}
+            if row + 2 * back == start_row and not self.board[row + back][col]:
+                squares.add((row + 2 * back, col))
+            return {
+                (r, c)
+                for r, c in squares
+                if 0 <= c < 8 and 1 <= r <= 6 and not self.board[r][c]
+            }
+
+        if piece.type in (PieceType.KNIGHT, PieceType.SPY, PieceType.KING):
+            jumps = {
+                PieceType.KNIGHT: _KNIGHT_JUMPS,
+                PieceType.SPY: _SPY_JUMPS,
+                PieceType.KING: _KING_STEPS,
+            }[piece.type]
+            return {
+                (row + dr, col + dc)
+                for dr, dc in jumps
+                if 0 <= row + dr < 8
+                and 0 <= col + dc < 8
+                and not self.board[row + dr][col + dc]
+            }
+
+        directions = {
+            PieceType.BISHOP: _BISHOP_DIRECTIONS,
+            PieceType.ROOK: _ROOK_DIRECTIONS,
+            PieceType.QUEEN: _BISHOP_DIRECTIONS + _ROOK_DIRECTIONS,
+        }[piece.type]
+        squares = set()
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8 and not self.board[r][c]:
+                squares.add((r, c))
+                r += dr
+                c += dc
+        return squares
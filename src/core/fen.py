@@ -0,0 +1,130 @@
+"""Forsyth-Edwards notation for Chess 2 positions.
+
+Ordinary FEN with one extra letter, S/s for the spy. Chess 2 has no en
+passant, so that field is always "-", and the castling field is worked out from
+whether the kings and rooks have moved -- the only pieces for which that
+matters -- rather than stored.
+"""
+
+from typing import Tuple
+
+from core.board import ChessBoard
+from core.piece import Piece, PieceType
+
+FEN_LETTERS = {
+    PieceType.PAWN: "p",
+    PieceType.KNIGHT: "n",
+    PieceType.BISHOP: "b",
+    PieceType.ROOK: "r",
+    PieceType.QUEEN: "q",
+    PieceType.KING: "k",
+    PieceType.SPY: "s",
+}
+_LETTER_TYPES = {letter: piece_type for piece_type, letter in FEN_LETTERS.items()}
+
+# (white?, kingside letter, queenside letter)
+_CASTLING_LETTERS = ((True, "K", "Q"), (False, "k", "q"))
+
+START_FEN = "rnbqkbnr/ppppppps/7p/8/8/7P/PPPPPPPS/RNBQKBNR w KQkq - 0 1"
+
+
+def board_to_fen(board: ChessBoard, is_white: bool, fullmove: int = 1) -> str:
+    """FEN for the position with `is_white` to move."""
+    ranks = []
+    for row in board.board:
+        rank = ""
+        empty = 0
+        for piece in row:
+            if piece is None:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            letter = FEN_LETTERS[piece.type]
+            rank += letter.upper() if piece.is_white else letter
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+
+    castling = ""
+    for colour, king_letter, queen_letter in _CASTLING_LETTERS:
+        row = 7 if colour else 0
+        if not _unmoved(board, (row, 4), PieceType.KING, colour):
+            continue
+        if _unmoved(board, (row, 7), PieceType.ROOK, colour):
+            castling += king_letter
+        if _unmoved(board, (row, 0), PieceType.ROOK, colour):
+            castling += queen_letter
+
+    side = "w" if is_white else "b"
+    return f"{'/'.join(ranks)} {side} {castling or '-'} - 0 {fullmove}"
+
+
+def board_from_fen(fen: str) -> Tuple[ChessBoard, bool]:
+    """(board, white to move) for a FEN; raises ValueError if it is malformed.
+
+    Only the placement and side to move are required. Pieces are marked as
+    moved wherever that takes away a castling right the FEN does not give.
+    """
+    fields = fen.split()
+    if len(fields) < 2:
+        raise ValueError(f"FEN needs at least a placement and a side: {fen!r}")
+    placement, side = fields[0], fields[1]
+    castling = fields[2] if len(fields) > 2 else "-"
+    if side not in ("w", "b"):
+        raise ValueError(f"Bad side to move in FEN: {side!r}")
+
+    ranks = placement.split("/")
+    if len(ranks) != 8:
+        raise ValueError(f"FEN placement needs 8 ranks: {placement!r}")
+
+    board = ChessBoard()
+    board.board = [[None] * 8 for _ in range(8)]
+    for row, rank in enumerate(ranks):
+        col = 0
+        for char in rank:
+            if char.isdigit():
+                col += int(char)
+            elif char.lower() in _LETTER_TYPES and col < 8:
+                piece_type = _LETTER_TYPES[char.lower()]
+                board.board[row][col] = Piece(piece_type, char.isupper())
+                col += 1
+            else:
+                raise ValueError(f"Bad FEN rank: {rank!r}")
+        if col != 8:
+            raise ValueError(f"Bad FEN rank: {rank!r}")
+
+    # Every king and rook counts as moved unless a castling right says not.
+    for row in board.board:
+        for piece in row:
+            if piece is not None and piece.type in (PieceType.KING, PieceType.ROOK):
+                piece.has_moved = True
+    for is_white, king_letter, queen_letter in _CASTLING_LETTERS:
+        row = 7 if is_white else 0
+        rook_cols = [
+            col
+            for col, letter in ((7, king_letter), (0, queen_letter))
+            if letter in castling and _is(board, (row, col), PieceType.ROOK, is_white)
+        ]
+        if rook_cols and _is(board, (row, 4), PieceType.KING, is_white):
+            board.board[row][4].has_moved = False
+            for col in rook_cols:
+                board.board[row][col].has_moved = False
+
+    return board, side == "w"
+
+
+def _is(
+    board: ChessBoard, pos: Tuple[int, int], piece_type: PieceType, is_white: bool
+) -> bool:
+    piece = board.board[pos[0]][pos[1]]
+    return piece is not None and piece.type == piece_type and piece.is_white == is_white
+
+
+def _unmoved(
+    board: ChessBoard, pos: Tuple[int, int], piece_type: PieceType, is_white: bool
+) -> bool:
+    if not _is(board, pos, piece_type, is_white):
+        return False
+    return not board.board[pos[0]][pos[1]].has_moved
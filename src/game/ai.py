@@ -11,17 +11,30 @@ material by twice its target's value.
 """
 
 import asyncio
+import logging
 import random
-from typing import List, Optional, Tuple
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from core.board import ChessBoard
 from core.piece import MATERIAL_VALUES, PieceType
+from game import book, tablebase
 
 EASY = "easy"
 MEDIUM = "medium"
 HARD = "hard"
 
-DIFFICULTY_DEPTH = {EASY: 0, MEDIUM: 2, HARD: 3}
+DIFFICULTY_DEPTH = {EASY: 0, MEDIUM: 2, HARD: 6}
+
+# Difficulties that open from the book. It is built from depth-6 searches,
+# deeper than Hard gets in its time near the start.
+BOOK_DIFFICULTIES = (MEDIUM, HARD)
+
+# Seconds a difficulty may think before playing the best move found so far.
+# Hard searches as deep as it can in about the time its old fixed depth-3
+# search took; the depth above is only a ceiling.
+DIFFICULTY_TIME = {HARD: 2.0}
 
 # The shared Chess 2 valuation, plus a sentinel for the king so that losing it
 # dominates every other term.
@@ -41,9 +54,184 @@ CENTRE_BONUS = [
 
 MATE_SCORE = 100_000
 
+# Deepest the search ever goes, in plies. Mate scores count plies up from here,
+# so a quicker mate always scores higher than a slower one.
+MAX_PLY = 64
+
+# Half-width of the first aspiration window at the root, in centipawns. About a
+# pawn either way: the score rarely moves further than that between iterations.
+ASPIRATION_WINDOW = 50
+
+# Null-move pruning: pass, and search the reply this many plies shallower.
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+
+# Late move reductions: quiet moves this far down the ordering are searched a
+# ply shallower first (two from LMR_DEEP_MOVE on, in deeper searches), and only
+# searched properly if they turn out to matter.
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVE = 3
+LMR_DEEP_MOVE = 8
+
+# Sort offset that puts captures which do not lose material ahead of quiet
+# moves; larger than any exchange can come to.
+GOOD_CAPTURE = 10_000
+
+# Parts of the search that can be switched off, to measure what each is worth
+# (see game.tournament).
+FEATURES = ("pvs", "null_move", "lmr", "aspiration", "tablebases")
+
+# Transposition table bounds.
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
 Move = Tuple[Tuple[int, int], Tuple[int, int]]
 
 
+@dataclass
+class IterationStats:
+    """One finished iteration of iterative deepening."""
+
+    depth: int
+    score: int
+    nodes: int
+    seconds: float
+
+
+@dataclass
+class SearchStats:
+    """What a search did and where the time went.
+
+    Counters only ever go up during a search, so a callback can be handed the
+    same object again and again and always see the latest figures.
+    """
+
+    # Every position visited, quiescence included, and the quiescence share.
+    nodes: int = 0
+    qnodes: int = 0
+    # Moves that failed high and ended their node's loop, and how many of
+    # those were the first move tried: the share says how good the ordering is.
+    cutoffs: int = 0
+    first_move_cutoffs: int = 0
+    tt_probes: int = 0
+    tt_hits: int = 0
+    tb_hits: int = 0
+    # Deepest ply reached, quiescence included (the "seldepth" of other
+    # engines), and the deepest iteration finished.
+    max_depth: int = 0
+    depth: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+    iterations: List[IterationStats] = field(default_factory=list)
+
+    @property
+    def nps(self) -> int:
+        return int(self.nodes / self.elapsed) if self.elapsed > 0 else 0
+
+    @property
+    def first_move_cutoff_rate(self) -> float:
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def tt_hit_rate(self) -> float:
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    @property
+    def branching_factor(self) -> float:
+        """Effective branching factor: how many times more nodes the last
+        iteration needed than the one before it."""
+        if len(self.iterations) < 2 or not self.iterations[-2].nodes:
+            return 0.0
+        return self.iterations[-1].nodes / self.iterations[-2].nodes
+
+    def summary(self) -> str:
+        """One line for the log."""
+        per_ply = " ".join(f"{i.depth}:{i.seconds:.2f}s" for i in self.iterations)
+        return (
+            f"depth {self.depth} seldepth {self.max_depth} nodes {self.nodes}"
+            f" (q {self.qnodes}) nps {self.nps} in {self.elapsed:.2f}s,"
+            f" tt hits {self.tt_hit_rate:.0%} of {self.tt_probes},"
+            f" cutoffs {self.cutoffs} ({self.first_move_cutoff_rate:.0%} first),"
+            f" branching {self.branching_factor:.2f}, per ply [{per_ply}]"
+        )
+
+
+class SearchTimeout(Exception):
+    """The search ran out of time or nodes, or was told to stop.
+
+    Either way the last finished iteration stands.
+    """
+
+
+class TranspositionTable:
+    """Scores and best moves of positions already searched, by Zobrist key.
+
+    A fixed number of slots, so memory stays put however long the game runs;
+    a new entry evicts whatever shares its slot unless that is a deeper search
+    of the same position. Kept between moves, since most of what was searched
+    for one move is still relevant to the next.
+    """
+
+    # Rough cost of one entry in bytes, to turn a size in megabytes into slots.
+    ENTRY_BYTES = 160
+
+    def __init__(self, size_mb: int = 16):
+        self.resize(size_mb)
+
+    def resize(self, size_mb: int):
+        self.size = max(1, size_mb * 2**20 // self.ENTRY_BYTES)
+        self.entries: List[Optional[tuple]] = [None] * self.size
+
+    def clear(self):
+        self.entries = [None] * self.size
+
+    def probe(self, key: int) -> Optional[tuple]:
+        """(key, depth, bound, score, move) for the position, or None."""
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, bound: int, score: int, move: Optional[Move]):
+        index = key % self.size
+        old = self.entries[index]
+        if old is not None and old[0] == key and old[1] > depth:
+            return
+        self.entries[index] = (key, depth, bound, score, move)
+
+
+# Shared by every game in the process: the GUI plays one game at a time, and a
+# position searched last move is as good a starting point as any.
+_TABLE = TranspositionTable()
+
+
+def _score_to_table(score: int, ply: int) -> int:
+    """Make a mate score relative to the node, so it can be reused at any ply."""
+    if score >= MATE_SCORE:
+        return score + ply
+    if score <= -MATE_SCORE:
+        return score - ply
+    return score
+
+
+def _score_from_table(score: int, ply: int) -> int:
+    if score >= MATE_SCORE:
+        return score - ply
+    if score <= -MATE_SCORE:
+        return score + ply
+    return score
+
+
+def _tablebase_score(value: int, ply: int) -> int:
+    """Search score of a tablebase value, mates counted like the search's."""
+    if value > 0:
+        return MATE_SCORE + max(0, MAX_PLY - (ply + value))
+    if value < 0:
+        return -MATE_SCORE - max(0, MAX_PLY - (ply - value - 1))
+    return 0
+
+
 def evaluate(board: ChessBoard, is_white: bool) -> int:
     """Score the position from is_white's point of view, in centipawns."""
     score = 0
@@ -61,95 +249,483 @@ def evaluate(board: ChessBoard, is_white: bool) -> int:
 
 
 def _move_order_key(board: ChessBoard, move: Move) -> int:
-    """Search captures first so alpha-beta prunes more."""
-    target = board.board[move[1][0]][move[1][1]]
+    """Search good captures first, then quiet moves, then losing captures.
+
+    Captures are ranked by static exchange evaluation rather than by what they
+    take, so a queen grabbing a defended pawn no longer jumps the queue. Taking
+    something worth at least the taker cannot lose material, so the full
+    exchange is only worked out for the others.
+    """
+    (start_row, start_col), (end_row, end_col) = move
+    target = board.board[end_row][end_col]
     if target is None:
         return 0
-    return -PIECE_VALUES[target.type]
+    attacker = board.board[start_row][start_col]
+    gain = PIECE_VALUES[target.type] - PIECE_VALUES[attacker.type]
+    if gain < 0:
+        gain = board.static_exchange(*move)
+    return -GOOD_CAPTURE - gain if gain >= 0 else -gain
+
+
+def _is_tactical(board: ChessBoard, move: Move) -> bool:
+    """Captures, spy conversions and promotions: never reduced.
+
+    A spy conversion lands on an occupied square just like a capture does, and
+    swings twice the material of one, so it is covered by the same test.
+    """
+    (start_row, start_col), (end_row, end_col) = move
+    if board.board[end_row][end_col] is not None:
+        return True
+    piece = board.board[start_row][start_col]
+    return piece.type == PieceType.PAWN and end_row in (0, 7)
+
+
+def _has_pieces(board: ChessBoard, is_white: bool) -> bool:
+    """Anything besides king and pawns, which is when passing is never best.
+
+    With only pawns left every move can make things worse (zugzwang), and
+    null-move pruning would wrongly assume that doing nothing is safe.
+    """
+    for row in board.board:
+        for piece in row:
+            if (
+                piece is not None
+                and piece.is_white == is_white
+                and piece.type not in (PieceType.KING, PieceType.PAWN)
+            ):
+                return True
+    return False
 
 
 class _Search:
-    def __init__(self, board: ChessBoard, yield_every: int = 900):
+    def __init__(
+        self,
+        board: ChessBoard,
+        yield_every: int = 900,
+        table: Optional[TranspositionTable] = None,
+        deadline: Optional[float] = None,
+        max_nodes: Optional[int] = None,
+        stop: Optional[Callable[[], bool]] = None,
+        on_iteration: Optional[Callable[[int, int, List[Move]], None]] = None,
+        tablebases: Optional[tablebase.Tablebases] = None,
+        on_stats: Optional[Callable[[SearchStats], None]] = None,
+        disabled: Iterable[str] = (),
+    ):
+        disabled = set(disabled)
+        unknown = disabled - set(FEATURES)
+        if unknown:
+            raise ValueError(f"Unknown search features: {', '.join(sorted(unknown))}")
         self.board = board
         self.nodes = 0
+        self.stats = SearchStats()
         self.yield_every = yield_every
+        self.table = table if table is not None else TranspositionTable()
+        # time.perf_counter() value after which the search gives up and plays
+        # the best move of the last iteration it finished. A node budget and a
+        # stop request end it the same way.
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.stop = stop
+        # Called with (depth, score, best moves) after every finished
+        # iteration, for engines that report progress.
+        self.on_iteration = on_iteration
+        if "tablebases" in disabled:
+            tablebases = tablebase.Tablebases(None)
+        self.tablebases = (
+            tablebases if tablebases is not None else tablebase.default_tablebases()
+        )
+        self.pvs = "pvs" not in disabled
+        self.null_move = "null_move" not in disabled
+        self.lmr = "lmr" not in disabled
+        self.aspiration = "aspiration" not in disabled
+        # Called with self.stats whenever the search yields and after every
+        # iteration, to show a search's progress while it runs.
+        self.on_stats = on_stats
 
     async def _maybe_yield(self):
         self.nodes += 1
         if self.nodes % self.yield_every == 0:
+            self._report()
             # Hand control back so the browser can paint a frame.
             await asyncio.sleep(0)
+        if self.nodes % 32 == 0 and (
+            (self.deadline is not None and time.perf_counter() > self.deadline)
+            or (self.max_nodes is not None and self.nodes >= self.max_nodes)
+            or (self.stop is not None and self.stop())
+        ):
+            raise SearchTimeout
+
+    def _report(self):
+        stats = self.stats
+        stats.nodes = self.nodes
+        stats.elapsed = time.perf_counter() - stats.started
+        if self.on_stats is not None:
+            self.on_stats(stats)
+
+    async def negamax(
+        self,
+        depth: int,
+        is_white: bool,
+        alpha: int,
+        beta: int,
+        ply: int = 1,
+        null_ok: bool = True,
+    ) -> int:
+        # Leaves only look at captures: leaf nodes vastly outnumber interior
+        # ones, and generating a full legal move list there (just to spot mate)
+        # dominated the search cost. Mates are still found one ply higher up.
+        # The quiescence search counts the node itself.
+        if depth <= 0:
+            return await self.quiesce(is_white, alpha, beta, ply)
 
-    async def negamax(self, depth: int, is_white: bool, alpha: int, beta: int) -> int:
         await self._maybe_yield()
 
-        # Evaluate before generating moves: leaf nodes vastly outnumber interior
-        # ones, and generating a full legal move list there (just to spot mate)
-        # dominated the search cost. Mates are still found one ply higher up.
-        if depth == 0:
-            return evaluate(self.board, is_white)
+        stats = self.stats
+        if ply > stats.max_depth:
+            stats.max_depth = ply
+        key = self.board.zobrist_key(is_white)
+        entry = self.table.probe(key)
+        stats.tt_probes += 1
+        hash_move = None
+        if entry is not None:
+            stats.tt_hits += 1
+            _, entry_depth, bound, entry_score, hash_move = entry
+            if entry_depth >= depth:
+                entry_score = _score_from_table(entry_score, ply)
+                if (
+                    bound == EXACT
+                    or (bound == LOWER and entry_score >= beta)
+                    or (bound == UPPER and entry_score <= alpha)
+                ):
+                    return entry_score
+
+        # With few enough pieces left the answer is known exactly; no need to
+        # search for it.
+        if self.tablebases.available:
+            value = self.tablebases.probe(self.board, is_white)
+            if value is not None:
+                stats.tb_hits += 1
+                return _tablebase_score(value, ply)
+
+        in_check = self.board.is_in_check(is_white)
+
+        # Null-move pruning: if passing still leaves us at or above beta, a real
+        # move surely would too. `null_ok` is False straight after a pass -- a
+        # null move or a stalemate pass -- so the same side never passes twice
+        # in a row and the search cannot skip through the whole tree.
+        if (
+            null_ok
+            and self.null_move
+            and not in_check
+            and depth >= NULL_MOVE_MIN_DEPTH
+            and beta < MATE_SCORE
+            and _has_pieces(self.board, is_white)
+            and evaluate(self.board, is_white) >= beta
+        ):
+            score = -await self.negamax(
+                depth - 1 - NULL_MOVE_REDUCTION,
+                not is_white,
+                -beta,
+                -beta + 1,
+                ply + 1,
+                null_ok=False,
+            )
+            if score >= beta:
+                # Never trust a mate found after passing; the pass was not real.
+                return beta
 
         moves = self.board.legal_moves_for(is_white)
         if not moves:
-            if self.board.is_in_check(is_white):
-                return -MATE_SCORE - depth  # prefer mates that arrive sooner
+            if in_check:
+                return -MATE_SCORE - (MAX_PLY - ply)  # sooner mates score higher
+            if not null_ok:
+                # Reached by a pass and stuck again: passing back would just
+                # hand the same side a second move, so stop and judge it here.
+                return evaluate(self.board, is_white)
             # Chess 2 quirk: stalemate is not a draw, the opponent simply moves
-            # again. Treat it as a bad but survivable position.
-            return -50
+            # again. That is a forced pass, so search it as one.
+            return -await self.negamax(
+                depth - 1, not is_white, -beta, -alpha, ply + 1, null_ok=False
+            )
 
         moves.sort(key=lambda m: _move_order_key(self.board, m))
+        if hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
 
+        original_alpha = alpha
         best = -MATE_SCORE * 2
-        for start, end in moves:
-            snap = self.board.snapshot()
-            self.board.apply_move(start, end)
-            score = -await self.negamax(depth - 1, not is_white, -beta, -alpha)
-            self.board.restore(snap)
+        best_move = moves[0]
+        for i, move in enumerate(moves):
+            reduce = (
+                self.lmr
+                and i >= LMR_MIN_MOVE
+                and depth >= LMR_MIN_DEPTH
+                and not in_check
+                and not _is_tactical(self.board, move)
+            )
+            undo = self.board.apply_move(*move)
+            # Checks are forcing, so they are searched in full like captures.
+            if reduce and self.board.is_in_check(not is_white):
+                reduce = False
+            reduction = (1 + (i >= LMR_DEEP_MOVE and depth >= 5)) if reduce else 0
+
+            if i == 0 or not self.pvs:
+                # Without PVS every move gets the full window; a reduced one is
+                # searched again at full depth if it raises alpha.
+                score = -await self.negamax(
+                    depth - 1 - reduction, not is_white, -beta, -alpha, ply + 1
+                )
+                if reduce and score > alpha:
+                    score = -await self.negamax(
+                        depth - 1, not is_white, -beta, -alpha, ply + 1
+                    )
+            else:
+                # Principal variation search: with captures ordered first, the
+                # first move is usually the best, so the rest only have to be
+                # shown to be no better -- which a null window proves cheaply.
+                # The rare move that beats it is searched again properly.
+                score = -await self.negamax(
+                    depth - 1 - reduction, not is_white, -alpha - 1, -alpha, ply + 1
+                )
+                if reduce and score > alpha:
+                    # The reduced search thinks this late move is good; check
+                    # at full depth before believing it.
+                    score = -await self.negamax(
+                        depth - 1, not is_white, -alpha - 1, -alpha, ply + 1
+                    )
+                if alpha < score < beta:
+                    score = -await self.negamax(
+                        depth - 1, not is_white, -beta, -alpha, ply + 1
+                    )
+            self.board.undo_move(undo)
 
             if score > best:
                 best = score
+                best_move = move
             if best > alpha:
                 alpha = best
             if alpha >= beta:
+                stats.cutoffs += 1
+                if i == 0:
+                    stats.first_move_cutoffs += 1
                 break
+
+        if best >= beta:
+            bound = LOWER
+        elif best > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.table.store(key, depth, bound, _score_to_table(best, ply), best_move)
         return best
 
-    async def best_move(self, depth: int, is_white: bool) -> Optional[Move]:
-        moves = self.board.legal_moves_for(is_white)
-        if not moves:
-            return None
+    async def quiesce(self, is_white: bool, alpha: int, beta: int, ply: int = 0) -> int:
+        """Play out captures until the position is quiet, then evaluate.
 
-        moves.sort(key=lambda m: _move_order_key(self.board, m))
+        Stops the search from scoring a position in the middle of an exchange,
+        e.g. counting a queen as won when it is about to be taken back. The
+        side to move may always stand pat instead of capturing. Captures that
+        lose material on the exchange are skipped: standing pat is at least as
+        good, and there are a lot of them.
+        """
+        await self._maybe_yield()
+        self.stats.qnodes += 1
+        if ply > self.stats.max_depth:
+            self.stats.max_depth = ply
+
+        stand_pat = evaluate(self.board, is_white)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        captures = []
+        for move in self.board.legal_moves_for(is_white, captures_only=True):
+            key = _move_order_key(self.board, move)
+            if key < 0:  # does not lose material on the exchange
+                captures.append((key, move))
+        captures.sort()
+
+        best = stand_pat
+        for _, move in captures:
+            undo = self.board.apply_move(*move)
+            score = -await self.quiesce(not is_white, -beta, -alpha, ply + 1)
+            self.board.undo_move(undo)
+            if score > best:
+                best = score
+            if best > alpha:
+                alpha = best
+            if alpha >= beta:
+                break
+        return best
 
-        alpha = -MATE_SCORE * 2
+    async def _search_root(
+        self, moves: List[Move], depth: int, is_white: bool, alpha: int, beta: int
+    ) -> Tuple[int, List[Move], Dict[Move, int]]:
+        """Search every root move inside (alpha, beta).
+
+        Returns the best score, every move that reaches it, and a score per
+        move for ordering the next iteration. Scores outside the window are
+        only bounds.
+        """
+        best = -MATE_SCORE * 2
         best_moves: List[Move] = []
-        for start, end in moves:
-            snap = self.board.snapshot()
-            self.board.apply_move(start, end)
-            score = -await self.negamax(depth - 1, not is_white, -MATE_SCORE * 2, -alpha)
-            self.board.restore(snap)
-
-            if not best_moves or score > alpha:
-                alpha = score
+        scores: Dict[Move, int] = {}
+        for i, (start, end) in enumerate(moves):
+            undo = self.board.apply_move(start, end)
+            if i == 0 or not self.pvs:
+                score = -await self.negamax(depth - 1, not is_white, -beta, -alpha)
+            else:
+                # The null window sits just below the best score rather than on
+                # it, so a move that merely equals it still fails high and gets
+                # an exact score: ties are kept and picked between at random.
+                floor = max(alpha, best - 1)
+                score = -await self.negamax(depth - 1, not is_white, -floor - 1, -floor)
+                if floor < score < beta:
+                    score = -await self.negamax(depth - 1, not is_white, -beta, -floor)
+            self.board.undo_move(undo)
+
+            scores[(start, end)] = score
+            if score > best:
+                best = score
                 best_moves = [(start, end)]
-            elif score == alpha:
+            elif score == best:
                 best_moves.append((start, end))
+            if best >= beta:
+                break
+        return best, best_moves, scores
+
+    async def best_move(
+        self, depth: int, is_white: bool, moves: Optional[List[Move]] = None
+    ) -> Optional[Move]:
+        """Best move for `is_white`, searching at most `depth` plies.
+
+        `moves` limits the search to some of the root moves, e.g. to share
+        them out between processes; by default every legal move is tried.
+        """
+        every_move = moves is None
+        if moves is None:
+            moves = self.board.legal_moves_for(is_white)
+        else:
+            moves = list(moves)
+        if not moves:
+            return None
+
+        # Only a search of every root move may be settled by the tables: a
+        # share of them has to be searched for the caller to compare.
+        if self.tablebases.available and every_move:
+            found = self.tablebases.best_move(self.board, is_white)
+            if found is not None:
+                move, value = found
+                self.stats.tb_hits += 1
+                self._report()
+                if self.on_iteration is not None:
+                    self.on_iteration(1, _tablebase_score(value, 0), [move])
+                return move
+
+        moves.sort(key=lambda m: _move_order_key(self.board, m))
 
+        # Iterative deepening: each shallower pass orders the root moves for
+        # the next one and tells it roughly what score to expect, so the deeper
+        # pass can start from a narrow aspiration window instead of the full
+        # range. It is also what makes a time limit safe: when the clock runs
+        # out, the last pass that finished still has an answer.
+        best_moves: List[Move] = moves[:1]
+        score = 0
+        snap = self.board.snapshot()
+        for iteration in range(1, depth + 1):
+            iteration_started = time.perf_counter()
+            iteration_nodes = self.nodes
+            if iteration == 1 or not self.aspiration or abs(score) >= MATE_SCORE:
+                alpha, beta = -MATE_SCORE * 2, MATE_SCORE * 2
+                delta = None
+            else:
+                delta = ASPIRATION_WINDOW
+                alpha, beta = score - delta, score + delta
+
+            try:
+                while True:
+                    score, found, scores = await self._search_root(
+                        moves, iteration, is_white, alpha, beta
+                    )
+                    if alpha < score < beta:
+                        break
+                    # Outside the window the score is only a bound, so search
+                    # again with a wider one on the side that failed. Widening
+                    # gradually rather than jumping straight to the full range
+                    # keeps most of the saving when the guess was merely a
+                    # little off.
+                    delta = delta * 2 if delta is not None else MATE_SCORE * 2
+                    if score <= alpha:
+                        alpha = max(score - delta, -MATE_SCORE * 2)
+                    else:
+                        beta = min(score + delta, MATE_SCORE * 2)
+            except SearchTimeout:
+                self.board.restore(snap)
+                break
+
+            best_moves = found
+            self.stats.depth = iteration
+            self.stats.iterations.append(
+                IterationStats(
+                    iteration,
+                    score,
+                    self.nodes - iteration_nodes,
+                    time.perf_counter() - iteration_started,
+                )
+            )
+            self._report()
+            if self.on_iteration is not None:
+                self.on_iteration(iteration, score, found)
+            moves.sort(key=lambda m: -scores.get(m, -MATE_SCORE * 2))
+
+        self._report()
         # Pick randomly between equally good moves so games are not identical.
         return random.choice(best_moves)
 
 
 async def choose_move(
-    board: ChessBoard, is_white: bool, difficulty: str = MEDIUM
+    board: ChessBoard,
+    is_white: bool,
+    difficulty: str = MEDIUM,
+    on_stats: Optional[Callable[[SearchStats], None]] = None,
 ) -> Optional[Move]:
     """Pick a move for `is_white`, yielding to the event loop while thinking."""
+    move, _ = await think(board, is_white, difficulty, on_stats)
+    return move
+
+
+async def think(
+    board: ChessBoard,
+    is_white: bool,
+    difficulty: str = MEDIUM,
+    on_stats: Optional[Callable[[SearchStats], None]] = None,
+) -> Tuple[Optional[Move], Optional[SearchStats]]:
+    """choose_move(), plus the statistics of the search behind the move.
+
+    The statistics are None when no search was needed: no legal moves, the
+    random Easy opponent, or a book move. `on_stats` sees them as they grow.
+    """
     moves = board.legal_moves_for(is_white)
     if not moves:
-        return None
+        return None, None
 
     depth = DIFFICULTY_DEPTH.get(difficulty, 2)
     if depth <= 0:
         # The original opponent, kept as the joke difficulty.
-        return random.choice(moves)
-
-    return await _Search(board).best_move(depth, is_white)
+        return random.choice(moves), None
+
+    # Near the start, play from the book instead of thinking: the start
+    # position is always the same, so searching it again finds nothing new.
+    opening_book = book.default_book() if difficulty in BOOK_DIFFICULTIES else None
+    if opening_book is not None:
+        move = opening_book.choose(board, is_white, moves)
+        if move is not None:
+            return move, None
+
+    budget = DIFFICULTY_TIME.get(difficulty)
+    deadline = time.perf_counter() + budget if budget is not None else None
+    search = _Search(board, table=_TABLE, deadline=deadline, on_stats=on_stats)
+    move = await search.best_move(depth, is_white)
+    logging.info(f"Search ({difficulty}): {search.stats.summary()}")
+    return move, search.stats
@@ -0,0 +1,197 @@
+"""Fixed-workload engine benchmark: a node-count signature, wall time and NPS.
+
+    python -m game.bench [--depth 4] [--json] [--baseline bench.json]
+
+Searches a built-in suite of Chess 2 positions to a fixed depth, each with an
+empty hash table and the same random seed, so the work done is identical on
+every run and every machine. The total node count is then a signature of the
+engine's behaviour: a change meant only to make things faster must leave it
+alone, and a change to the search or the evaluation will move it. Wall time
+and NPS are what the speed-ups are measured by.
+
+--json prints the results as JSON. Saved, that is a baseline for a later run:
+--baseline compares against one, reports a changed signature and any NPS drop
+beyond --threshold percent, and exits non-zero for either.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+import profiling
+from core.fen import START_FEN, board_from_fen, board_to_fen
+from game import ai, uci
+
+DEFAULT_DEPTH = 4
+DEFAULT_HASH_MB = 16
+DEFAULT_SEED = 2
+# NPS drop, in percent of the baseline, reported as a regression. Timings on a
+# shared machine wander by a few percent from run to run.
+DEFAULT_THRESHOLD = 5.0
+
+# Openings, middlegames and endings, picked to cover what is special about
+# Chess 2: spies about to convert, knights with their extra jumps, a position
+# one stalemate pass from mate, and one settled by the tablebases. Changing
+# this list changes the signature, so add to it only with a new baseline.
+POSITIONS = [
+    START_FEN,
+    "rnbqkbnr/ppp1ppps/7p/3p4/4P3/7P/PPPP1PPS/RNBQKBNR w KQkq - 0 2",
+    "rnbqkb1r/ppppppps/5n1p/8/3P4/7P/PPP1PPPS/RNBQKBNR w KQkq - 1 2",
+    "rnbqkb2/p1pnpp1r/2p4p/3pp3/P4P2/4P2P/1PP3PS/RNBQK1NR b KQq - 0 8",
+    "rnbqkb2/2p1p1r1/2p1p3/3p2p1/Pp6/2PnP2P/5QPS/RNB1K1NR w KQq - 0 15",
+    "r1bqkb1r/pQppp1ps/1n5p/4Pp2/6P1/1P2P2P/1P1KP2S/nNB2BNR b kq - 0 8",
+    "r2qkb1r/4p2s/1p3p1p/2pnpb2/6P1/1PQPPN2/1P1K3S/nNB2B1R w kq - 0 15",
+    "rnbqk1nr/1ppp1p1s/7p/3N2p1/1p1PP1P1/6pP/PPPP3S/R1BQKB1R w KQkq - 0 8",
+    "rn1q2nr/2p2k1s/2pp3p/8/1N1PP3/5Q2/PPPP2pR/R1B1K3 b Q - 0 16",
+    "r1bqkbnr/ppn2pps/3p3p/1B2P3/4P1P1/2N4P/PP3P1S/R1BQK1NR b KQkq - 0 9",
+    "r1bk2nr/1p5s/1p2pp1p/2n1P3/PbB2PPP/2N2N2/1P5S/R1B1K2R w KQ - 0 16",
+    "8/5pk1/6p1/8/3R4/6P1/5PK1/3r4 w - - 0 40",
+    "8/5k1s/7p/8/8/2Q4P/6KS/8 w - - 0 30",
+    "7k/8/8/6Q1/8/P7/8/K7 w - - 0 50",
+    "8/8/3k4/8/8/4N3/8/4K3 w - - 0 60",
+]
+
+
+def run(
+    depth: int = DEFAULT_DEPTH,
+    hash_mb: int = DEFAULT_HASH_MB,
+    seed: int = DEFAULT_SEED,
+    positions: Optional[List[str]] = None,
+) -> dict:
+    """Search every position and return the results, signature included."""
+    results = []
+    started = time.perf_counter()
+    for fen in positions or POSITIONS:
+        board, is_white = board_from_fen(fen)
+        # A fresh table and seed per position, so each search is the same
+        # whatever ran before it.
+        random.seed(seed)
+        search = ai._Search(board, table=ai.TranspositionTable(hash_mb))
+        position_started = time.perf_counter()
+        move = asyncio.run(search.best_move(depth, is_white))
+        seconds = time.perf_counter() - position_started
+        results.append(
+            {
+                "fen": fen,
+                "nodes": search.nodes,
+                "seconds": round(seconds, 4),
+                "move": uci.format_move(board, move) if move else None,
+            }
+        )
+    seconds = time.perf_counter() - started
+
+    nodes = sum(result["nodes"] for result in results)
+    return {
+        "depth": depth,
+        "hash_mb": hash_mb,
+        "seed": seed,
+        "signature": nodes,
+        "nodes": nodes,
+        "seconds": round(seconds, 3),
+        "nps": int(nodes / seconds) if seconds > 0 else 0,
+        "positions": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """What got worse since the baseline, as lines of text; empty if nothing."""
+    problems = []
+    settings = ("depth", "hash_mb", "seed")
+    if any(report[key] != baseline.get(key) for key in settings):
+        return [
+            "Baseline was run with different settings: "
+            + ", ".join(f"{key} {baseline.get(key)}" for key in settings)
+        ]
+
+    if report["signature"] != baseline["signature"]:
+        problems.append(
+            f"Signature changed: {baseline['signature']} -> {report['signature']}"
+        )
+        before: Dict[str, dict] = {p["fen"]: p for p in baseline["positions"]}
+        for position in report["positions"]:
+            old = before.get(position["fen"])
+            if old is not None and old["nodes"] != position["nodes"]:
+                problems.append(
+                    f"  {position['fen']}: {old['nodes']} -> {position['nodes']}"
+                    f" nodes, best move {old['move']} -> {position['move']}"
+                )
+
+    if baseline["nps"]:
+        change = (report["nps"] - baseline["nps"]) / baseline["nps"] * 100
+        if change < -threshold:
+            problems.append(
+                f"NPS regressed {-change:.1f}%: {baseline['nps']} -> {report['nps']}"
+            )
+    return problems
+
+
+def _print_report(report: dict):
+    for i, position in enumerate(report["positions"], 1):
+        print(
+            f"{i:>2} {position['nodes']:>9} nodes {position['seconds']:>8.3f}s"
+            f"  {position['move'] or '(none)':<6} {position['fen']}"
+        )
+    print(f"Depth {report['depth']}, {len(report['positions'])} positions")
+    print(f"Nodes searched: {report['nodes']}")
+    print(f"Total time (s): {report['seconds']}")
+    print(f"Nodes/second  : {report['nps']}")
+    print(f"Signature     : {report['signature']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Chess 2 engine")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    parser.add_argument("--hash", type=int, default=DEFAULT_HASH_MB, dest="hash_mb")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument(
+        "--fen", action="append", help="search this position instead of the suite"
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="NPS drop in percent reported as a regression",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="time the hot paths too (see profiling); slows the search down",
+    )
+    args = parser.parse_args()
+    profiling.configure(args.profile)
+
+    for fen in args.fen or ():
+        try:
+            board, is_white = board_from_fen(fen)
+        except ValueError as e:
+            parser.error(f"Bad FEN: {e}")
+        if not board.legal_moves_for(is_white):
+            parser.error(f"No legal moves in {board_to_fen(board, is_white)}")
+
+    report = run(args.depth, args.hash_mb, args.seed, args.fen)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.threshold)
+        for line in problems:
+            print(line, file=sys.stderr)
+        if problems:
+            sys.exit(1)
+        print("No change in behaviour or speed beyond the threshold", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
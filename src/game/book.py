@@ -0,0 +1,133 @@
+"""Opening book: moves worth playing from positions near the start.
+
+The book is a flat binary file of fixed-size entries sorted by position key,
+so it is read through mmap and searched by bisection: nothing is parsed when
+it is opened, a lookup touches O(log n) entries, and every process that opens
+the same file shares one copy in the page cache.
+
+Layout, little-endian:
+
+    header  magic "C2BK", u16 version, u16 entry size, u32 entry count
+    entry   u64 position key, u16 move, u16 weight
+
+The key is ChessBoard.zobrist_key(), which is seeded and so the same in every
+process and every run. A move packs its squares as (from << 6) | to, squares
+numbered row * 8 + col; book moves never promote, so no piece is stored. A
+position has one entry per book move, and is played in proportion to weight.
+
+Books are made by game.bookgen.
+"""
+
+import logging
+import random
+import struct
+from typing import Iterable, List, Optional, Tuple
+
+from core.board import ChessBoard
+from utils import _resource_path, map_readonly
+
+Move = Tuple[Tuple[int, int], Tuple[int, int]]
+
+MAGIC = b"C2BK"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHI")
+_ENTRY = struct.Struct("<QHH")
+
+BOOK_PATH = "assets/book.bin"
+
+
+def encode_move(move: Move) -> int:
+    (start_row, start_col), (end_row, end_col) = move
+    return (start_row * 8 + start_col) << 6 | (end_row * 8 + end_col)
+
+
+def decode_move(code: int) -> Move:
+    start, end = code >> 6, code & 63
+    return (start // 8, start % 8), (end // 8, end % 8)
+
+
+def write_book(path: str, entries: Iterable[Tuple[int, Move, int]]):
+    """Write (position key, move, weight) entries as a book file."""
+    packed = sorted(
+        (key, encode_move(move), max(1, min(weight, 0xFFFF)))
+        for key, move, weight in entries
+    )
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, _ENTRY.size, len(packed)))
+        for entry in packed:
+            f.write(_ENTRY.pack(*entry))
+
+
+class OpeningBook:
+    def __init__(self, path: str):
+        self._data = map_readonly(path)
+        magic, version, entry_size, self.size = _HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION or entry_size != _ENTRY.size:
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+        if len(self._data) < _HEADER.size + self.size * _ENTRY.size:
+            raise ValueError(f"{path} is truncated")
+
+    def close(self):
+        if not isinstance(self._data, bytes):
+            self._data.close()
+
+    def _key_at(self, index: int) -> int:
+        return _ENTRY.unpack_from(self._data, _HEADER.size + index * _ENTRY.size)[0]
+
+    def moves(self, key: int) -> List[Tuple[Move, int]]:
+        """(move, weight) for every book move of the position with this key."""
+        # Bisect for the first entry with the key; its moves follow it.
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        for index in range(low, self.size):
+            entry_key, code, weight = _ENTRY.unpack_from(
+                self._data, _HEADER.size + index * _ENTRY.size
+            )
+            if entry_key != key:
+                break
+            found.append((decode_move(code), weight))
+        return found
+
+    def choose(
+        self,
+        board: ChessBoard,
+        is_white: bool,
+        legal: List[Move],
+        rng: random.Random = random,
+    ) -> Optional[Move]:
+        """A book move for the position, picked by weight, or None if out of book.
+
+        Only moves in `legal` are considered, so a stale or foreign book can
+        never make an illegal move.
+        """
+        entries = [
+            (move, weight)
+            for move, weight in self.moves(board.zobrist_key(is_white))
+            if move in legal
+        ]
+        if not entries:
+            return None
+        moves, weights = zip(*entries)
+        return rng.choices(moves, weights)[0]
+
+
+_BOOK: Optional[OpeningBook] = None
+_BOOK_LOADED = False
+
+
+def default_book() -> Optional[OpeningBook]:
+    """The book shipped with the game, opened on first use; None if missing."""
+    global _BOOK, _BOOK_LOADED
+    if not _BOOK_LOADED:
+        _BOOK_LOADED = True
+        try:
+            _BOOK = OpeningBook(_resource_path(BOOK_PATH))
+        except (OSError, ValueError, struct.error) as e:
+            logging.info(f"No opening book, searching from the first move: {e}")
+    return _BOOK
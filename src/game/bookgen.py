@@ -0,0 +1,154 @@
+"""Build the opening book by searching the positions near the start offline.
+
+    python -m game.bookgen --plies 6 --depth 6 --out assets/book.bin
+
+Starting from the Chess 2 start position, every root move of a position is
+searched to `depth`, and those that come within `margin` centipawns of the
+best get an exact score. Those moves go in the book, and the best `width` of
+them are followed to build the next ply. The search's random tie-breaking is
+what gives a game variety, so a small margin keeps that while leaving out
+moves that are clearly worse; the weights fall steeply with every centipawn
+given away, so even those inside it come up only now and then.
+
+Positions at one ply are independent, so they are searched in parallel, one
+process per core by default.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from core.board import ChessBoard
+from core.fen import board_from_fen, board_to_fen
+from game import ai, book
+
+# Weight of the best move in a position. A move's weight halves for every
+# HALVING centipawns it scores below the best.
+TOP_WEIGHT = 1024
+HALVING = 1
+
+# Per-process search table of the worker processes.
+_WORKER_TABLE = None
+
+
+def _init_worker(hash_mb: int):
+    global _WORKER_TABLE
+    _WORKER_TABLE = ai.TranspositionTable(hash_mb)
+
+
+def score_moves(fen: str, depth: int, margin: int) -> List[Tuple[ai.Move, int]]:
+    """Score of every legal move in the position, best first.
+
+    Scores are exact for the moves within `margin` centipawns of the best.
+    The rest are searched against that margin alone, so their scores are only
+    upper bounds: enough to know they stay out of the book, and much cheaper.
+    The moves are searched one ply deeper at a time, best first, so the best
+    one usually comes first and sets the margin for the others.
+    """
+    board, is_white = board_from_fen(fen)
+    search = ai._Search(board, table=_WORKER_TABLE)
+
+    async def run(depth: int, moves: List[ai.Move]) -> List[Tuple[ai.Move, int]]:
+        scored = []
+        best = -ai.MATE_SCORE * 2
+        for move in moves:
+            undo = board.apply_move(*move)
+            alpha = max(best - margin - 1, -ai.MATE_SCORE * 2)
+            score = -await search.negamax(
+                depth - 1, not is_white, -ai.MATE_SCORE * 2, -alpha
+            )
+            board.undo_move(undo)
+            scored.append((move, score))
+            best = max(best, score)
+        return sorted(scored, key=lambda pair: -pair[1])
+
+    moves = board.legal_moves_for(is_white)
+    for iteration in range(1, depth + 1):
+        scored = asyncio.run(run(iteration, moves))
+        moves = [move for move, _ in scored]
+    return scored
+
+
+def weight(loss: int) -> int:
+    """Book weight of a move scoring `loss` centipawns below the best."""
+    return max(1, round(TOP_WEIGHT * 2 ** (-loss / HALVING)))
+
+
+def build(
+    plies: int, depth: int, margin: int, width: int, workers: int, hash_mb: int = 64
+) -> List[Tuple[int, ai.Move, int]]:
+    """Book entries (position key, move, weight) for the first `plies` plies."""
+    board = ChessBoard()
+    frontier = [board_to_fen(board, True)]
+    seen = {board.zobrist_key(True)}
+    entries: List[Tuple[int, ai.Move, int]] = []
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        workers, mp_context=context, initializer=_init_worker, initargs=(hash_mb,)
+    ) as pool:
+        for ply in range(plies):
+            started = time.perf_counter()
+            scores = pool.map(
+                score_moves,
+                frontier,
+                [depth] * len(frontier),
+                [margin] * len(frontier),
+            )
+            next_frontier: List[str] = []
+            for fen, scored in zip(frontier, scores):
+                if not scored:
+                    continue
+                board, is_white = board_from_fen(fen)
+                key = board.zobrist_key(is_white)
+                best = scored[0][1]
+                chosen = [(m, s) for m, s in scored if best - s <= margin]
+                for move, score in chosen:
+                    entries.append((key, move, weight(best - score)))
+                for move, _ in chosen[:width]:
+                    undo = board.apply_move(*move)
+                    child_key = board.zobrist_key(not is_white)
+                    if child_key not in seen and board.legal_moves_for(not is_white):
+                        seen.add(child_key)
+                        next_frontier.append(board_to_fen(board, not is_white))
+                    board.undo_move(undo)
+            logging.info(
+                f"Ply {ply + 1}: {len(frontier)} positions searched in"
+                f" {time.perf_counter() - started:.1f}s"
+            )
+            frontier = next_frontier
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Chess 2 opening book")
+    parser.add_argument("--plies", type=int, default=6, help="book depth in plies")
+    parser.add_argument("--depth", type=int, default=6, help="search depth per move")
+    parser.add_argument(
+        "--margin", type=int, default=4, help="centipawns a book move may lose"
+    )
+    parser.add_argument(
+        "--width", type=int, default=2, help="book moves followed per position"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", default=book.BOOK_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    entries = build(args.plies, args.depth, args.margin, args.width, args.workers)
+    book.write_book(args.out, entries)
+    positions = {key for key, _, _ in entries}
+    logging.info(
+        f"Wrote {len(entries)} moves for {len(positions)} positions to {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
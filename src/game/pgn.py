@@ -0,0 +1,452 @@
+"""Games as text: a PGN-style notation for Chess 2, read and written.
+
+    python -m game.pgn import games.pgn games.c2ga
+    python -m game.pgn export games.c2ga games.pgn
+
+A game is a block of tag pairs and then its moves, ending with the result:
+
+    [Event "Casual game"]
+    [Date "2026.10.19"]
+    [White "?"]
+    [Black "Computer"]
+    [Result "0-1"]
+    [Difficulty "hard"]
+
+    1. f2-f3 e7-e6 2. g2-g4 Bf8-d6 3. h3-h4 Qd8xh4+ 4. Ng1-g3 Qh4xg3# 0-1
+
+Moves are written as the game's move list shows them (GameState._notate):
+the piece letter, S for the spy and none for a pawn, then the squares it
+moves from and to, joined by '-' for a move, 'x' for a capture and '~' for a
+spy's conversion, with '=Q' and so on for a promotion and '+' or '#' for
+check and mate. Results are 1-0, 0-1, 1/2-1/2 and * for a game that did not
+finish. A game set up from another position has a FEN tag, with S/s for the
+spy. A side may move twice in a row, after its opponent was stalemated; the
+move numbers are for reading and ignored when read.
+
+Files are read a line at a time, game by game (read_games), so a file of any
+size is never held in memory at once. Every move names both its squares, so
+reading one needs no search through the pieces that could have made it: it
+is checked and played on a single ChessBoard, against the same rules as in
+the game. Comments ({...} and ;...), variations in brackets and annotation
+glyphs such as $1 or !? are skipped, so games from other tools can be read.
+Threefold repetition is not looked for: a game played on past one reads as
+written.
+"""
+
+import argparse
+import calendar
+import logging
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.fen import START_FEN, board_from_fen
+from core.piece import PieceType
+from game.record import DIFFICULTIES, ArchiveWriter, GameArchive, GameRecord, Move
+from game.state import PIECE_LETTERS, square_name
+
+RESULT_TOKENS = {
+    "1-0": "white_wins",
+    "0-1": "black_wins",
+    "1/2-1/2": "draw",
+    "*": None,
+}
+_RESULT_TEXT = {result: token for token, result in RESULT_TOKENS.items()}
+# The tags every game has, in the order PGN writes them.
+ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+LINE_WIDTH = 79
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]\s*$')
+_TOKEN = re.compile(r"\{|;|\(|\)|[^\s{};()]+")
+_MOVE = re.compile(
+    r"([KQRBNS]?)([a-h][1-8])([-x~]?)([a-h][1-8])(?:=([QRBN]))?[+#]?[!?]*$"
+)
+_MOVE_NUMBER = re.compile(r"\d+\.+$")
+_SQUARES = {
+    f"{file}{rank}": (8 - rank, col)
+    for col, file in enumerate("abcdefgh")
+    for rank in range(1, 9)
+}
+_LETTER_TYPES = {letter: piece_type for piece_type, letter in PIECE_LETTERS.items()}
+
+
+@dataclass(frozen=True)
+class PgnGame:
+    """A game read from text: its tags as written, and its moves as a record."""
+
+    tags: Dict[str, str]
+    record: GameRecord
+
+
+def _date(text: str) -> int:
+    """Seconds since the epoch for a PGN date, at midnight UTC; 0 if unknown."""
+    try:
+        return calendar.timegm(time.strptime(text, "%Y.%m.%d"))
+    except ValueError:
+        return 0
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _unquote(value: str) -> str:
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def _movetext(line: str, in_comment: bool) -> Tuple[List[str], bool]:
+    """The tokens of a line of moves, comments left out, and whether a {...}
+    comment is still open at its end."""
+    tokens = []
+    position = 0
+    while True:
+        if in_comment:
+            close = line.find("}", position)
+            if close < 0:
+                return tokens, True
+            position, in_comment = close + 1, False
+        match = _TOKEN.search(line, position)
+        if match is None or match.group() == ";":
+            return tokens, False
+        if match.group() == "{":
+            in_comment = True
+        else:
+            tokens.append(match.group())
+        position = match.end()
+
+
+class _Position:
+    """A game's board as it is read or written, and whose move it is."""
+
+    def __init__(self, fen: str):
+        self.board, self.white_to_move = board_from_fen(fen)
+
+    def play(
+        self,
+        start: Tuple[int, int],
+        end: Tuple[int, int],
+        promotion: PieceType = PieceType.QUEEN,
+    ) -> str:
+        """Check a move and play it; its notation, but for check and mate.
+
+        As in GameState.make_move, `promotion` only counts for a pawn reaching
+        the end. Raises ValueError if the move cannot be played.
+        """
+        board = self.board
+        piece = board.board[start[0]][start[1]]
+        if piece is None:
+            raise ValueError(f"no piece on {square_name(start)}")
+        if piece.is_white != self.white_to_move:
+            # Only when the side to move is stalemated does the turn pass back,
+            # so that is the one time this costs a search for legal moves.
+            stuck = self.white_to_move
+            if board.has_legal_moves(stuck) or board.is_in_check(stuck):
+                raise ValueError("not that side's move")
+        if end not in board.get_moves(start):
+            raise ValueError("illegal move")
+        # Tested as GameState.get_legal_moves tests it: the piece simply
+        # standing on the square must not leave its king in check.
+        target = board.board[end[0]][end[1]]
+        board.board[end[0]][end[1]] = piece
+        board.board[start[0]][start[1]] = None
+        exposed = board.is_in_check(piece.is_white)
+        board.board[start[0]][start[1]] = piece
+        board.board[end[0]][end[1]] = target
+        if exposed:
+            raise ValueError("leaves the king in check")
+
+        if target is None or target.is_white == piece.is_white:
+            separator = "-"
+        else:
+            separator = "~" if piece.type == PieceType.SPY else "x"
+        text = (
+            f"{PIECE_LETTERS[piece.type]}{square_name(start)}"
+            f"{separator}{square_name(end)}"
+        )
+        if piece.type == PieceType.PAWN and end[0] in (0, 7):
+            text += f"={PIECE_LETTERS[promotion]}"
+        board.apply_move(start, end, promotion)
+        self.white_to_move = not piece.is_white
+        return text
+
+
+class _Game:
+    """One game while it is read: its tags, and its moves played so far."""
+
+    def __init__(self, number: int, line: int):
+        self.number = number
+        self.line = line
+        self.tags: Dict[str, str] = {}
+        self.moves: List[Tuple[Move, PieceType]] = []
+        self.result_token: Optional[str] = None
+        self.error: Optional[str] = None
+        self.position: Optional[_Position] = None
+
+    def _start(self):
+        # Set up on the first move, once the tags with any FEN are all read.
+        if self.position is None:
+            self.position = _Position(self.tags.get("FEN", START_FEN))
+
+    def play(self, token: str):
+        """Check a move token against the position and play it.
+
+        Raises ValueError if it is not a move that can be played there.
+        """
+        self._start()
+        match = _MOVE.match(token)
+        if match is None:
+            raise ValueError(f"not a move: {token!r}")
+        letter, start_name, separator, end_name, promotion = match.groups()
+        start, end = _SQUARES[start_name], _SQUARES[end_name]
+        piece = self.position.board.board[start[0]][start[1]]
+        if piece is not None and PIECE_LETTERS[piece.type] != letter:
+            raise ValueError(f"{token}: no such piece on {start_name}")
+        # A promotion left unsaid is to a queen, as in the game.
+        chosen = _LETTER_TYPES[promotion] if promotion else PieceType.QUEEN
+        try:
+            text = self.position.play(start, end, chosen)
+        except ValueError as e:
+            raise ValueError(f"{token}: {e}") from None
+        written = text[len(letter) + 2]
+        if separator and separator != written:
+            raise ValueError(f"{token}: should be written with {written!r}")
+        if promotion and "=" not in text:
+            raise ValueError(f"{token}: only a pawn reaching the end promotes")
+        self.moves.append(((start, end), chosen))
+
+    def finish(self) -> Tuple[Optional[PgnGame], Optional[str]]:
+        where = f"game {self.number} (line {self.line})"
+        if self.error is None:
+            try:
+                self._start()
+            except ValueError as e:
+                self.error = str(e)
+        if self.error is not None:
+            return None, f"{where}: {self.error}"
+        token = self.result_token or self.tags.get("Result", "*")
+        difficulty = self.tags.get("Difficulty")
+        record = GameRecord(
+            tuple(self.moves),
+            RESULT_TOKENS.get(token),
+            difficulty if difficulty in DIFFICULTIES else None,
+            _date(self.tags.get("Date", "")),
+            self.tags.get("FEN", START_FEN),
+        )
+        return PgnGame(self.tags, record), None
+
+
+def read_games(
+    lines: Iterable[str],
+) -> Iterator[Tuple[Optional[PgnGame], Optional[str]]]:
+    """(game, None) for each game in the lines, (None, error) for a bad one.
+
+    Read lazily, a game at a time. The rest of a bad game is skipped, up to
+    its result or the next game's tags, and reading carries on from there.
+    """
+    game: Optional[_Game] = None
+    games = 0
+    in_comment = False
+    depth = 0  # of variations, whose moves are not the game's
+
+    for number, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if not in_comment and not depth and stripped.startswith("["):
+            if game is not None and (game.moves or game.error):
+                # The last game's moves ended without a result.
+                yield game.finish()
+                game = None
+            if game is None:
+                games += 1
+                game = _Game(games, number)
+            match = _TAG.match(stripped)
+            if match is None:
+                game.error = game.error or f"bad tag pair {stripped!r}"
+            else:
+                name, value = match.groups()
+                game.tags[name] = _unquote(value)
+            continue
+        if stripped.startswith("%"):
+            continue  # an escaped line, for other programs
+
+        tokens, in_comment = _movetext(line, in_comment)
+        for token in tokens:
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth = max(0, depth - 1)
+            elif depth or token[0] == "$" or _MOVE_NUMBER.match(token):
+                continue
+            else:
+                if game is None:
+                    games += 1
+                    game = _Game(games, number)
+                if token in RESULT_TOKENS:
+                    game.result_token = token
+                    yield game.finish()
+                    game = None
+                elif game.error is None:
+                    try:
+                        game.play(token)
+                    except ValueError as e:
+                        game.error = f"move {len(game.moves) + 1}: {e}"
+
+    if game is not None:
+        yield game.finish()
+
+
+def format_game(record: GameRecord, tags: Optional[Dict[str, str]] = None) -> str:
+    """A record as text, with `tags` added to (or overriding) its own.
+
+    The moves are notated as the game's move list notates them, and checked
+    as they are read: ValueError if one cannot be played.
+    """
+    header = {name: "?" for name in ROSTER}
+    header["Date"] = (
+        time.strftime("%Y.%m.%d", time.gmtime(record.date))
+        if record.date
+        else "????.??.??"
+    )
+    header["Result"] = _RESULT_TEXT[record.result]
+    if record.difficulty is not None:
+        header["Difficulty"] = record.difficulty
+    if record.fen != START_FEN:
+        header["SetUp"] = "1"
+        header["FEN"] = record.fen
+    header.update(tags or {})
+
+    position = _Position(record.fen)
+    fields = record.fen.split()
+    fullmove = int(fields[5]) if len(fields) > 5 else 1
+    words = []
+    last_white = None
+    for ply, ((start, end), promotion) in enumerate(record.moves, 1):
+        try:
+            text = position.play(start, end, promotion)
+        except ValueError as e:
+            raise ValueError(f"Move {ply} of the record: {e}") from None
+        white = not position.white_to_move
+        if position.board.is_in_check(position.white_to_move):
+            # The game ends at mate, so only the last move can have given it.
+            mate = ply == len(record.moves) and not position.board.has_legal_moves(
+                position.white_to_move
+            )
+            text += "#" if mate else "+"
+        # A number before each of white's moves, and before black's when it
+        # moves first or again after white was stalemated. Kept with its move,
+        # so a line never ends on a number.
+        if white:
+            if last_white:
+                fullmove += 1  # again, after black was stalemated
+            words.append(f"{fullmove}. {text}")
+        elif last_white is not True:
+            words.append(f"{fullmove}... {text}")
+        else:
+            words.append(text)
+        if not white:
+            fullmove += 1
+        last_white = white
+    words.append(_RESULT_TEXT[record.result])
+
+    lines = [f'[{name} "{_quote(value)}"]' for name, value in header.items()]
+    lines.append("")
+    line = ""
+    for word in words:
+        if line and len(line) + 1 + len(word) > LINE_WIDTH:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+class PgnWriter:
+    """Appends games to a text file, a blank line between each."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        # Games already in the file need a blank line after them too.
+        self._first = self._file.tell() == 0
+
+    def write(self, record: GameRecord, tags: Optional[Dict[str, str]] = None):
+        text = format_game(record, tags)
+        if not self._first:
+            self._file.write("\n")
+        self._file.write(text)
+        self._first = False
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert Chess 2 games between text and archives"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    read = commands.add_parser(
+        "import", help="append the games of a text file to an archive"
+    )
+    read.add_argument("input", help="games as text; '-' for stdin")
+    read.add_argument("archive", help="a game archive (see game.record)")
+    write = commands.add_parser(
+        "export", help="append the games of an archive to a text file"
+    )
+    write.add_argument("archive")
+    write.add_argument("output", help="'-' for stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    started = time.perf_counter()
+    games = errors = 0
+    if args.command == "import":
+        try:
+            lines = (
+                sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+            )
+        except OSError as e:
+            parser.error(f"Cannot read {args.input}: {e}")
+        with lines, ArchiveWriter(args.archive) as archive:
+            for game, error in read_games(lines):
+                if error is not None:
+                    logging.error(error)
+                    errors += 1
+                else:
+                    archive.append(game.record)
+                    games += 1
+    else:
+        with GameArchive(args.archive) as archive:
+            out = PgnWriter(args.output) if args.output != "-" else None
+            for number, record in enumerate(archive):
+                try:
+                    if out is None:
+                        sys.stdout.write(("\n" if games else "") + format_game(record))
+                    else:
+                        out.write(record)
+                except ValueError as e:
+                    logging.error(f"Game {number}: {e}")
+                    errors += 1
+                    continue
+                games += 1
+            if out is not None:
+                out.close()
+
+    seconds = time.perf_counter() - started
+    logging.info(f"{games} games converted in {seconds:.2f}s, {errors} skipped")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Game records: whole games in about two bytes a ply, and archives of them.
+
+A record is a short header followed by the moves, little-endian:
+
+    header  u8 result, u8 difficulty, u32 date, u16 plies, u8 FEN length
+    FEN     the starting position, ASCII; absent (length 0) for the usual one
+    moves   u16 per ply: book.encode_move(move) << 2 | promotion
+
+The result and difficulty are indexes into RESULTS and DIFFICULTIES, the date
+is seconds since the epoch (UTC), and the promotion an index into PROMOTIONS,
+0 -- a queen -- for a move that does not promote. A record holds only what is
+needed to play the game again through GameState (see GameState.to_record and
+GameState.from_record); everything else, the move list's notation included,
+follows from the moves.
+
+An archive is two files. The games, appended one record after another:
+
+    games.c2ga      magic "C2GA", u16 version, then records back to back
+
+and an index beside it, with where each game starts:
+
+    games.c2ga.idx  magic "C2GI", u16 version, then a u64 offset per game
+
+Both are only ever appended to, the index after its game, so a write cut
+short leaves at worst a game nobody points to. GameArchive maps both files
+(see utils.map_readonly), so opening an archive reads nothing, any game is
+found without reading those before it, and iterating over millions of them
+holds one at a time.
+"""
+
+import os
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.fen import START_FEN
+from core.piece import PieceType
+from game import book
+from utils import map_readonly
+
+Move = Tuple[Tuple[int, int], Tuple[int, int]]
+
+# What is stored is a position in these, so their order must never change.
+RESULTS = (None, "white_wins", "black_wins", "draw")
+DIFFICULTIES = (None, "easy", "medium", "hard")
+PROMOTIONS = (PieceType.QUEEN, PieceType.ROOK, PieceType.BISHOP, PieceType.KNIGHT)
+
+MAGIC = b"C2GA"
+INDEX_MAGIC = b"C2GI"
+VERSION = 1
+_FILE_HEADER = struct.Struct("<4sH")
+_RECORD_HEADER = struct.Struct("<BBIHB")
+_OFFSET = struct.Struct("<Q")
+
+# Every possible u16 move, decoded once when first needed, and the code of
+# every move without its promotion: coding a game is then a lookup a ply.
+_DECODED: Optional[List[Tuple[Move, PieceType]]] = None
+_ENCODED: Optional[Dict[Move, int]] = None
+
+
+def index_path(path: str) -> str:
+    return path + ".idx"
+
+
+@dataclass(frozen=True)
+class GameRecord:
+    """A game as played: its moves, as (move, promotion), and how it went."""
+
+    moves: Tuple[Tuple[Move, PieceType], ...] = ()
+    result: Optional[str] = None  # as GameState.game_result
+    difficulty: Optional[str] = None  # the computer's; None for a local game
+    date: int = 0
+    fen: str = START_FEN
+
+    def to_bytes(self) -> bytes:
+        """The record in the format above; ValueError for what it cannot hold."""
+        if self.result not in RESULTS or self.difficulty not in DIFFICULTIES:
+            raise ValueError(f"Cannot record {self.result!r}, {self.difficulty!r}")
+        if len(self.moves) > 0xFFFF:
+            raise ValueError(f"{len(self.moves)} plies is too long a game")
+        fen = b"" if self.fen == START_FEN else self.fen.encode("ascii")
+        if len(fen) > 0xFF:
+            raise ValueError(f"FEN too long: {self.fen!r}")
+        encoded = _encoded()
+        try:
+            codes = array(
+                "H",
+                [
+                    encoded[move] << 2 | PROMOTIONS.index(promotion)
+                    for move, promotion in self.moves
+                ],
+            )
+        except KeyError:
+            raise ValueError("Cannot record a move off the board") from None
+        except ValueError:
+            raise ValueError(
+                "Cannot record a promotion to anything but a queen, rook, bishop"
+                " or knight"
+            ) from None
+        if sys.byteorder == "big":
+            codes.byteswap()
+        return (
+            _RECORD_HEADER.pack(
+                RESULTS.index(self.result),
+                DIFFICULTIES.index(self.difficulty),
+                self.date,
+                len(codes),
+                len(fen),
+            )
+            + fen
+            + codes.tobytes()
+        )
+
+    @classmethod
+    def from_bytes(cls, data, offset: int = 0) -> "GameRecord":
+        """The record at `offset` in `data`; ValueError if it is not one."""
+        return _read(data, offset)[0]
+
+
+def _decoded() -> List[Tuple[Move, PieceType]]:
+    global _DECODED
+    if _DECODED is None:
+        _DECODED = [
+            (book.decode_move(code >> 2), PROMOTIONS[code & 3])
+            for code in range(1 << 14)
+        ]
+    return _DECODED
+
+
+def _encoded() -> Dict[Move, int]:
+    global _ENCODED
+    if _ENCODED is None:
+        _ENCODED = {book.decode_move(code): code for code in range(1 << 12)}
+    return _ENCODED
+
+
+def _read(data, offset: int) -> Tuple[GameRecord, int]:
+    """The record at `offset` in `data`, and the offset just past it."""
+    try:
+        result, difficulty, date, plies, fen_length = _RECORD_HEADER.unpack_from(
+            data, offset
+        )
+    except struct.error:
+        raise ValueError(f"No game record at {offset}") from None
+    start = offset + _RECORD_HEADER.size
+    end = start + fen_length + 2 * plies
+    if end > len(data) or result >= len(RESULTS) or difficulty >= len(DIFFICULTIES):
+        raise ValueError(f"Damaged game record at {offset}")
+    codes = array("H", data[start + fen_length : end])
+    if sys.byteorder == "big":
+        codes.byteswap()
+    if codes and max(codes) >> 14:
+        raise ValueError(f"Damaged game record at {offset}")
+    record = GameRecord(
+        tuple(map(_decoded().__getitem__, codes)),
+        RESULTS[result],
+        DIFFICULTIES[difficulty],
+        date,
+        bytes(data[start : start + fen_length]).decode("ascii") or START_FEN,
+    )
+    return record, end
+
+
+def _has_header(data, magic: bytes) -> bool:
+    return len(data) >= _FILE_HEADER.size and _FILE_HEADER.unpack_from(data, 0) == (
+        magic,
+        VERSION,
+    )
+
+
+class ArchiveWriter:
+    """Appends games to an archive, starting it if there is none."""
+
+    def __init__(self, path: str):
+        self.path = path
+        files = ((path, MAGIC), (index_path(path), INDEX_MAGIC))
+        for name, magic in files:
+            if os.path.exists(name) and os.path.getsize(name):
+                with open(name, "rb") as f:
+                    if not _has_header(f.read(_FILE_HEADER.size), magic):
+                        raise ValueError(
+                            f"{path} is not a version {VERSION} game archive"
+                        )
+        self._data, self._index = (open(name, "ab") for name, _ in files)
+        for f, (_, magic) in zip((self._data, self._index), files):
+            if f.seek(0, 2) == 0:
+                f.write(_FILE_HEADER.pack(magic, VERSION))
+
+    def append(self, record: GameRecord):
+        offset = self._data.tell()
+        self._data.write(record.to_bytes())
+        # The game before the index entry that points to it, so a reader
+        # never finds an entry whose game has not been written yet.
+        self._data.flush()
+        self._index.write(_OFFSET.pack(offset))
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameArchive:
+    """The games of an archive, read in place: archive[i], len() and iteration."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = map_readonly(path)
+        self._index = map_readonly(index_path(path))
+        for data, magic in ((self._data, MAGIC), (self._index, INDEX_MAGIC)):
+            if not _has_header(data, magic):
+                raise ValueError(f"{path} is not a version {VERSION} game archive")
+        # An entry cut short by an interrupted write is left out.
+        self.size = (len(self._index) - _FILE_HEADER.size) // _OFFSET.size
+
+    def close(self):
+        for data in (self._data, self._index):
+            if not isinstance(data, bytes):
+                data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def offset(self, number: int) -> int:
+        """Where game `number` starts in the archive."""
+        if number < 0:
+            number += self.size
+        if not 0 <= number < self.size:
+            raise IndexError(f"No game {number} in {self.path}")
+        return _OFFSET.unpack_from(
+            self._index, _FILE_HEADER.size + number * _OFFSET.size
+        )[0]
+
+    def __getitem__(self, number: int) -> GameRecord:
+        return _read(self._data, self.offset(number))[0]
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        for number in range(self.size):
+            yield self[number]
+
+
+def rebuild_index(path: str) -> int:
+    """Write a fresh index for the games in an archive; how many there are.
+
+    For an archive whose index was lost. Records say how long they are, so
+    the games are found by reading them one after another.
+    """
+    data = map_readonly(path)
+    try:
+        if not _has_header(data, MAGIC):
+            raise ValueError(f"{path} is not a version {VERSION} game archive")
+        games = 0
+        offset = _FILE_HEADER.size
+        with open(index_path(path), "wb") as f:
+            f.write(_FILE_HEADER.pack(INDEX_MAGIC, VERSION))
+            while offset < len(data):
+                try:
+                    _, end = _read(data, offset)
+                except ValueError:
+                    break  # a record cut short by an interrupted write
+                f.write(_OFFSET.pack(offset))
+                games += 1
+                offset = end
+        return games
+    finally:
+        if not isinstance(data, bytes):
+            data.close()
@@ -1,9 +1,12 @@
 import logging
+import time
 from collections import defaultdict
 from typing import Dict, List, Optional, Set, Tuple
 
 from core.board import ChessBoard
+from core.fen import board_from_fen, board_to_fen
 from core.piece import MATERIAL_VALUES, Piece, PieceType
+from game.record import GameRecord
 
 PIECE_LETTERS = {
     PieceType.KING: "K",
@@ -55,6 +58,11 @@ class GameState:
         # it looks like the other side simply moved twice.
         self.stalemate_skipped = False
         self.move_log: List[str] = []
+        # The moves behind move_log, as ((start, end), promotion), for game
+        # records. The promotion is a queen for moves that do not promote.
+        self.move_history: List[
+            Tuple[Tuple[Tuple[int, int], Tuple[int, int]], PieceType]
+        ] = []
         self._undo_stack: List[dict] = []
 
     # ------------------------------------------------------------------ moves
@@ -122,6 +130,9 @@ class GameState:
         self._update_game_status(piece)
         self.is_white_turn = not self.is_white_turn
 
+        self.move_history.append(
+            ((start, end), promotion if promoted else PieceType.QUEEN)
+        )
         self.move_log.append(
             self._notate(
                 piece_type,
@@ -197,6 +208,7 @@ class GameState:
         self.stalemate_skipped = snap["stalemate_skipped"]
         self.position_history = defaultdict(int, snap["position_history"])
         del self.move_log[snap["move_count"] :]
+        del self.move_history[snap["move_count"] :]
 
         self.selected_piece = None
         self.possible_moves = set()
@@ -204,6 +216,49 @@ class GameState:
         self.drag_start = None
         return True
 
+    # ---------------------------------------------------------------- records
+
+    def to_record(
+        self, difficulty: Optional[str] = None, date: Optional[int] = None
+    ) -> GameRecord:
+        """The game so far as a GameRecord, dated now unless `date` says.
+
+        `difficulty` is the computer's, for a game against it.
+        """
+        if self._undo_stack:
+            # The position before the first move, which may not be the usual
+            # one, e.g. for a game set up from a FEN.
+            first = self._undo_stack[0]
+            board = ChessBoard()
+            board.restore(first["board"])
+            fen = board_to_fen(board, first["is_white_turn"])
+        else:
+            fen = board_to_fen(self.board, self.is_white_turn)
+        return GameRecord(
+            tuple(self.move_history),
+            self.game_result,
+            difficulty,
+            int(time.time()) if date is None else date,
+            fen,
+        )
+
+    @classmethod
+    def from_record(cls, record: GameRecord) -> "GameState":
+        """The game a record holds, played out move by move.
+
+        Raises ValueError at a move that cannot be played, as from a record
+        made under other rules.
+        """
+        state = cls()
+        state.board, state.is_white_turn = board_from_fen(record.fen)
+        # Repetitions are counted from the record's own start position, which
+        # may not be the usual one.
+        state.position_history = defaultdict(int, {state._get_position_string(): 1})
+        for ply, ((start, end), promotion) in enumerate(record.moves, 1):
+            if not state.make_move(start, end, promotion):
+                raise ValueError(f"Move {ply} of the record cannot be played")
+        return state
+
     # ----------------------------------------------------------------- status
 
     def _update_game_status(self, moved_piece: Piece):
@@ -0,0 +1,345 @@
+"""Endgame tablebases: perfect play once only a few pieces are left.
+
+Chess 2 endings do not follow ordinary endgame theory -- knights jump in every
+direction, a spy can turn a defender, and a stalemated side hands the move
+back instead of drawing -- so the tables are worked out for these rules by
+game.tbgen and looked up here.
+
+One file per material set, named after it, e.g. KQvK.c2tb or KRvKS.c2tb, the
+white pieces first. A set is stored once, with the side that has more material
+as white; its colour-flipped twin (KvKQ) is looked up by flipping the board.
+
+Layout: a header (magic "C2TB", u16 version, u16 piece count, 16-byte material
+name), then one signed byte per position:
+
+    0       draw, or a position that cannot arise
+    d > 0   the side to move mates in d plies
+    d < 0   the side to move is mated in -d - 1 plies (-1: mated already)
+
+Plies include the passes forced by stalemate. Positions are indexed by the
+squares of white's king, white's other pieces, black's king and black's other
+pieces, in that order, and the side to move. Only board symmetries that keep
+the rules intact are used to shrink a table: all eight reflections and
+rotations while there are no pawns, just left-right mirroring with them. The
+tables assume no castling rights, and promote to a queen, like the search.
+"""
+
+import logging
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from core.board import ChessBoard
+from core.piece import MATERIAL_VALUES, PieceType
+from utils import _resource_path, map_readonly
+
+Move = Tuple[Tuple[int, int], Tuple[int, int]]
+
+MAGIC = b"C2TB"
+VERSION = 1
+HEADER = struct.Struct("<4sHH16s")
+SUFFIX = ".c2tb"
+TABLEBASE_DIR = "assets/tablebases"
+
+# Most pieces a table can hold, kings included.
+MAX_MEN = 4
+
+LETTERS = {
+    PieceType.KING: "K",
+    PieceType.QUEEN: "Q",
+    PieceType.ROOK: "R",
+    PieceType.SPY: "S",
+    PieceType.KNIGHT: "N",
+    PieceType.BISHOP: "B",
+    PieceType.PAWN: "P",
+}
+_LETTER_TYPES = {letter: piece_type for piece_type, letter in LETTERS.items()}
+_CASTLING_PIECES = (PieceType.KING, PieceType.ROOK)
+# Squares a castling rook starts on, by colour.
+_CORNERS = {True: (56, 63), False: (0, 7)}
+
+# Order of the pieces after the king within one side of a material name.
+_ORDER = "QRSNBP"
+
+
+def _transform(index: int, row: int, col: int) -> Tuple[int, int]:
+    """One of the eight symmetries of the board; 0 is the identity, 1 mirrors."""
+    if index & 4:
+        row, col = col, row
+    if index & 1:
+        col = 7 - col
+    if index & 2:
+        row = 7 - row
+    return row, col
+
+
+# Square mappings for each symmetry, by square number (row * 8 + col).
+_TRANSFORMS = [
+    [row * 8 + col for row, col in (_transform(t, s // 8, s % 8) for s in range(64))]
+    for t in range(8)
+]
+
+# Where white's king is kept: the a1-d1-d4 triangle without pawns, the a-d files
+# with them. Each square lists the symmetries that bring a king there.
+_KING_SQUARES = {
+    False: [s for s in range(64) if s // 8 >= 4 and 7 - s // 8 <= s % 8 <= 3],
+    True: [s for s in range(64) if s % 8 <= 3],
+}
+_KING_TRANSFORMS = {
+    pawns: [
+        [t for t in ((0, 1) if pawns else range(8)) if _TRANSFORMS[t][s] in squares]
+        for s in range(64)
+    ]
+    for pawns, squares in _KING_SQUARES.items()
+}
+
+
+def material_name(pieces: List[Tuple[PieceType, bool]]) -> str:
+    """'KQvK' style name for a list of (type, is_white), kings included."""
+    sides = []
+    for is_white in (True, False):
+        letters = sorted(
+            (
+                LETTERS[t]
+                for t, white in pieces
+                if white == is_white and t != PieceType.KING
+            ),
+            key=_ORDER.index,
+        )
+        sides.append("K" + "".join(letters))
+    return "v".join(sides)
+
+
+def flip_name(name: str) -> str:
+    white, black = name.split("v")
+    return f"{black}v{white}"
+
+
+def stored_name(name: str) -> str:
+    """The name a material set is stored under: the stronger side as white."""
+
+    def strength(side: str) -> Tuple[int, List[int]]:
+        values = [MATERIAL_VALUES[_LETTER_TYPES[letter]] for letter in side[1:]]
+        return sum(values), sorted(values, reverse=True)
+
+    white, black = name.split("v")
+    return name if strength(white) >= strength(black) else flip_name(name)
+
+
+class Layout:
+    """How the positions of one material set are numbered."""
+
+    def __init__(self, name: str):
+        self.name = name
+        white, black = name.split("v")
+        self.pieces = [(_LETTER_TYPES[letter], True) for letter in white] + [
+            (_LETTER_TYPES[letter], False) for letter in black
+        ]
+        self.men = len(self.pieces)
+        self.pawns = "P" in name
+        self.king_squares = _KING_SQUARES[self.pawns]
+        self.king_transforms = _KING_TRANSFORMS[self.pawns]
+        self._king_rank = {s: i for i, s in enumerate(self.king_squares)}
+        # Runs of identical pieces, e.g. the two knights of KNNvK: their
+        # squares are kept sorted, so swapping them is the same position.
+        self._twins = []
+        start = 1
+        for end in range(2, self.men + 1):
+            if end == self.men or self.pieces[end] != self.pieces[start]:
+                if end - start > 1:
+                    self._twins.append((start, end))
+                start = end
+        self.others = 64 ** (self.men - 1)
+        self.size = len(self.king_squares) * self.others * 2
+
+    def index(self, squares: List[int], is_white: bool) -> int:
+        """Index of a position, `squares` in layout order; -1 if none fits.
+
+        Of the symmetric copies of a position with white's king in its area,
+        the one with the lowest index stands for them all.
+        """
+        best = -1
+        for t in self.king_transforms[squares[0]]:
+            mapping = _TRANSFORMS[t]
+            mapped = [mapping[square] for square in squares]
+            for start, end in self._twins:
+                mapped[start:end] = sorted(mapped[start:end])
+            number = self._king_rank[mapped[0]]
+            for square in mapped[1:]:
+                number = number * 64 + square
+            number = number * 2 + (0 if is_white else 1)
+            if best < 0 or number < best:
+                best = number
+        return best
+
+    def squares(self, index: int) -> Tuple[List[int], bool]:
+        """The position an index stands for: (squares in layout order, is_white)."""
+        is_white = index % 2 == 0
+        number = index // 2
+        squares = []
+        for _ in range(self.men - 1):
+            squares.append(number % 64)
+            number //= 64
+        squares.append(self.king_squares[number])
+        squares.reverse()
+        return squares, is_white
+
+
+def position(
+    board: ChessBoard,
+) -> Optional[Tuple[str, List[Tuple[PieceType, bool, int]]]]:
+    """(material name, pieces as (type, is_white, square)) for small positions.
+
+    None for more than MAX_MEN pieces, or while a side can still castle, which
+    the tables leave out: its king has not moved and neither has a rook in a
+    corner of its back rank. A castling move blocked for now counts, since it
+    can open up later in the line.
+    """
+    pieces = []
+    unmoved = set()
+    square = 0
+    for row in board.board:
+        for piece in row:
+            if piece is not None:
+                if len(pieces) == MAX_MEN:
+                    return None
+                if not piece.has_moved and piece.type in _CASTLING_PIECES:
+                    unmoved.add((piece.type, piece.is_white, square))
+                pieces.append((piece.type, piece.is_white, square))
+            square += 1
+    for t, white, _ in unmoved:
+        if t == PieceType.KING and any(
+            (PieceType.ROOK, white, corner) in unmoved for corner in _CORNERS[white]
+        ):
+            return None
+    return material_name([(t, white) for t, white, _ in pieces]), pieces
+
+
+class Table:
+    def __init__(self, path: str):
+        self._data = map_readonly(path)
+        magic, version, men, name = HEADER.unpack_from(self._data, 0)
+        self.name = name.rstrip(b"\0").decode()
+        self.layout = Layout(self.name)
+        if magic != MAGIC or version != VERSION or men != self.layout.men:
+            raise ValueError(f"{path} is not a version {VERSION} tablebase")
+        if len(self._data) < HEADER.size + self.layout.size:
+            raise ValueError(f"{path} is truncated")
+
+    def value(self, index: int) -> int:
+        byte = self._data[HEADER.size + index]
+        return byte - 256 if byte > 127 else byte
+
+    def close(self):
+        if not isinstance(self._data, bytes):
+            self._data.close()
+
+
+class Tablebases:
+    """The tables in one directory, each opened the first time it is needed."""
+
+    def __init__(self, directory: Optional[str]):
+        """`directory` None means no tables at all."""
+        self.directory = directory
+        try:
+            files = os.listdir(directory) if directory is not None else []
+        except OSError:
+            files = []
+        self.available = {f[: -len(SUFFIX)] for f in files if f.endswith(SUFFIX)}
+        self._tables: Dict[str, Table] = {}
+
+    def table(self, name: str) -> Optional[Table]:
+        if name not in self.available:
+            return None
+        table = self._tables.get(name)
+        if table is None:
+            table = self._tables[name] = Table(
+                os.path.join(self.directory, name + SUFFIX)
+            )
+        return table
+
+    def probe(self, board: ChessBoard, is_white: bool) -> Optional[int]:
+        """Table value (see the module docstring) of the position, or None.
+
+        None when the material is not covered. A bare king each is a draw.
+        """
+        found = position(board)
+        if found is None:
+            return None
+        name, pieces = found
+        if name == "KvK":
+            return 0
+
+        stored = stored_name(name)
+        flipped = stored != name
+        table = self.table(stored)
+        if table is None:
+            return None
+        if flipped:
+            # Swap colours and mirror the ranks, so the pieces still move the
+            # same way relative to their own side.
+            pieces = [(t, not white, s ^ 56) for t, white, s in pieces]
+            is_white = not is_white
+
+        squares = []
+        for piece_type, white in table.layout.pieces:
+            for i, (t, w, s) in enumerate(pieces):
+                if t == piece_type and w == white:
+                    squares.append(s)
+                    del pieces[i]
+                    break
+        index = table.layout.index(squares, is_white)
+        return table.value(index) if index >= 0 else None
+
+    def best_move(
+        self, board: ChessBoard, is_white: bool
+    ) -> Optional[Tuple[Move, int]]:
+        """(move, value) of the quickest win or the longest defence.
+
+        None unless the position and every position a move leads to are
+        covered.
+        """
+        if self.probe(board, is_white) is None:
+            return None
+        best = None
+        for move in board.legal_moves_for(is_white):
+            undo = board.apply_move(*move)
+            reply = self.probe(board, not is_white)
+            board.undo_move(undo)
+            if reply is None:
+                return None
+            value = value_before(reply)
+            if best is None or _rank(value) > _rank(best[1]):
+                best = (move, value)
+        return best
+
+
+def value_before(reply: int) -> int:
+    """Value for the side that moved, from the value for the side to reply."""
+    if reply > 0:
+        return -reply - 2  # the reply mates in `reply`: mated in reply + 1
+    if reply < 0:
+        return -reply  # the reply is mated in -reply - 1: mate in -reply
+    return 0
+
+
+def _rank(value: int) -> Tuple[int, int]:
+    """Orders values from worst to best: slow losses beat quick ones."""
+    if value > 0:
+        return 2, -value
+    if value < 0:
+        return 0, -value
+    return 1, 0
+
+
+_TABLEBASES: Optional[Tablebases] = None
+
+
+def default_tablebases() -> Tablebases:
+    """The tables shipped with the game, opened on first use."""
+    global _TABLEBASES
+    if _TABLEBASES is None:
+        _TABLEBASES = Tablebases(_resource_path(TABLEBASE_DIR))
+        if not _TABLEBASES.available:
+            logging.info("No endgame tablebases found")
+    return _TABLEBASES
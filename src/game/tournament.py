@@ -0,0 +1,394 @@
+"""Self-play tournaments between two engine configurations.
+
+    python -m game.tournament --a depth=3 --b depth=3,-lmr --games 200
+    python -m game.tournament --a time=0.1 --b time=0.1,-null_move --sprt
+
+A configuration is a comma-separated list: depth=N (plies), time=S (seconds
+per move), hash=MB, and -feature to switch a search feature off (see
+ai.FEATURES). Games are played through GameState, so every house rule applies
+exactly as in the game, stalemate passes and threefold repetition included,
+and are shared out over a process pool. No pygame is needed.
+
+Each opening is a few plies drawn at random from the opening book (random
+legal moves once out of book) and is played twice, colours swapped, so
+neither side profits from a lucky opening. Reported are A's wins, draws and
+losses, an Elo difference with a 95% error margin and both sides' NPS.
+
+--sprt stops as soon as a sequential probability ratio test can tell "A is
+--elo1 stronger" from "A is --elo0 stronger" at the given error rates, which
+usually takes far fewer games than a fixed number would need.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from core.board import ChessBoard
+from game import ai, book
+from game.state import GameState
+
+# Games still going after this many plies are drawn: without a fifty-move rule
+# two engines can shuffle pieces for ever.
+MAX_PLIES = 300
+
+DEFAULT_OPENING_PLIES = 4
+
+# 95% confidence, for the Elo error margin.
+_Z_95 = 1.96
+
+
+@dataclass(frozen=True)
+class Player:
+    """One engine configuration."""
+
+    depth: int = 4
+    movetime: Optional[float] = None
+    hash_mb: int = 16
+    disabled: Tuple[str, ...] = ()
+
+    @classmethod
+    def parse(cls, text: str) -> "Player":
+        """A Player from e.g. 'depth=3,time=0.5,-lmr'; ValueError if malformed."""
+        settings: Dict[str, object] = {}
+        disabled = []
+        for item in filter(None, (part.strip() for part in text.split(","))):
+            if item.startswith("-"):
+                if item[1:] not in ai.FEATURES:
+                    raise ValueError(
+                        f"Unknown feature {item[1:]!r}, expected one of"
+                        f" {', '.join(ai.FEATURES)}"
+                    )
+                disabled.append(item[1:])
+                continue
+            name, _, value = item.partition("=")
+            if name == "depth":
+                settings["depth"] = int(value)
+            elif name == "time":
+                settings["movetime"] = float(value)
+            elif name == "hash":
+                settings["hash_mb"] = int(value)
+            else:
+                raise ValueError(f"Unknown setting {item!r}")
+        if "movetime" in settings and "depth" not in settings:
+            # A time limit alone means search as deep as the time allows.
+            settings["depth"] = ai.MAX_PLY // 2
+        return cls(disabled=tuple(sorted(disabled)), **settings)
+
+    def __str__(self) -> str:
+        parts = [f"depth={self.depth}"]
+        if self.movetime is not None:
+            parts.append(f"time={self.movetime:g}")
+        parts.append(f"hash={self.hash_mb}")
+        parts += [f"-{feature}" for feature in self.disabled]
+        return ",".join(parts)
+
+
+def random_opening(plies: int, rng: random.Random) -> List[ai.Move]:
+    """`plies` moves from the start: book moves by weight, then random ones."""
+    board = ChessBoard()
+    opening_book = book.default_book()
+    moves: List[ai.Move] = []
+    is_white = True
+    for _ in range(plies):
+        legal = board.legal_moves_for(is_white)
+        if not legal:
+            break
+        move = None
+        if opening_book is not None:
+            move = opening_book.choose(board, is_white, legal, rng)
+        if move is None:
+            move = rng.choice(legal)
+        board.apply_move(*move)
+        moves.append(move)
+        is_white = not is_white
+    return moves
+
+
+def play_game(
+    opening: List[ai.Move],
+    white: Player,
+    black: Player,
+    seed: int,
+    max_plies: int = MAX_PLIES,
+) -> dict:
+    """Play one game to the end; the result is from white's point of view.
+
+    Runs in a worker process. Each side gets its own hash table, so neither
+    learns from the other's searches.
+    """
+    random.seed(seed)
+    state = GameState()
+    for start, end in opening:
+        if not state.make_move(start, end):
+            raise ValueError(f"Opening move {start}->{end} is illegal")
+
+    players = {True: white, False: black}
+    tables = {
+        colour: ai.TranspositionTable(player.hash_mb)
+        for colour, player in players.items()
+    }
+    nodes = {True: 0, False: 0}
+    seconds = {True: 0.0, False: 0.0}
+    reason = "max plies"
+    while len(state.move_log) < max_plies:
+        if state.game_over:
+            reason = "checkmate" if state.game_result != "draw" else "repetition"
+            break
+        colour = state.is_white_turn
+        player = players[colour]
+        started = time.perf_counter()
+        search = ai._Search(
+            state.board,
+            table=tables[colour],
+            deadline=started + player.movetime if player.movetime else None,
+            disabled=player.disabled,
+        )
+        move = asyncio.run(search.best_move(player.depth, colour))
+        seconds[colour] += time.perf_counter() - started
+        nodes[colour] += search.nodes
+        if move is None:
+            # Both sides stuck: the stalemate pass has nowhere to go.
+            reason = "no moves"
+            break
+        if not state.make_move(*move):
+            raise RuntimeError(f"Engine chose an illegal move {move}")
+
+    score = {"white_wins": 1.0, "black_wins": 0.0}.get(state.game_result, 0.5)
+    return {
+        "score": score,
+        "reason": reason,
+        "plies": len(state.move_log),
+        "nodes": [nodes[True], nodes[False]],
+        "seconds": [seconds[True], seconds[False]],
+    }
+
+
+def elo_estimate(wins: int, draws: int, losses: int) -> Tuple[float, float]:
+    """Elo difference implied by the results, and its 95% error margin."""
+    games = wins + draws + losses
+    if not games:
+        return 0.0, 0.0
+    score = (wins + draws / 2) / games
+    variance = (
+        wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score**2
+    ) / games
+    spread = _Z_95 * math.sqrt(variance / games)
+    low, high = _elo(score - spread, games), _elo(score + spread, games)
+    return _elo(score, games), (high - low) / 2
+
+
+def _elo(score: float, games: int) -> float:
+    # A perfect score has no finite Elo; treat it as half a game less.
+    limit = 1 / (2 * games)
+    score = min(max(score, limit), 1 - limit)
+    return -400 * math.log10(1 / score - 1)
+
+
+def sprt_llr(wins: int, draws: int, losses: int, elo0: float, elo1: float) -> float:
+    """Log-likelihood ratio of "A is elo1 stronger" over "A is elo0 stronger".
+
+    The usual normal approximation to the trinomial GSPRT.
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (
+        wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score**2
+    ) / games
+    if variance == 0:
+        return 0.0
+    s0 = 1 / (1 + 10 ** (-elo0 / 400))
+    s1 = 1 / (1 + 10 ** (-elo1 / 400))
+    return games * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+
+
+def sprt_bounds(alpha: float, beta: float) -> Tuple[float, float]:
+    """LLR at or below the first accepts H0, at or above the second H1."""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def run(
+    a: Player,
+    b: Player,
+    games: int,
+    workers: int,
+    opening_plies: int = DEFAULT_OPENING_PLIES,
+    seed: int = 1,
+    sprt: Optional[Tuple[float, float, float, float]] = None,
+    progress=None,
+    max_plies: int = MAX_PLIES,
+) -> dict:
+    """Play up to `games` games of A against B and report.
+
+    `sprt` is (elo0, elo1, alpha, beta); the tournament stops once the test
+    decides. `progress` is called with the report so far after every game.
+    """
+    rng = random.Random(seed)
+    jobs = []
+    for pair in range((games + 1) // 2):
+        opening = random_opening(opening_plies, rng)
+        jobs.append((opening, a, b, seed + 2 * pair, True))
+        jobs.append((opening, b, a, seed + 2 * pair + 1, False))
+    jobs = jobs[:games]
+
+    tally = {"wins": 0, "draws": 0, "losses": 0}
+    nodes = {"a": 0, "b": 0}
+    seconds = {"a": 0.0, "b": 0.0}
+    reasons: Dict[str, int] = {}
+    llr = 0.0
+    verdict = None
+    started = time.perf_counter()
+
+    def report() -> dict:
+        elo, margin = elo_estimate(tally["wins"], tally["draws"], tally["losses"])
+        result = {
+            "a": str(a),
+            "b": str(b),
+            "games": sum(tally.values()),
+            **tally,
+            "elo": round(elo, 1),
+            "elo_margin": round(margin, 1),
+            "endings": dict(reasons),
+            "nps": {
+                side: int(nodes[side] / seconds[side]) if seconds[side] else 0
+                for side in ("a", "b")
+            },
+            "seconds": round(time.perf_counter() - started, 1),
+        }
+        if sprt is not None:
+            elo0, elo1, alpha, beta = sprt
+            lower, upper = sprt_bounds(alpha, beta)
+            result["sprt"] = {
+                "elo0": elo0,
+                "elo1": elo1,
+                "llr": round(llr, 3),
+                "bounds": [round(lower, 3), round(upper, 3)],
+                "verdict": verdict,
+            }
+        return result
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        pending = {
+            pool.submit(
+                play_game, opening, white, black, game_seed, max_plies
+            ): a_is_white
+            for opening, white, black, game_seed, a_is_white in jobs
+        }
+        while pending and verdict is None:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                a_is_white = pending.pop(future)
+                game = future.result()
+                score = game["score"] if a_is_white else 1 - game["score"]
+                key = {1.0: "wins", 0.5: "draws", 0.0: "losses"}[score]
+                tally[key] += 1
+                reasons[game["reason"]] = reasons.get(game["reason"], 0) + 1
+                a_index = 0 if a_is_white else 1
+                for side, index in (("a", a_index), ("b", 1 - a_index)):
+                    nodes[side] += game["nodes"][index]
+                    seconds[side] += game["seconds"][index]
+
+                if sprt is not None:
+                    elo0, elo1, alpha, beta = sprt
+                    llr = sprt_llr(
+                        tally["wins"], tally["draws"], tally["losses"], elo0, elo1
+                    )
+                    lower, upper = sprt_bounds(alpha, beta)
+                    if llr >= upper:
+                        verdict = "H1"
+                    elif llr <= lower:
+                        verdict = "H0"
+                    if verdict is not None:
+                        break
+                if progress is not None:
+                    progress(report())
+        for future in pending:
+            future.cancel()
+    return report()
+
+
+def _summary(result: dict) -> str:
+    lines = [
+        f"A: {result['a']}",
+        f"B: {result['b']}",
+        f"Games {result['games']}: A won {result['wins']}, drew {result['draws']},"
+        f" lost {result['losses']}",
+        f"Elo (A - B): {result['elo']:+.1f} +/- {result['elo_margin']:.1f}",
+        f"NPS: A {result['nps']['a']}, B {result['nps']['b']}",
+        "Endings: "
+        + ", ".join(f"{k} {v}" for k, v in sorted(result["endings"].items())),
+    ]
+    if "sprt" in result:
+        sprt = result["sprt"]
+        lines.append(
+            f"SPRT [{sprt['elo0']:g}, {sprt['elo1']:g}]: LLR {sprt['llr']:.2f}"
+            f" in ({sprt['bounds'][0]:.2f}, {sprt['bounds'][1]:.2f}),"
+            f" {sprt['verdict'] or 'undecided'}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Chess 2 engine matches")
+    parser.add_argument("--a", default="depth=3", help="configuration of A")
+    parser.add_argument("--b", default="depth=2", help="configuration of B")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--opening-plies", type=int, default=DEFAULT_OPENING_PLIES)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--max-plies", type=int, default=MAX_PLIES, help="draw games this long"
+    )
+    parser.add_argument("--sprt", action="store_true", help="stop early by SPRT")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=20.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    parser.add_argument(
+        "--quiet", action="store_true", help="no running score while playing"
+    )
+    args = parser.parse_args()
+
+    try:
+        a, b = Player.parse(args.a), Player.parse(args.b)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def progress(result: dict):
+        print(
+            f"\r{result['games']}/{args.games}: +{result['wins']} ={result['draws']}"
+            f" -{result['losses']}  Elo {result['elo']:+.1f}"
+            f" +/- {result['elo_margin']:.1f}",
+            end="",
+            flush=True,
+        )
+
+    result = run(
+        a,
+        b,
+        args.games,
+        args.workers,
+        args.opening_plies,
+        args.seed,
+        (args.elo0, args.elo1, args.alpha, args.beta) if args.sprt else None,
+        None if args.quiet or args.json else progress,
+        args.max_plies,
+    )
+    if not (args.quiet or args.json):
+        print()
+    print(json.dumps(result, indent=2) if args.json else _summary(result))
+
+
+if __name__ == "__main__":
+    main()
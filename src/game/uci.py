@@ -0,0 +1,495 @@
+"""Headless Chess 2 engine speaking a UCI-style protocol on stdin/stdout.
+
+Lets tournament managers, scripts and the analysis service drive the same
+search the game uses, without pygame or a display. The commands are UCI's:
+
+    uci, isready, ucinewgame, quit
+    setoption name Hash value <MB>
+    setoption name Threads value <workers>
+    position (startpos | fen <fen>) [moves <move> ...]
+    go [depth N] [nodes N] [movetime ms] [wtime ms btime ms winc ms binc ms
+       movestogo N] [infinite]
+    stop
+
+Positions are Chess 2 FENs (see core.fen) and moves are coordinate pairs such
+as e2e4, with a promotion letter where a pawn reaches the last rank (e7e8n).
+A stalemated side cannot move, so in a move list the side that stalemated
+simply plays again, as in the game.
+
+With Threads above 1 the root moves are shared out between worker processes,
+each with its own hash table. The workers report back only once they are done,
+so their info lines arrive at the end of the search rather than as it goes.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from core.board import ChessBoard
+from core.fen import START_FEN, board_from_fen, board_to_fen
+from core.piece import PieceType
+from game import ai
+from game.state import square_name
+
+ENGINE_NAME = "Chess 2"
+ENGINE_AUTHOR = "Amadeus Magrabi"
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+
+# Depth for searches limited only by time, nodes or a stop command. Deep enough
+# never to be reached in practice, shallow enough for mate scores to stay
+# within MAX_PLY.
+MAX_DEPTH = ai.MAX_PLY // 2
+
+# Moves assumed left in the game when the GUI gives a clock but no movestogo.
+DEFAULT_MOVES_TO_GO = 30
+
+_GO_LIMITS = (
+    "depth",
+    "nodes",
+    "movetime",
+    "wtime",
+    "btime",
+    "winc",
+    "binc",
+    "movestogo",
+)
+
+_PROMOTION_LETTERS = {
+    "q": PieceType.QUEEN,
+    "r": PieceType.ROOK,
+    "b": PieceType.BISHOP,
+    "n": PieceType.KNIGHT,
+}
+
+# Per-process state of the worker processes behind the Threads option.
+_WORKER_TABLE: Optional[ai.TranspositionTable] = None
+_WORKER_STOP = None
+
+
+def parse_square(name: str) -> Tuple[int, int]:
+    """Algebraic square -> (row, col), e.g. 'e2' -> (6, 4)."""
+    if len(name) != 2 or name[0] not in "abcdefgh" or name[1] not in "12345678":
+        raise ValueError(f"Bad square: {name!r}")
+    return 8 - int(name[1]), "abcdefgh".index(name[0])
+
+
+def parse_move(text: str) -> Tuple[ai.Move, PieceType]:
+    """'e7e8n' -> (((1, 4), (0, 4)), KNIGHT); promotion defaults to a queen."""
+    if len(text) not in (4, 5):
+        raise ValueError(f"Bad move: {text!r}")
+    if len(text) == 5 and text[4] not in _PROMOTION_LETTERS:
+        raise ValueError(f"Bad promotion in move: {text!r}")
+    promotion = _PROMOTION_LETTERS[text[4]] if len(text) == 5 else PieceType.QUEEN
+    return (parse_square(text[:2]), parse_square(text[2:4])), promotion
+
+
+def format_move(board: ChessBoard, move: ai.Move) -> str:
+    """Coordinate notation for a move on `board`, marking a promotion (to queen)."""
+    start, end = move
+    piece = board.get_piece(start)
+    promotes = piece is not None and piece.type == PieceType.PAWN and end[0] in (0, 7)
+    return square_name(start) + square_name(end) + ("q" if promotes else "")
+
+
+def format_score(score: int) -> str:
+    """UCI score field: centipawns, or moves to mate when one is found."""
+    if abs(score) < ai.MATE_SCORE:
+        return f"cp {score}"
+    # Mate scores count plies down from MAX_PLY; see ai._Search.negamax.
+    plies = ai.MAX_PLY - (abs(score) - ai.MATE_SCORE)
+    moves = (plies + 1) // 2
+    return f"mate {moves if score > 0 else -moves}"
+
+
+def play_moves(
+    board: ChessBoard, is_white: bool, moves: List[str]
+) -> Tuple[bool, Optional[str]]:
+    """Play coordinate moves on `board`; (side to move, first illegal move or None).
+
+    Stops at the first move that is malformed or illegal, leaving the board
+    as it was before it.
+    """
+    for text in moves:
+        try:
+            move, promotion = parse_move(text)
+        except ValueError:
+            return is_white, text
+        if move not in board.legal_moves_for(is_white):
+            return is_white, text
+        board.apply_move(*move, promotion)
+        is_white = not is_white
+        # Stalemate passes the turn straight back (see GameState).
+        if not board.legal_moves_for(is_white) and not board.is_in_check(is_white):
+            is_white = not is_white
+    return is_white, None
+
+
+def _init_worker(stop_event, hash_mb: int):
+    global _WORKER_TABLE, _WORKER_STOP
+    _WORKER_TABLE = ai.TranspositionTable(hash_mb)
+    _WORKER_STOP = stop_event
+
+
+def _worker_search(
+    fen: str,
+    moves: List[ai.Move],
+    depth: int,
+    seconds: Optional[float],
+    max_nodes: Optional[int],
+) -> Tuple[List[Tuple[int, int, List[ai.Move]]], Optional[ai.Move], int]:
+    """Search some of the root moves in a worker process.
+
+    Returns every finished iteration as (depth, score, best moves), the move
+    the search settled on, and the nodes it took.
+    """
+    board, is_white = board_from_fen(fen)
+    iterations: List[Tuple[int, int, List[ai.Move]]] = []
+    search = ai._Search(
+        board,
+        table=_WORKER_TABLE,
+        deadline=time.perf_counter() + seconds if seconds is not None else None,
+        max_nodes=max_nodes,
+        stop=_WORKER_STOP.is_set,
+        on_iteration=lambda d, score, found: iterations.append((d, score, found)),
+    )
+    move = asyncio.run(search.best_move(depth, is_white, moves))
+    return iterations, move, search.nodes
+
+
+class Engine:
+    """One engine instance: its options, position and running search."""
+
+    def __init__(self, out: TextIO = sys.stdout):
+        self.out = out
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.table = ai.TranspositionTable(self.hash_mb)
+        self.board = ChessBoard()
+        self.is_white = True
+        self._search_task: Optional[asyncio.Task] = None
+        # Whether the running search only ends when told to.
+        self._unbounded = False
+        self._stop_requested = False
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_stop = None
+
+    def send(self, line: str):
+        self.out.write(line + "\n")
+        self.out.flush()
+
+    async def handle(self, line: str) -> bool:
+        """Act on one command line; False once the engine should exit."""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        # Answered at once, even mid-search.
+        if command == "isready":
+            self.send("readyok")
+            return True
+        if command == "stop":
+            await self.stop()
+            return True
+        if command == "quit":
+            await self.stop()
+            self.close()
+            return False
+
+        # Everything else changes state the search is using, so wait for it.
+        await self.wait()
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(
+                f"option name Hash type spin default {DEFAULT_HASH_MB}"
+                f" min 1 max {MAX_HASH_MB}"
+            )
+            self.send(
+                f"option name Threads type spin default 1 min 1 max {MAX_THREADS}"
+            )
+            self.send("uciok")
+        elif command == "ucinewgame":
+            self.table.clear()
+            self.close()  # restarting the workers clears their tables
+        elif command == "setoption":
+            self._set_option(args)
+        elif command == "position":
+            self._set_position(args)
+        elif command == "go":
+            self._go(args)
+        else:
+            self.send(f"info string unknown command {command}")
+        return True
+
+    def request_stop(self):
+        """Tell the running search to end early, without waiting for it."""
+        self._stop_requested = True
+        if self._pool_stop is not None:
+            self._pool_stop.set()
+
+    async def stop(self):
+        """End the running search early; it still reports its best move."""
+        self.request_stop()
+        await self.wait()
+
+    async def wait(self):
+        if self._search_task is not None:
+            await self._search_task
+            self._search_task = None
+
+    def close(self):
+        """Shut down the worker processes, if any were started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._pool_stop = None
+
+    # --------------------------------------------------------------- commands
+
+    def _set_option(self, args: List[str]):
+        # setoption name <name> value <value>; names may contain spaces.
+        if "name" not in args or "value" not in args:
+            self.send("info string setoption needs a name and a value")
+            return
+        name = " ".join(args[args.index("name") + 1 : args.index("value")]).lower()
+        value = " ".join(args[args.index("value") + 1 :])
+        try:
+            number = int(value)
+        except ValueError:
+            self.send(f"info string bad value for {name}: {value}")
+            return
+        if name == "hash":
+            self.hash_mb = max(1, min(number, MAX_HASH_MB))
+            self.table.resize(self.hash_mb)
+            self.close()  # the workers size their own tables on start-up
+        elif name == "threads":
+            self.threads = max(1, min(number, MAX_THREADS))
+            self.close()
+        else:
+            self.send(f"info string unknown option {name}")
+
+    def _set_position(self, args: List[str]):
+        if "moves" in args:
+            setup, moves = args[: args.index("moves")], args[args.index("moves") + 1 :]
+        else:
+            setup, moves = args, []
+
+        fen = START_FEN
+        if setup[:1] == ["fen"]:
+            fen = " ".join(setup[1:])
+        elif setup[:1] != ["startpos"]:
+            self.send("info string position needs startpos or fen")
+            return
+        try:
+            board, is_white = board_from_fen(fen)
+        except ValueError as e:
+            self.send(f"info string {e}")
+            return
+
+        is_white, illegal = play_moves(board, is_white, moves)
+        if illegal is not None:
+            self.send(f"info string illegal move {illegal}")
+        self.board, self.is_white = board, is_white
+
+    def _go(self, args: List[str]):
+        limits: Dict[str, int] = {}
+        for i, token in enumerate(args[:-1]):
+            if token in _GO_LIMITS:
+                try:
+                    limits[token] = int(args[i + 1])
+                except ValueError:
+                    pass
+
+        depth = max(1, min(limits.get("depth", MAX_DEPTH), MAX_DEPTH))
+        seconds = self._budget(limits) if "infinite" not in args else None
+        self._unbounded = seconds is None and not limits.keys() & {"depth", "nodes"}
+        self._stop_requested = False
+        self._search_task = asyncio.ensure_future(
+            self._search(depth, seconds, limits.get("nodes"))
+        )
+
+    def _budget(self, limits: Dict[str, int]) -> Optional[float]:
+        """Seconds to think, from movetime or the clock; None if unlimited."""
+        if "movetime" in limits:
+            return limits["movetime"] / 1000
+        clock = limits.get("wtime" if self.is_white else "btime")
+        if clock is None:
+            return None
+        increment = limits.get("winc" if self.is_white else "binc", 0)
+        moves_to_go = limits.get("movestogo") or DEFAULT_MOVES_TO_GO
+        # An even share of what is left, plus most of the increment, but never
+        # so much that a slow move could lose on time.
+        budget = clock / moves_to_go + increment * 0.75
+        return max(10, min(budget, clock * 0.5)) / 1000
+
+    # ----------------------------------------------------------------- search
+
+    async def _search(self, depth: int, seconds: Optional[float], nodes: Optional[int]):
+        started = time.perf_counter()
+        moves = self.board.legal_moves_for(self.is_white)
+        if not moves:
+            self.send("bestmove 0000")
+            return
+
+        if self.threads > 1 and len(moves) > 1:
+            move = await self._search_parallel(moves, depth, seconds, nodes, started)
+        else:
+            move = await self._search_here(depth, seconds, nodes, started)
+        self.send(f"bestmove {format_move(self.board, move)}")
+
+    async def _search_here(
+        self, depth: int, seconds: Optional[float], nodes: Optional[int], started: float
+    ) -> ai.Move:
+        search = ai._Search(
+            self.board,
+            table=self.table,
+            deadline=started + seconds if seconds is not None else None,
+            max_nodes=nodes,
+            stop=lambda: self._stop_requested,
+        )
+        search.on_iteration = lambda d, score, found: self._info(
+            d, score, search.nodes, started, found[0], search.stats.max_depth
+        )
+        return await search.best_move(depth, self.is_white)
+
+    async def _search_parallel(
+        self,
+        moves: List[ai.Move],
+        depth: int,
+        seconds: Optional[float],
+        nodes: Optional[int],
+        started: float,
+    ) -> ai.Move:
+        if self._pool is None:
+            # Spawned, not forked: a forked child tries to close the stdin the
+            # reader thread is blocked on and hangs. The stop event has to be
+            # handed over when the processes start.
+            context = multiprocessing.get_context("spawn")
+            self._pool_stop = context.Event()
+            self._pool = ProcessPoolExecutor(
+                self.threads,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._pool_stop, self.hash_mb),
+            )
+        self._pool_stop.clear()
+
+        # Deal the moves out in search order, so that every worker gets some of
+        # the likely best ones.
+        moves.sort(key=lambda m: ai._move_order_key(self.board, m))
+        shares = [moves[i :: self.threads] for i in range(self.threads)]
+        shares = [share for share in shares if share]
+        fen = board_to_fen(self.board, self.is_white)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self._pool,
+                    _worker_search,
+                    fen,
+                    share,
+                    depth,
+                    seconds,
+                    nodes // len(shares) if nodes is not None else None,
+                )
+                for share in shares
+            )
+        )
+
+        # Scores are only comparable between workers at a depth all of them
+        # finished; past that, each has only seen its own moves more deeply.
+        total_nodes = sum(result[2] for result in results)
+        common = min(len(iterations) for iterations, _, _ in results)
+        best_move = results[0][1]
+        for d in range(common):
+            score, best_move = max(
+                (iterations[d][1], iterations[d][2][0]) for iterations, _, _ in results
+            )
+            self._info(d + 1, score, total_nodes, started, best_move)
+        return best_move
+
+    def _info(
+        self,
+        depth: int,
+        score: int,
+        nodes: int,
+        started: float,
+        move: ai.Move,
+        seldepth: Optional[int] = None,
+    ):
+        elapsed = time.perf_counter() - started
+        selective = f" seldepth {seldepth}" if seldepth else ""
+        self.send(
+            f"info depth {depth}{selective} score {format_score(score)} nodes {nodes}"
+            f" nps {int(nodes / elapsed) if elapsed > 0 else 0}"
+            f" time {int(elapsed * 1000)} pv {format_move(self.board, move)}"
+        )
+
+
+async def _read(stdin: TextIO, engine: Engine, commands: asyncio.Queue):
+    """Queue the lines of stdin for run(), up to quit or the end of input."""
+    loop = asyncio.get_running_loop()
+    while True:
+        # Read in a thread, so a running search keeps going meanwhile.
+        line = await loop.run_in_executor(None, stdin.readline)
+        if not line:
+            await commands.put(None)
+            return
+        command = line.split()[:1]
+        if command == ["isready"]:
+            # Answered at once, even behind commands waiting for a search.
+            engine.send("readyok")
+            continue
+        if command in (["stop"], ["quit"]):
+            # End the running search now, so whatever is queued behind it can
+            # go ahead. Queued as well, to end a search one of those starts.
+            engine.request_stop()
+        await commands.put(line)
+        if command == ["quit"]:
+            return  # another readline would keep the process alive
+
+
+async def run(stdin: TextIO = sys.stdin, out: TextIO = sys.stdout):
+    """Read commands until quit or end of input, searching in between.
+
+    Lines are read in a task of their own: a command that waits for the
+    search to finish must not hold up reading, or the stop that would end the
+    search is never seen.
+    """
+    engine = Engine(out)
+    commands: asyncio.Queue = asyncio.Queue()
+    reader = asyncio.ensure_future(_read(stdin, engine, commands))
+    while True:
+        line = await commands.get()
+        if line is None:
+            # Input piped in from a file or script ends here; let a search it
+            # started finish, unless nothing but a stop would ever end it.
+            if engine._unbounded:
+                await engine.stop()
+            await engine.wait()
+            engine.close()
+            break
+        if not await engine.handle(line):
+            break
+    await reader
+
+
+def main():
+    logging.basicConfig(
+        level=logging.WARNING,
+        stream=sys.stderr,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,42 @@
+import argparse
 import asyncio
+import copy
+import functools
 import logging
 import sys
+import time
 from typing import Optional, Tuple
 
 import pygame
 from pygame.locals import (
     K_ESCAPE,
+    K_p,
     K_r,
     K_u,
     KEYDOWN,
     MOUSEBUTTONDOWN,
     MOUSEBUTTONUP,
     MOUSEMOTION,
+    NOEVENT,
     QUIT,
+    VIDEOEXPOSE,
+    WINDOWEXPOSED,
 )
 
-from core.piece import Piece, PieceType
+import profiling
+from core.piece import PieceType
 from game import ai
 from game.state import GameState
+from gui.loader import StagedLoader, StartupTimer
 from gui.renderer import (
     WINDOW_HEIGHT,
     WINDOW_WIDTH,
+    FrameStats,
     GUIRenderer,
     MoveAnimation,
     Notice,
     SquareEffect,
+    move_visuals,
 )
 from utils import _resource_path
 
@@ -32,9 +44,33 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+# How often the search statistics overlay is repainted while the computer
+# thinks. Painting blocks the search, so not every time it yields.
+STATS_REPAINT_MS = 100
+
+# Frame rate while something on screen moves. Otherwise the loop sleeps until
+# the next event, waking at least every IDLE_TIMEOUT_MS just in case.
+FRAME_RATE = 60
+IDLE_TIMEOUT_MS = 250
+# The browser cannot be blocked, so there the loop naps in steps this long and
+# looks for events in between: short enough that a click feels immediate.
+IDLE_POLL_S = 1 / 30
+# Time per frame spent loading what the menu did not need, once it is up: a
+# few steps a frame, so the menu stays responsive while they load.
+LOAD_BUDGET_MS = 8
+
+SOUNDS = ("move", "capture", "castle", "check", "checkmate", "promote")
+
 
 class ChessApp:
-    def __init__(self, width: int = WINDOW_WIDTH, height: int = WINDOW_HEIGHT):
+    def __init__(
+        self,
+        width: int = WINDOW_WIDTH,
+        height: int = WINDOW_HEIGHT,
+        startup: Optional[StartupTimer] = None,
+    ):
+        # Times each stage up to everything being loaded; see gui.loader.
+        self.startup = startup or StartupTimer()
         pygame.init()
         try:
             pygame.mixer.init()
@@ -43,16 +79,19 @@ class ChessApp:
             logging.warning(f"Audio unavailable, continuing without sound: {e}")
         self.screen = pygame.display.set_mode((width, height))
         pygame.display.set_caption("Chess 2")
+        self.startup.mark("window")
         self.clock = pygame.time.Clock()
         self.state = GameState()
         self.renderer = GUIRenderer(width, height)
+        self.startup.mark("renderer")
+        # What the menu does not need, loaded after its first frame is up.
+        self.loader = StagedLoader(self.startup)
         self.computer_thinking = False
         self.in_menu = True
         self.in_rules = False
         self.game_mode = "ai"  # or "local"
         self.difficulty = ai.MEDIUM
         self.sounds = {}
-        self.assets_loaded = False
         # Set while waiting for the player to choose a promotion piece.
         self.pending_promotion: Optional[Tuple[Tuple[int, int], Tuple[int, int]]] = None
         # House-rules overlay shown over the board, without leaving the game.
@@ -67,24 +106,59 @@ class ChessApp:
         # arriving rather than leading it.
         self.pending_sound: Optional[str] = None
         self._hand_cursor = False
+        # The event that ended an idle wait, taken off the queue by the wait;
+        # _handle_events deals with it before anything that came after it.
+        self._waited_event: Optional[pygame.event.Event] = None
+        # Debug overlay in the panel with the computer's search statistics,
+        # repainted while it thinks (at most every STATS_REPAINT_MS).
+        self.show_search_stats = False
+        self.search_stats: Optional[ai.SearchStats] = None
+        self._stats_painted = 0
+        # Frame rate and render costs over the board, toggled with P.
+        self.show_perf = False
+        self.frame_stats = FrameStats()
+
+    def _queue_assets(self):
+        """Queue what the menu does not need, after the first frame is up.
+
+        Sounds go first, since the menu's buttons already play them. Called
+        after the first event loop yield so pygbag VFS is ready.
+        """
+        for name in SOUNDS:
+            self.loader.add(f"sound {name}", functools.partial(self._load_sound, name))
+        for stage, step in self.renderer.loading_steps():
+            self.loader.add(stage, step)
+
+    def _load_sound(self, name: str):
+        last_error = None
+        # pygbag transcodes .ogg to .mp3 when packaging for the web, so try both.
+        for ext in ("ogg", "mp3"):
+            try:
+                path = _resource_path(f"assets/sounds/{name}.{ext}")
+                self.sounds[name] = pygame.mixer.Sound(path)
+                return
+            except Exception as e:
+                # Keep the first failure: it names the format we actually
+                # ship, so the log says why that one could not be decoded.
+                last_error = last_error or e
+        logging.warning(f"Could not load sound '{name}': {last_error}")
+
+    def _load_step(self):
+        """Load a little more, and report the startup times once all is in."""
+        if self.loader.done:
+            return
+        if self.loader.run(LOAD_BUDGET_MS):
+            self._loaded()
 
-    def _load_assets(self):
-        """Load audio assets. Called after first event loop yield so pygbag VFS is ready."""
-        for name in ("move", "capture", "castle", "check", "checkmate", "promote"):
-            last_error = None
-            # pygbag transcodes .ogg to .mp3 when packaging for the web, so try both.
-            for ext in ("ogg", "mp3"):
-                try:
-                    path = _resource_path(f"assets/sounds/{name}.{ext}")
-                    self.sounds[name] = pygame.mixer.Sound(path)
-                    break
-                except Exception as e:
-                    # Keep the first failure: it names the format we actually
-                    # ship, so the log says why that one could not be decoded.
-                    last_error = last_error or e
-            else:
-                logging.warning(f"Could not load sound '{name}': {last_error}")
-        self.assets_loaded = True
+    def _finish_loading(self):
+        """Load whatever is left at once: the game is about to need it."""
+        if not self.loader.done:
+            self.loader.finish()
+            self._loaded()
+
+    def _loaded(self):
+        self.startup.mark("loaded")
+        logging.info(f"Startup times:\n{self.startup.report()}")
 
     def _play(self, name: str):
         """Play a sound effect if it loaded successfully."""
@@ -96,18 +170,64 @@ class ChessApp:
         logging.info("Starting Chess 2 app")
         # Yield once first so pygbag's virtual filesystem is fully mounted
         await asyncio.sleep(0)
-        self._load_assets()
+        # Paint the menu before anything else is loaded: it is what the
+        # player waits to see.
+        self._update_display()
+        self.startup.mark("first frame")
+        self._queue_assets()
         while True:
+            started = time.perf_counter()
             self._handle_events()
+            self.frame_stats.events_ms = (time.perf_counter() - started) * 1e3
             self._tick_animation()
             self._update_cursor()
             self._update_display()
+            self._load_step()
 
+            self.frame_stats.search_ms = 0.0
             if self._computer_to_move():
                 await self._make_computer_move()
 
-            self.clock.tick(60)
-            await asyncio.sleep(0)
+            if self._busy():
+                self.clock.tick(FRAME_RATE)
+                await asyncio.sleep(0)
+            else:
+                await self._wait_for_event(IDLE_TIMEOUT_MS)
+            self.frame_stats.tick()
+
+    def _busy(self) -> bool:
+        """Whether the next frame will differ without any input arriving."""
+        return (
+            self._animating()
+            or self.effect is not None
+            or self.notice is not None
+            or self.state.dragging
+            or self.computer_thinking
+            or self._computer_to_move()
+            # It measures the frame rate, so it wants frames to measure.
+            or self.show_perf
+            or not self.loader.done
+        )
+
+    async def _wait_for_event(self, timeout_ms: int):
+        """Sleep until an event arrives or `timeout_ms` passes.
+
+        Nothing is moving, so there is nothing to draw until the player does
+        something: this is what keeps an idle game near zero CPU.
+        """
+        if sys.platform == "emscripten":
+            # pygbag runs the game on the browser's event loop, which must keep
+            # turning for events to arrive at all.
+            deadline = pygame.time.get_ticks() + timeout_ms
+            while not pygame.event.peek() and pygame.time.get_ticks() < deadline:
+                await asyncio.sleep(IDLE_POLL_S)
+            return
+        event = pygame.event.wait(timeout_ms)
+        if event.type != NOEVENT:
+            # Kept rather than posted again: posting puts it behind whatever
+            # is queued already, so a quick tap would arrive up before down.
+            self._waited_event = event
+        await asyncio.sleep(0)
 
     def _tick_animation(self):
         """Retire finished animations and release the sound they were holding."""
@@ -161,11 +281,19 @@ class ChessApp:
     # ---------------------------------------------------------------- events
 
     def _handle_events(self):
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        if self._waited_event is not None:
+            events.insert(0, self._waited_event)
+            self._waited_event = None
+        for event in events:
             if event.type == QUIT:
                 logging.info("Received QUIT event. Exiting.")
                 pygame.quit()
                 sys.exit()
+            if event.type in (VIDEOEXPOSE, WINDOWEXPOSED):
+                # The window was uncovered and may have lost what was on it.
+                self.renderer.invalidate()
+                continue
 
             if event.type == KEYDOWN and event.key == K_ESCAPE:
                 # Escape backs out of the rules overlay first, then to the menu.
@@ -245,10 +373,12 @@ class ChessApp:
         if rects["ai"].collidepoint(pos):
             self.game_mode = "ai"
             self.in_menu = False
+            self._finish_loading()
             self._play("move")
         elif rects["local"].collidepoint(pos):
             self.game_mode = "local"
             self.in_menu = False
+            self._finish_loading()
             self._play("move")
         elif rects["rules"].collidepoint(pos):
             self.in_menu = False
@@ -295,6 +425,8 @@ class ChessApp:
             self._undo()
         elif buttons["menu"].collidepoint(pos):
             self._return_to_menu()
+        elif buttons["stats"].collidepoint(pos) and self.game_mode == "ai":
+            self.show_search_stats = not self.show_search_stats
 
     def _handle_promotion_events(self, event: pygame.event.Event):
         if event.type != MOUSEBUTTONDOWN or event.button != 1:
@@ -325,7 +457,10 @@ class ChessApp:
         self._play("move")
 
     def _handle_game_events(self, event: pygame.event.Event):
-        if event.type == MOUSEBUTTONDOWN and event.button == 1:
+        if event.type == KEYDOWN and event.key == K_p:
+            self.show_perf = not self.show_perf
+
+        elif event.type == MOUSEBUTTONDOWN and event.button == 1:
             self._handle_mouse_down(event.pos)
 
         elif event.type == MOUSEMOTION and event.buttons[0]:
@@ -422,29 +557,10 @@ class ChessApp:
         if not self.state.make_move(start, end, promotion=promotion):
             return False
 
-        segments = []
-        if animate and mover is not None:
-            landed = self.state.board.get_piece(end)
-            # A spy dies converting, so slide the spy in rather than the piece
-            # it left behind on the square.
-            drawn = mover if self.state.last_move_kind == "convert" else landed or mover
-            segments.append((Piece(drawn.type, drawn.is_white), start, end))
-            if self.state.last_move_kind == "castle":
-                row = start[0]
-                rook_from = (row, 7 if end[1] > start[1] else 0)
-                rook_to = (row, end[1] - 1 if end[1] > start[1] else end[1] + 1)
-                segments.append(
-                    (Piece(PieceType.ROOK, mover.is_white), rook_from, rook_to)
-                )
-
-        self.anim = MoveAnimation(segments) if segments else None
-        if self.state.last_move_kind == "convert":
-            self.effect = SquareEffect(end)
-        if self.state.stalemate_skipped:
-            # The opponent had no legal move, so the house rule handed the turn
-            # straight back. Say so, or it reads as the same side moving twice.
-            side = "White" if self.state.is_white_turn else "Black"
-            self.notice = Notice(f"Stalemate - {side} moves again")
+        anim, effect, notice = move_visuals(self.state, mover, start, end)
+        self.anim = anim if animate else None
+        self.effect = effect or self.effect
+        self.notice = notice or self.notice
 
         sound = self._move_sound()
         if self.anim is not None:
@@ -475,38 +591,68 @@ class ChessApp:
         self._update_display()
         await asyncio.sleep(0)
 
+        started = time.perf_counter()
         try:
-            move = await ai.choose_move(self.state.board, False, self.difficulty)
+            # The search plays its moves out on a copy: the overlay repaints
+            # the board mid-search, which must not show them.
+            move, stats = await ai.think(
+                copy.deepcopy(self.state.board),
+                False,
+                self.difficulty,
+                on_stats=self._on_search_stats,
+            )
+            if stats is not None:
+                self.search_stats = stats
         except Exception:
             logging.exception("Computer move failed; falling back to no move")
             move = None
+        self.frame_stats.search_ms = (time.perf_counter() - started) * 1e3
 
         if move and not self.in_menu:
             self._play_move(move[0], move[1], promotion=PieceType.QUEEN)
 
         self.computer_thinking = False
 
+    def _on_search_stats(self, stats: ai.SearchStats):
+        self.search_stats = stats
+        now = pygame.time.get_ticks()
+        if self.show_search_stats and now - self._stats_painted >= STATS_REPAINT_MS:
+            self._stats_painted = now
+            self._update_display()
+            # Keep the window responsive; the events wait in the queue.
+            pygame.event.pump()
+
     # -------------------------------------------------------------- display
 
     def _update_display(self):
         if self.in_menu:
             self.renderer.render_menu(self.screen, self.difficulty)
-        elif self.in_rules:
+            pygame.display.flip()
+            return
+        if self.in_rules:
             self.renderer.render_rules(self.screen)
-        else:
-            self.renderer.render(
-                self.screen,
-                self.state,
-                game_mode=self.game_mode,
-                difficulty=self.difficulty,
-                thinking=self.computer_thinking,
-                promoting=self.pending_promotion is not None,
-                showing_rules=self.rules_overlay,
-                anim=self.anim,
-                effect=self.effect,
-                notice=self.notice,
-            )
-        pygame.display.flip()
+            pygame.display.flip()
+            return
+
+        # Only the parts of the window that changed are pushed; an idle frame
+        # pushes nothing at all.
+        changed = self.renderer.render(
+            self.screen,
+            self.state,
+            game_mode=self.game_mode,
+            difficulty=self.difficulty,
+            thinking=self.computer_thinking,
+            promoting=self.pending_promotion is not None,
+            showing_rules=self.rules_overlay,
+            anim=self.anim,
+            effect=self.effect,
+            notice=self.notice,
+            show_stats=self.show_search_stats,
+            search_stats=self.search_stats,
+            frame_stats=self.frame_stats if self.show_perf else None,
+        )
+        if changed:
+            pygame.display.update(changed)
 
     def _move_sound(self) -> str:
         """Name the sound the last move earned.
@@ -528,7 +674,21 @@ class ChessApp:
 
 
 async def main():
-    app = ChessApp()
+    startup = StartupTimer()
+    parser = argparse.ArgumentParser(description="Play Chess 2")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="time the hot paths; print a summary on exit, and write"
+        " flame graph stacks to FILE if given (or set CHESS2_PROFILE)",
+    )
+    # Unknown arguments are left alone: pygbag and pyinstaller pass their own.
+    args, _ = parser.parse_known_args()
+    profiling.configure(args.profile)
+
+    app = ChessApp(startup=startup)
     await app.run()
 
 
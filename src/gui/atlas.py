@@ -0,0 +1,159 @@
+"""The piece sprites, packed into one sheet.
+
+    python -m gui.atlas [--out assets/pieces.png]
+
+Every piece is drawn by rendering its glyph more than once and stamping an
+outline around it (plus a hat for the spy), which is too slow to do on the
+first frame that needs it: the opening frames and the first capture used to
+hitch. So all the variants the game uses are drawn up front into one sheet,
+and everything that shows a piece -- the board, animations, the promotion
+picker and the tray of captured pieces -- blits a piece of the sheet.
+
+The sheet can be saved as a PNG with a JSON index beside it, which later
+launches load instead of drawing. The index records a signature of what the
+sprites were drawn from (colours, sizes, font), so a stale sheet is noticed
+and drawn afresh instead of used.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+import pygame
+
+from core.piece import PieceType
+from utils import _resource_path
+
+ATLAS_VERSION = 1
+ATLAS_PATH = "assets/pieces.png"
+# Width of the sheet; sprites are laid out in rows up to it.
+SHEET_WIDTH = 512
+
+# (style, type, is_white, size): style is "outlined" for the board or "flat"
+# for lists.
+Sprite = Tuple[str, PieceType, bool, int]
+
+
+def index_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def signature(description: dict) -> str:
+    """A short hash of what the sprites are drawn from."""
+    text = json.dumps({"version": ATLAS_VERSION, **description}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class PieceAtlas:
+    def __init__(self, sheet: pygame.Surface, rects: Dict[Sprite, pygame.Rect]):
+        self.sheet = sheet
+        self.rects = rects
+        self._sprites = {key: sheet.subsurface(rect) for key, rect in rects.items()}
+
+    def get(self, key: Sprite) -> Optional[pygame.Surface]:
+        """The sprite, sharing the sheet's pixels; None if it is not on it."""
+        return self._sprites.get(key)
+
+    @classmethod
+    def pack(
+        cls, sprites: Dict[Sprite, pygame.Surface], width: int = SHEET_WIDTH
+    ) -> "PieceAtlas":
+        """Lay the sprites out in rows, tallest first, and copy them into a sheet."""
+        order = sorted(sprites, key=lambda key: -sprites[key].get_height())
+        rects = {}
+        x = y = row_height = 0
+        for key in order:
+            w, h = sprites[key].get_size()
+            if x and x + w > width:
+                x, y = 0, y + row_height
+                row_height = 0
+            rects[key] = pygame.Rect(x, y, w, h)
+            # A pixel apart, so no sprite can pick up its neighbour's edge.
+            x += w + 1
+            row_height = max(row_height, h + 1)
+
+        sheet = pygame.Surface((width, max(y + row_height, 1)), pygame.SRCALPHA)
+        for key, rect in rects.items():
+            sheet.blit(sprites[key], rect)
+        return cls(sheet, rects)
+
+    def save(self, path: str, sheet_signature: str):
+        pygame.image.save(self.sheet, path)
+        index = {
+            "version": ATLAS_VERSION,
+            "signature": sheet_signature,
+            "sprites": [
+                {
+                    "style": style,
+                    "type": piece_type.name,
+                    "white": is_white,
+                    "size": size,
+                    "rect": list(rect),
+                }
+                for (style, piece_type, is_white, size), rect in self.rects.items()
+            ],
+        }
+        with open(index_path(path), "w") as f:
+            json.dump(index, f, indent=1)
+
+    @classmethod
+    def load(cls, path: str, sheet_signature: str) -> Optional["PieceAtlas"]:
+        """The saved sheet, or None if it is missing, unreadable or stale."""
+        try:
+            with open(index_path(path)) as f:
+                index = json.load(f)
+            if (
+                index.get("version") != ATLAS_VERSION
+                or index.get("signature") != sheet_signature
+            ):
+                logging.info(f"{path} is out of date; drawing the pieces instead")
+                return None
+            sheet = pygame.image.load(path)
+            if pygame.display.get_surface() is not None:
+                sheet = sheet.convert_alpha()
+            rects = {
+                (
+                    sprite["style"],
+                    PieceType[sprite["type"]],
+                    sprite["white"],
+                    sprite["size"],
+                ): pygame.Rect(sprite["rect"])
+                for sprite in index["sprites"]
+            }
+            return cls(sheet, rects)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, pygame.error) as e:
+            logging.warning(f"Could not load the piece sheet {path}: {e}")
+            return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw the piece sprite sheet")
+    parser.add_argument("--out", default=_resource_path(ATLAS_PATH))
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    # No window: the sprites are drawn into memory.
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+    from gui.renderer import GUIRenderer
+
+    renderer = GUIRenderer()
+    atlas = renderer.draw_piece_atlas()
+    atlas.save(args.out, renderer.atlas_signature())
+    logging.info(
+        f"{len(atlas.rects)} sprites, {atlas.sheet.get_width()}x"
+        f"{atlas.sheet.get_height()}, written to {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""Headless renderer benchmark: frame times and surface allocations per scene.
+
+    python -m gui.bench [--frames 200] [--json] [--baseline render.json]
+
+Draws a script of typical scenes -- the menu, the opening position, a knight
+showing its twelve jumps, a piece in mid-slide, a long move list, the rules
+overlay and the game-over card -- into an offscreen window under SDL's dummy
+video driver, so it runs on a build box with no display or GPU. Each scene is
+drawn two ways:
+
+    full   everything redrawn, as after the window was covered
+    live   frame after frame as the game loop draws it, only what changed
+
+and reported as percentiles of milliseconds per frame, with how many surfaces
+a frame allocated on average and how long the scene's very first frame took,
+caches cold. Allocation counts do not depend on the machine: like the engine
+benchmark's node count, they change only when the renderer's behaviour does.
+
+--json prints the results as JSON. Saved, that is a baseline for a later run:
+--baseline compares against one, reports a median frame time that rose beyond
+--threshold percent and any scene allocating more, and exits non-zero for
+either.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+# pygame greets on stdout as it is imported, which would spoil --json.
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame  # noqa: E402
+
+import profiling  # noqa: E402
+from core.fen import board_from_fen  # noqa: E402
+from game.state import GameState  # noqa: E402
+from gui.renderer import (  # noqa: E402
+    WINDOW_HEIGHT,
+    WINDOW_WIDTH,
+    GUIRenderer,
+    MoveAnimation,
+)
+
+DEFAULT_FRAMES = 200
+# Frames drawn before timing starts, so the caches are as warm as in play.
+WARMUP_FRAMES = 10
+# Rise of a median frame time, in percent of the baseline, reported as a
+# regression. Frame times are short and wander more than the engine's NPS.
+DEFAULT_THRESHOLD = 10.0
+PERCENTILES = (50, 90, 99)
+
+# A middlegame with white's knight on d5, which has twelve squares to go to.
+KNIGHT_FEN = "rnbqk1nr/1ppp1p1s/7p/3N2p1/1p1PP1P1/6pP/PPPP3S/R1BQKB1R w KQkq - 0 8"
+KNIGHT_SQUARE = (3, 3)
+LONG_GAME_PLIES = 160
+SEED = 2
+# Positions a slide is drawn at, cycled through frame after frame.
+SLIDE_STEPS = 9
+
+# A scene is set up on a fresh renderer and returns how to draw frame i.
+Scene = Callable[[GUIRenderer, pygame.Surface], Callable[[int], object]]
+
+# Calls that return a new surface, counted by the allocation pass.
+# pygame.Surface itself is a type, which the profiling hook does not see, so
+# it is counted with a subclass instead.
+_ALLOCATING = {
+    "render",
+    "copy",
+    "convert",
+    "convert_alpha",
+    "subsurface",
+    "scale",
+    "smoothscale",
+    "rotate",
+    "rotozoom",
+}
+
+
+def _state_from_fen(fen: str) -> GameState:
+    state = GameState()
+    state.board, state.is_white_turn = board_from_fen(fen)
+    return state
+
+
+def _played(plies: int, seed: int = SEED) -> GameState:
+    """A game of random legal moves, up to `plies` long; the same every run."""
+    rng = random.Random(seed)
+    state = GameState()
+    while len(state.move_log) < plies and not state.game_over:
+        moves = state.board.legal_moves_for(state.is_white_turn)
+        if not moves:
+            break
+        state.make_move(*rng.choice(sorted(moves)))
+    return state
+
+
+def _menu(renderer: GUIRenderer, screen: pygame.Surface):
+    return lambda i: renderer.render_menu(screen, "medium")
+
+
+def _opening(renderer: GUIRenderer, screen: pygame.Surface):
+    state = GameState()
+    return lambda i: renderer.render(screen, state)
+
+
+def _knight(renderer: GUIRenderer, screen: pygame.Surface):
+    state = _state_from_fen(KNIGHT_FEN)
+    targets = state.get_legal_moves(KNIGHT_SQUARE)
+
+    def frame(i: int):
+        # Picked up and put down again, as a player weighing the move does.
+        if i % 2 == 0:
+            state.selected_piece, state.possible_moves = KNIGHT_SQUARE, targets
+        else:
+            state.selected_piece, state.possible_moves = None, set()
+        return renderer.render(screen, state)
+
+    return frame
+
+
+def _sliding(renderer: GUIRenderer, screen: pygame.Surface):
+    state = _state_from_fen(KNIGHT_FEN)
+    start, end = KNIGHT_SQUARE, (1, 4)
+    state.make_move(start, end)
+    anim = MoveAnimation([(state.board.get_piece(end), start, end)])
+
+    def frame(i: int):
+        # Wind the clock to a fixed point of the slide, never its end.
+        step = i % SLIDE_STEPS + 1
+        anim.start_ms = pygame.time.get_ticks() - anim.duration * step // (
+            SLIDE_STEPS + 1
+        )
+        return renderer.render(screen, state, anim=anim)
+
+    return frame
+
+
+def _move_list(renderer: GUIRenderer, screen: pygame.Surface):
+    state = _played(LONG_GAME_PLIES)
+    return lambda i: renderer.render(screen, state)
+
+
+def _rules_overlay(renderer: GUIRenderer, screen: pygame.Surface):
+    state = _played(20)
+    return lambda i: renderer.render(screen, state, showing_rules=True)
+
+
+def _game_over(renderer: GUIRenderer, screen: pygame.Surface):
+    state = _played(40)
+    state.game_over = True
+    state.game_result = "white_wins"
+    return lambda i: renderer.render(screen, state)
+
+
+SCENES: Dict[str, Scene] = {
+    "menu": _menu,
+    "opening": _opening,
+    "knight": _knight,
+    "sliding": _sliding,
+    "move list": _move_list,
+    "rules overlay": _rules_overlay,
+    "game over": _game_over,
+}
+
+
+class _AllocationCounter:
+    """Counts the surfaces made while it is on."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        counter = self
+        self._surface = pygame.Surface
+
+        class CountedSurface(self._surface):
+            def __init__(self, *args, **kwargs):
+                counter.count += 1
+                super().__init__(*args, **kwargs)
+
+        pygame.Surface = CountedSurface
+        sys.setprofile(self._hook)
+        return self
+
+    def __exit__(self, *exc):
+        sys.setprofile(None)
+        pygame.Surface = self._surface
+
+    def _hook(self, frame, event, func):
+        if event != "c_call" or func.__name__ not in _ALLOCATING:
+            return
+        owner = getattr(func, "__self__", None)
+        if owner is pygame.transform or isinstance(
+            owner, (self._surface, pygame.font.Font)
+        ):
+            self.count += 1
+
+
+def _percentiles(frame_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(frame_ms)
+    summary = {
+        f"p{p}": round(ordered[min(len(ordered) - 1, len(ordered) * p // 100)], 3)
+        for p in PERCENTILES
+    }
+    summary["max"] = round(ordered[-1], 3)
+    return summary
+
+
+def _measure(
+    renderer: GUIRenderer, frame: Callable[[int], object], frames: int, full: bool
+) -> Dict[str, float]:
+    def draw(i: int):
+        if full:
+            renderer.invalidate()
+        frame(i)
+
+    for i in range(WARMUP_FRAMES):
+        draw(i)
+    frame_ms = []
+    for i in range(frames):
+        started = time.perf_counter()
+        draw(i)
+        frame_ms.append((time.perf_counter() - started) * 1e3)
+    # Counted apart from the timing: the hook slows every call down.
+    with _AllocationCounter() as allocations:
+        for i in range(frames):
+            draw(i)
+    return {
+        **_percentiles(frame_ms),
+        "surfaces": round(allocations.count / frames, 2),
+    }
+
+
+def run(frames: int = DEFAULT_FRAMES, scenes: Optional[List[str]] = None) -> dict:
+    """Draw every scene (or those named) and return the results."""
+    # Set before the display starts; a display already open is used as it is.
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+
+    results = {}
+    for name in scenes or SCENES:
+        # A fresh renderer each, so no scene is drawn from another's caches.
+        renderer = GUIRenderer(WINDOW_WIDTH, WINDOW_HEIGHT)
+        frame = SCENES[name](renderer, screen)
+        started = time.perf_counter()
+        frame(0)
+        first_ms = (time.perf_counter() - started) * 1e3
+        results[name] = {
+            "first_ms": round(first_ms, 3),
+            "full": _measure(renderer, frame, frames, full=True),
+            "live": _measure(renderer, frame, frames, full=False),
+        }
+    return {
+        "frames": frames,
+        "driver": pygame.display.get_driver(),
+        "scenes": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """What got worse since the baseline, as lines of text; empty if nothing."""
+    if report["frames"] != baseline.get("frames"):
+        return [f"Baseline was run with {baseline.get('frames')} frames a scene"]
+
+    problems = []
+    for name, scene in report["scenes"].items():
+        old = baseline["scenes"].get(name)
+        if old is None:
+            continue
+        for mode in ("full", "live"):
+            now, before = scene[mode], old[mode]
+            if now["surfaces"] > before["surfaces"]:
+                problems.append(
+                    f"{name} ({mode}) allocates more: {before['surfaces']}"
+                    f" -> {now['surfaces']} surfaces a frame"
+                )
+            if before["p50"] > 0:
+                change = (now["p50"] - before["p50"]) / before["p50"] * 100
+                if change > threshold:
+                    problems.append(
+                        f"{name} ({mode}) slowed {change:.1f}%: median"
+                        f" {before['p50']} -> {now['p50']} ms"
+                    )
+    return problems
+
+
+def _print_report(report: dict):
+    stats = [f"p{p}" for p in PERCENTILES] + ["surfaces"]
+    width = 9 * len(stats)
+    print(f"{'':<14}{'first':>8}  {'full frames':^{width}}  {'live frames':^{width}}")
+    header = "".join(f"{stat:>9}" for stat in stats)
+    print(f"{'scene':<14}{'ms':>8}  {header}  {header}")
+    for name, scene in report["scenes"].items():
+        full, live = (
+            "".join(f"{scene[mode][stat]:>9.2f}" for stat in stats)
+            for mode in ("full", "live")
+        )
+        print(f"{name:<14}{scene['first_ms']:>8.1f}  {full}  {live}")
+    print(f"{report['frames']} frames a scene, video driver {report['driver']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Chess 2 renderer")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES)
+    parser.add_argument(
+        "--scene", action="append", choices=list(SCENES), help="draw only these"
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="rise of a median frame time in percent reported as a regression",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="time each step of drawing too (see profiling); slows frames down",
+    )
+    args = parser.parse_args()
+    profiling.configure(args.profile)
+
+    report = run(args.frames, args.scene)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.threshold)
+        for line in problems:
+            print(line, file=sys.stderr)
+        if problems:
+            sys.exit(1)
+        print("No change in allocations or speed beyond the threshold", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
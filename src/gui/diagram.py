@@ -0,0 +1,304 @@
+"""Board diagrams for puzzles and write-ups, drawn headless and saved as PNGs.
+
+    python -m gui.diagram diagrams.txt --out diagrams/ [--size 400] [--workers 4]
+
+Each line of the input (or of stdin, given '-') is one diagram, written in
+the words of the engine's `position` command with a few more of its own:
+
+    [name:] startpos|fen <FEN> [moves e2e4 ...] [highlight d5 ...] [arrow g1f3 ...]
+
+A bare FEN is a line too, and blank lines and lines starting with '#' are
+skipped. `moves` makes a game record of the line: the moves are played from
+the position through GameState, house rules and all, and the diagram shows
+where they lead, with the last one marked as in the game. With --every-move
+it shows every position along the way instead, one file per ply.
+
+Diagrams are drawn by GUIRenderer.render_diagram, so they look exactly like
+the game's board, onto an offscreen surface under SDL's dummy video driver.
+The work is shared out in batches over a pool of processes, each keeping one
+renderer, so the piece sheet is loaded once per process, not per diagram.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, replace
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import pygame
+
+from core.fen import START_FEN, board_from_fen
+from game import uci
+from game.state import GameState
+from gui.renderer import GUIRenderer
+
+DEFAULT_SIZE = 400
+# Diagrams handed to a worker at a time: enough to outweigh the cost of
+# shipping them there, few enough that the workers finish together.
+BATCH_SIZE = 64
+
+_KEYWORDS = ("startpos", "fen", "moves", "highlight", "arrow")
+
+# The renderer of a worker process, made once by _init_worker.
+_RENDERER: Optional[GUIRenderer] = None
+
+
+@dataclass(frozen=True)
+class Diagram:
+    """One diagram to draw; squares and moves in coordinate notation."""
+
+    name: str
+    fen: str = START_FEN
+    moves: Tuple[str, ...] = ()
+    highlights: Tuple[str, ...] = ()
+    arrows: Tuple[str, ...] = ()
+
+
+def parse_line(line: str, name: str) -> Optional[Diagram]:
+    """The diagram a line describes, or None for a blank line or a comment.
+
+    `name` is used when the line does not name the diagram itself. Raises
+    ValueError for anything malformed; moves are checked when it is drawn.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    head, colon, rest = line.partition(":")
+    # A FEN has no colons, so a colon can only end a name.
+    if colon and " " not in head.strip():
+        name, line = head.strip(), rest.strip()
+
+    words = line.split()
+    if words and words[0] not in _KEYWORDS:
+        words = ["fen"] + words
+    parts = {keyword: [] for keyword in _KEYWORDS}
+    current = None
+    for word in words:
+        if word in _KEYWORDS:
+            current = word
+        elif current in (None, "startpos"):
+            raise ValueError(f"Unexpected {word!r}")
+        else:
+            parts[current].append(word)
+
+    fen = " ".join(parts["fen"]) or START_FEN
+    board_from_fen(fen)  # fails here rather than in a worker
+    for square in parts["highlight"]:
+        uci.parse_square(square)
+    for move in parts["arrow"]:
+        uci.parse_move(move)
+    return Diagram(
+        name,
+        fen,
+        tuple(parts["moves"]),
+        tuple(parts["highlight"]),
+        tuple(parts["arrow"]),
+    )
+
+
+def read_diagrams(
+    lines: Iterable[str], every_move: bool = False
+) -> Iterator[Tuple[Optional[Diagram], Optional[str]]]:
+    """(diagram, None) for each diagram in the lines, (None, error) for a bad one.
+
+    Read lazily, so a file of any length is never held in memory at once.
+    """
+    for number, line in enumerate(lines, 1):
+        try:
+            diagram = parse_line(line, f"diagram-{number:05d}")
+        except ValueError as e:
+            yield None, f"line {number}: {e}"
+            continue
+        if diagram is None:
+            continue
+        if every_move and diagram.moves:
+            for ply in range(len(diagram.moves) + 1):
+                step = replace(
+                    diagram, name=f"{diagram.name}-{ply:03d}", moves=diagram.moves[:ply]
+                )
+                yield step, None
+        else:
+            yield diagram, None
+
+
+def game_state(diagram: Diagram) -> GameState:
+    """The position a diagram shows; ValueError if a move cannot be played."""
+    state = GameState()
+    state.board, state.is_white_turn = board_from_fen(diagram.fen)
+    for text in diagram.moves:
+        move, promotion = uci.parse_move(text)
+        if state.game_over or move[1] not in state.get_legal_moves(move[0]):
+            raise ValueError(f"Illegal move {text}")
+        state.make_move(*move, promotion)
+    return state
+
+
+def open_renderer() -> GUIRenderer:
+    """A renderer drawing offscreen, with no window shown."""
+    # Set before the display starts; a display already open is used as it is.
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    if pygame.display.get_surface() is None:
+        # Converting the loaded images needs a display mode, if only a tiny one.
+        pygame.display.set_mode((1, 1))
+    return GUIRenderer()
+
+
+def draw(
+    renderer: GUIRenderer, diagram: Diagram, size: int = DEFAULT_SIZE
+) -> pygame.Surface:
+    """The diagram on a surface `size` pixels square."""
+    state = game_state(diagram)
+    board = pygame.Surface((renderer.board_size, renderer.board_size))
+    renderer.render_diagram(
+        board,
+        state,
+        [uci.parse_square(square) for square in diagram.highlights],
+        [uci.parse_move(move)[0] for move in diagram.arrows],
+    )
+    if size == renderer.board_size:
+        return board
+    return pygame.transform.smoothscale(board, (size, size))
+
+
+def _export(
+    renderer: GUIRenderer, diagrams: List[Diagram], out_dir: str, size: int
+) -> List[Tuple[str, Optional[str]]]:
+    """Draw and save each diagram: (name, error or None) for each."""
+    results = []
+    for diagram in diagrams:
+        try:
+            surface = draw(renderer, diagram, size)
+            pygame.image.save(surface, os.path.join(out_dir, diagram.name + ".png"))
+        except (ValueError, OSError, pygame.error) as e:
+            results.append((diagram.name, str(e)))
+        else:
+            results.append((diagram.name, None))
+    return results
+
+
+def _init_worker():
+    global _RENDERER
+    _RENDERER = open_renderer()
+
+
+def _export_batch(
+    diagrams: List[Diagram], out_dir: str, size: int
+) -> List[Tuple[str, Optional[str]]]:
+    return _export(_RENDERER, diagrams, out_dir, size)
+
+
+def _batches(
+    items: Iterable[Tuple[Optional[Diagram], Optional[str]]], errors: List[str]
+) -> Iterator[List[Diagram]]:
+    batch = []
+    for diagram, error in items:
+        if error is not None:
+            errors.append(error)
+            continue
+        batch.append(diagram)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export(
+    items: Iterable[Tuple[Optional[Diagram], Optional[str]]],
+    out_dir: str,
+    size: int = DEFAULT_SIZE,
+    workers: int = 1,
+) -> dict:
+    """Draw the diagrams from read_diagrams into `out_dir` and report.
+
+    With more than one worker they are drawn by a process pool, a few
+    batches ahead of the reader at most, so any number can be exported.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    errors: List[str] = []
+    written = 0
+    started = time.perf_counter()
+
+    def tally(results: List[Tuple[str, Optional[str]]]):
+        nonlocal written
+        for name, error in results:
+            if error is None:
+                written += 1
+            else:
+                errors.append(f"{name}: {error}")
+
+    batches = _batches(items, errors)
+    if workers <= 1:
+        renderer = open_renderer()
+        for batch in batches:
+            tally(_export(renderer, batch, out_dir, size))
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            workers, mp_context=context, initializer=_init_worker
+        ) as pool:
+            pending = set()
+            for batch in batches:
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        tally(future.result())
+                pending.add(pool.submit(_export_batch, batch, out_dir, size))
+            for future in pending:
+                tally(future.result())
+
+    seconds = time.perf_counter() - started
+    return {
+        "written": written,
+        "errors": errors,
+        "seconds": round(seconds, 2),
+        "per_second": round(written / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw Chess 2 board diagrams")
+    parser.add_argument("input", help="one diagram per line; '-' for stdin")
+    parser.add_argument("--out", default="diagrams", help="directory for the PNGs")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="pixels")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="processes"
+    )
+    parser.add_argument(
+        "--every-move",
+        action="store_true",
+        help="for lines with moves, a diagram of every position along the way",
+    )
+    args = parser.parse_args()
+    if args.size < 1:
+        parser.error("--size must be positive")
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    try:
+        lines = sys.stdin if args.input == "-" else open(args.input)
+    except OSError as e:
+        parser.error(f"Cannot read {args.input}: {e}")
+    with lines:
+        report = export(
+            read_diagrams(lines, args.every_move), args.out, args.size, args.workers
+        )
+
+    for error in report["errors"]:
+        logging.error(error)
+    logging.info(
+        f"{report['written']} diagrams written to {args.out} in"
+        f" {report['seconds']}s ({report['per_second']}/s)"
+    )
+    if report["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""A small streaming GIF writer, for exported replays (see gui.replay).
+
+pygame reads GIFs but cannot write them, and the game depends on nothing
+else, so this writes them itself. Frames are written as they come: only the
+last one is held back, in case the next is the same picture and it just has
+to be shown for longer. Each frame covers only the part of the picture that
+changed since the one before, left in place by the frames after it, with a
+palette of its own -- exact when the part has 256 colours or fewer, cut down
+to 256 by median cut when it has more.
+"""
+
+from array import array
+from collections import Counter
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import pygame
+
+# Largest code the LZW compressor may use, and the data sub-block size.
+_MAX_CODE = 4096
+_BLOCK = 255
+
+
+class GifWriter:
+    """Writes frames of one size to `f`, looping for ever unless `loop` says."""
+
+    def __init__(self, f: BinaryIO, size: Tuple[int, int], loop: int = 0):
+        self.f = f
+        self.size = size
+        self.frames = 0
+        self._previous: Optional[pygame.Surface] = None
+        # The last frame added, not yet written: (its image data, delay).
+        self._pending: Optional[Tuple[bytes, int]] = None
+        width, height = size
+        # Header and logical screen, with no global colour table.
+        f.write(b"GIF89a" + _u16(width) + _u16(height) + bytes((0, 0, 0)))
+        # Loop count, in the extension browsers understand.
+        f.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + _u16(loop) + b"\x00")
+
+    def add(self, frame: pygame.Surface, duration_ms: int, area=None):
+        """Show `frame` for `duration_ms`.
+
+        `area` is where it may differ from the frame before, if that is known,
+        e.g. the rects a renderer drew; anything outside it is not looked at.
+        """
+        if self._previous is None:
+            changed = pygame.Rect((0, 0), self.size)
+        else:
+            bounds = pygame.Rect((0, 0), self.size)
+            area = bounds if area is None else pygame.Rect(area).clip(bounds)
+            changed = changed_rect(self._previous, frame, area)
+        if changed is None:
+            # The same picture again: show the last one for longer instead.
+            data, delay = self._pending
+            self._pending = (data, delay + duration_ms)
+            return
+
+        self._flush()
+        image = _image(frame.subsurface(changed), changed.topleft)
+        self._pending = (image, duration_ms)
+        if self._previous is None:
+            self._previous = frame.copy()
+        else:
+            self._previous.blit(frame, changed, changed)
+        self.frames += 1
+
+    def close(self):
+        self._flush()
+        self.f.write(b"\x3b")
+
+    def _flush(self):
+        if self._pending is None:
+            return
+        data, delay = self._pending
+        # Graphic control: leave the frame in place, show it for `delay`. GIF
+        # delays are in hundredths of a second.
+        centiseconds = max(1, round(delay / 10))
+        self.f.write(b"\x21\xf9\x04\x04" + _u16(centiseconds) + b"\x00\x00")
+        self.f.write(data)
+        self._pending = None
+
+
+def _u16(value: int) -> bytes:
+    return value.to_bytes(2, "little")
+
+
+def changed_rect(
+    before: pygame.Surface, after: pygame.Surface, area: pygame.Rect
+) -> Optional[pygame.Rect]:
+    """The smallest rect within `area` holding every changed pixel; None if none."""
+    if not area.width or not area.height:
+        return None
+    old = pygame.image.tobytes(before.subsurface(area), "RGB")
+    new = pygame.image.tobytes(after.subsurface(area), "RGB")
+    if old == new:
+        return None
+    stride = area.width * 3
+    top = bottom = None
+    left, right = area.width, 0
+    for y in range(area.height):
+        row = slice(y * stride, (y + 1) * stride)
+        a, b = old[row], new[row]
+        if a == b:
+            continue
+        if top is None:
+            top = y
+        bottom = y + 1
+        left = min(left, _common_prefix(a, b) // 3)
+        right = max(right, area.width - _common_prefix(a[::-1], b[::-1]) // 3)
+    return pygame.Rect(area.x + left, area.y + top, right - left, bottom - top)
+
+
+def _common_prefix(a: bytes, b: bytes) -> int:
+    """How many leading bytes two different strings share."""
+    # Halving with slice comparisons, which run in C, beats a loop per byte.
+    low, high = 0, len(a)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _image(surface: pygame.Surface, position: Tuple[int, int]) -> bytes:
+    """Image descriptor, local colour table and compressed pixels of a frame."""
+    width, height = surface.get_size()
+    pixels = array("I", pygame.image.tobytes(surface, "RGBX"))
+    palette, index = _palette(Counter(pixels))
+    bits = max(1, (len(palette) - 1).bit_length())
+    table = b"".join(
+        bytes((colour & 255, colour >> 8 & 255, colour >> 16 & 255))
+        for colour in palette
+    )
+    table += b"\x00" * (3 * (1 << bits) - len(table))
+    min_code_size = max(2, bits)
+    data = _lzw(bytes(map(index.__getitem__, pixels)), min_code_size)
+    return (
+        b"\x2c"
+        + _u16(position[0])
+        + _u16(position[1])
+        + _u16(width)
+        + _u16(height)
+        + bytes((0x80 | (bits - 1),))
+        + table
+        + bytes((min_code_size,))
+        + b"".join(
+            bytes((len(data[i : i + _BLOCK]),)) + data[i : i + _BLOCK]
+            for i in range(0, len(data), _BLOCK)
+        )
+        + b"\x00"
+    )
+
+
+def _palette(counts: Counter) -> Tuple[List[int], Dict[int, int]]:
+    """Up to 256 colours for the pixels, and each pixel colour's entry.
+
+    Exact if there are few enough colours; otherwise the colours are split
+    by median cut, weighted by how many pixels have them, and each box is
+    represented by its weighted average.
+    """
+    if len(counts) <= 256:
+        palette = list(counts)
+        return palette, {colour: i for i, colour in enumerate(palette)}
+
+    boxes = [list(counts)]
+    while len(boxes) < 256:
+        # Split the box spanning the widest range of one channel.
+        best = None
+        for i, box in enumerate(boxes):
+            if len(box) < 2:
+                continue
+            for shift in (0, 8, 16):
+                channel = [colour >> shift & 255 for colour in box]
+                spread = max(channel) - min(channel)
+                if best is None or spread > best[0]:
+                    best = (spread, i, shift)
+        if best is None or best[0] == 0:
+            break
+        _, i, shift = best
+        box = sorted(boxes[i], key=lambda colour: colour >> shift & 255)
+        half = sum(counts[colour] for colour in box) / 2
+        seen = 0
+        for cut, colour in enumerate(box[:-1], 1):
+            seen += counts[colour]
+            if seen >= half:
+                break
+        boxes[i : i + 1] = [box[:cut], box[cut:]]
+
+    palette = []
+    index = {}
+    for i, box in enumerate(boxes):
+        total = sum(counts[colour] for colour in box)
+        average = [
+            round(
+                sum((colour >> shift & 255) * counts[colour] for colour in box) / total
+            )
+            for shift in (0, 8, 16)
+        ]
+        palette.append(average[0] | average[1] << 8 | average[2] << 16)
+        for colour in box:
+            index[colour] = i
+    return palette, index
+
+
+def _lzw(indices: bytes, min_code_size: int) -> bytes:
+    """GIF's variable-width LZW, as the classic compress-derived encoders do it."""
+    clear = 1 << min_code_size
+    end = clear + 1
+    code_size = min_code_size + 1
+    max_code = (1 << code_size) - 1
+    next_code = end + 1
+    table: Dict[int, int] = {}
+    out = bytearray()
+    bits = 0
+    count = 0
+    resetting = False
+
+    def emit(code: int):
+        nonlocal bits, count, code_size, max_code, resetting
+        bits |= code << count
+        count += code_size
+        while count >= 8:
+            out.append(bits & 255)
+            bits >>= 8
+            count -= 8
+        # The decoder widens its codes one step behind the table, so the
+        # width changes after the code that filled it, not before.
+        if resetting:
+            code_size = min_code_size + 1
+            max_code = (1 << code_size) - 1
+            resetting = False
+        elif next_code > max_code:
+            code_size += 1
+            max_code = _MAX_CODE if code_size == 12 else (1 << code_size) - 1
+
+    emit(clear)
+    prefix = indices[0]
+    for symbol in indices[1:]:
+        key = prefix << 8 | symbol
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        emit(prefix)
+        prefix = symbol
+        if next_code < _MAX_CODE:
+            table[key] = next_code
+            next_code += 1
+        else:
+            table.clear()
+            next_code = end + 1
+            resetting = True
+            emit(clear)
+    emit(prefix)
+    emit(end)
+    if count:
+        out.append(bits & 255)
+    return bytes(out)
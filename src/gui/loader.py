@@ -0,0 +1,94 @@
+"""Startup in stages, so the menu is on screen before everything is loaded.
+
+The menu needs its backdrop and a handful of fonts; the game needs more fonts,
+the piece sheet and the sounds. Loading it all before the first frame kept a
+blank window up for longest in the browser, where every file comes out of
+pygbag's virtual filesystem. So only what the menu needs is loaded up front
+and the rest is queued here, and run a few steps at a time between frames
+while the player reads the menu.
+
+Each stage is timed, and the times are logged once everything is in.
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+
+class StartupTimer:
+    """How long each stage of startup took, and when it was done."""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = time.perf_counter() if started is None else started
+        # (stage, milliseconds it took, milliseconds since the start when done)
+        self.stages: List[Tuple[str, float, float]] = []
+        self._last = self.started
+
+    def mark(self, stage: str):
+        """Record a stage that ran since the previous mark."""
+        now = time.perf_counter()
+        self.stages.append(
+            (stage, (now - self._last) * 1e3, (now - self.started) * 1e3)
+        )
+        self._last = now
+
+    def record(self, stage: str, took_ms: float):
+        """Record a stage that was timed on its own, e.g. between frames."""
+        now = time.perf_counter()
+        self.stages.append((stage, took_ms, (now - self.started) * 1e3))
+        self._last = now
+
+    def elapsed_ms(self, stage: str) -> Optional[float]:
+        """Milliseconds from the start until `stage` was done; None if not yet."""
+        for name, _, at in self.stages:
+            if name == stage:
+                return at
+        return None
+
+    def report(self) -> str:
+        lines = [f"{'ms':>8} {'at ms':>8}  stage"]
+        for stage, took, at in self.stages:
+            lines.append(f"{took:>8.1f} {at:>8.1f}  {stage}")
+        return "\n".join(lines)
+
+
+class StagedLoader:
+    """Loading steps, run a few at a time within a budget per frame."""
+
+    def __init__(self, timer: StartupTimer):
+        self.timer = timer
+        self._steps: Deque[Tuple[str, Callable[[], object]]] = deque()
+
+    def add(self, stage: str, step: Callable[[], object]):
+        self._steps.append((stage, step))
+
+    @property
+    def done(self) -> bool:
+        return not self._steps
+
+    def run(self, budget_ms: float) -> bool:
+        """Run steps until `budget_ms` is spent; True once nothing is left.
+
+        At least one step runs, however long it takes, so loading always
+        moves on.
+        """
+        deadline = time.perf_counter() + budget_ms / 1e3
+        while self._steps:
+            self._run_step()
+            if time.perf_counter() >= deadline:
+                break
+        return self.done
+
+    def finish(self):
+        """Run everything left, e.g. when the game it was loading for starts."""
+        if self._steps:
+            logging.info(f"Loading the last {len(self._steps)} startup steps now")
+        while self._steps:
+            self._run_step()
+
+    def _run_step(self):
+        stage, step = self._steps.popleft()
+        started = time.perf_counter()
+        step()
+        self.timer.record(stage, (time.perf_counter() - started) * 1e3)
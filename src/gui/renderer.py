@@ -1,9 +1,16 @@
-from typing import Dict, List, Optional, Set, Tuple
+import io
+import os
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 import pygame
 
 from core.piece import Piece, PieceType
+from game.ai import SearchStats
 from game.state import PROMOTION_CHOICES, GameState
+from gui import atlas
+from gui.atlas import PieceAtlas, Sprite
 from utils import _resource_path
 
 # The board is square; the panel beside it holds the move list and buttons.
@@ -14,6 +21,21 @@ WINDOW_HEIGHT = BOARD_SIZE
 
 DIFFICULTY_LABELS = (("easy", "Easy"), ("medium", "Medium"), ("hard", "Hard"))
 
+SERIF_FONT = "assets/FreeSerif.ttf"
+
+# Glyph sizes of the pieces on the board and in the tray of captured pieces.
+PIECE_FONT_SIZE = 72
+TRAY_PIECE_SIZE = 30
+# The tray's flat silhouettes, in two panel tones: white's, black's.
+FLAT_PIECE_COLOURS = {True: (232, 222, 202), False: (132, 110, 86)}
+# Every sprite the game draws, drawn up front into the piece sheet.
+ATLAS_SPRITES: List[Sprite] = [
+    (style, piece_type, is_white, size)
+    for style, size in (("outlined", PIECE_FONT_SIZE), ("flat", TRAY_PIECE_SIZE))
+    for piece_type in PieceType
+    for is_white in (True, False)
+]
+
 TAGLINE = "A balance patch, a hundred years overdue"
 
 # The menu is set over a soft painted backdrop, so it borrows the language of an
@@ -38,6 +60,17 @@ SHORT_RULES = (
     "No en passant",
 )
 
+# The steps of drawing a game frame, as timed for the performance overlay.
+RENDER_PHASES = ("board", "highlights", "pieces", "panel", "overlays")
+# Frames in the overlay's sparkline, about two seconds at full speed.
+PERF_SAMPLES = 120
+# Rendered move-list rows kept for reuse; a long game needs a few hundred.
+MOVE_ROW_CACHE = 1024
+# Rendered strings kept for reuse. Enough for every screen's text at once, so
+# switching between them does not push anything out.
+TEXT_CACHE = 512
+TRACKED_CACHE = 128
+
 FULL_RULES = (
     "• Knights can now jump in all directions, because real horses stopped using L-shaped movement centuries ago.",
     "• Stalemate is no longer a draw. If you can't move, that's a you problem and your opponent gets another turn.",
@@ -53,6 +86,46 @@ def _lighten(colour, amount: int):
     return tuple(min(255, channel + amount) for channel in colour)
 
 
+# The serif's bytes, read once: every size is opened from them rather than from
+# the file, which in the browser means one read of the virtual filesystem
+# instead of one per size.
+_FONT_DATA: Optional[bytes] = None
+
+
+def _font_data() -> bytes:
+    global _FONT_DATA
+    if _FONT_DATA is None:
+        with open(_resource_path(SERIF_FONT), "rb") as f:
+            _FONT_DATA = f.read()
+    return _FONT_DATA
+
+
+class _Font:
+    """A renderer font, opened the first time it is used.
+
+    The menu needs only a few of the sizes, so the rest are left for the
+    startup loader (see GUIRenderer.loading_steps) or for whatever draws with
+    them first. Once opened, the font replaces this on the renderer itself, so
+    later uses cost nothing extra.
+    """
+
+    def __init__(self, size: int, bold: bool = False, italic: bool = False):
+        self.size = size
+        self.bold = bold
+        self.italic = italic
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, renderer, owner=None):
+        if renderer is None:
+            return self
+        font = renderer._load_font(self.size, self.bold)
+        font.set_italic(self.italic)
+        vars(renderer)[self.name] = font
+        return font
+
+
 class GUIRenderer:
     COLORS = {
         "background": (255, 255, 255),
@@ -86,44 +159,79 @@ class GUIRenderer:
         # Cool tone for the spy's conversions: the one thing on the board that
         # is neither a quiet move nor a capture, so it gets its own hue.
         "convert": (86, 132, 130),
+        # Arrows in exported diagrams: green, which no highlight in the game
+        # uses, so a marked idea never reads as a move that was played.
+        "arrow": (62, 128, 84),
     }
 
+    # Everything is set in the bundled serif rather than pygame's built-in
+    # freesansbold, which looks generic next to the painted backdrop.
+    font = _Font(PIECE_FONT_SIZE)  # chess glyphs
+    game_over_font = _Font(64, bold=True)
+    heading_font = _Font(34, bold=True)
+    info_font = _Font(32)
+    body_font = _Font(25)
+    small_font = _Font(25)
+    # Panel lists and board coordinates. All in the same serif: pygame's
+    # built-in face renders unevenly at these sizes and looked like a
+    # different program next to the rest of the interface.
+    list_font = _Font(23)
+    label_font = _Font(20)
+    # The menu has its own type: unbolded, so that tracking rather than
+    # weight does the work of looking deliberate.
+    menu_title_font = _Font(94)
+    menu_label_font = _Font(29)
+    menu_word_font = _Font(26)
+    menu_small_font = _Font(23)
+    rules_title_font = _Font(66)
+    menu_tagline_font = _Font(24, italic=True)
+
     def __init__(self, screen_width: int = WINDOW_WIDTH, screen_height: int = WINDOW_HEIGHT):
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.board_size = min(screen_height, screen_width - PANEL_WIDTH)
         self.square_size = self.board_size // 8
 
-        # Everything is set in the bundled serif rather than pygame's built-in
-        # freesansbold, which looks generic next to the painted backdrop.
-        self.font = self._load_font(72)  # chess glyphs
-        self.game_over_font = self._load_font(64, bold=True)
-        self.heading_font = self._load_font(34, bold=True)
-        self.info_font = self._load_font(32)
-        self.body_font = self._load_font(25)
-        self.small_font = self._load_font(25)
-        # Panel lists and board coordinates. All in the same serif: pygame's
-        # built-in face renders unevenly at these sizes and looked like a
-        # different program next to the rest of the interface.
-        self.list_font = self._load_font(23)
-        self.label_font = self._load_font(20)
-        # The menu has its own type: unbolded, so that tracking rather than
-        # weight does the work of looking deliberate.
-        self.menu_title_font = self._load_font(94)
-        self.menu_label_font = self._load_font(29)
-        self.menu_word_font = self._load_font(26)
-        self.menu_small_font = self._load_font(23)
-        self.rules_title_font = self._load_font(66)
-        self.menu_tagline_font = self._load_font(24)
-        self.menu_tagline_font.set_italic(True)
-
         self.menu_background = self._load_menu_background()
         self._menu_scrim = None
-        self._tracked_cache = {}
+        self._text_cache = LRUCache(TEXT_CACHE)
+        self._tracked_cache = LRUCache(TRACKED_CACHE)
         # Pieces are redrawn every frame; rendering the glyph and its outline
-        # each time is wasteful, so cache one surface per (type, colour, size).
+        # each time is wasteful. They come from the piece sheet, loaded (or
+        # drawn) while the menu is up so the first game frames do not hitch;
+        # a size not on the sheet is drawn when first needed and kept here.
         self._piece_cache = {}
         self._piece_fonts = {}
+        self._atlas: Optional[PieceAtlas] = None
+        # Translucent tints, rings and scrims, drawn once (see _overlay).
+        self._overlay_cache: Dict[tuple, pygame.Surface] = {}
+        # [hits, misses] of the caches, for the performance overlay.
+        self.cache_counts = {
+            "pieces": [0, 0],
+            "text": self._text_cache.counts,
+            "tracked": self._tracked_cache.counts,
+        }
+        # Milliseconds each step of the last game frame took.
+        self.phase_ms = dict.fromkeys(RENDER_PHASES, 0.0)
+        # The squares, shadow and coordinates never change, so they are drawn
+        # once into this and blitted as one.
+        self._board_layer: Optional[pygame.Surface] = None
+        # The same without the panel's shadow, for diagrams; and the surface
+        # their arrows are drawn on before being laid over the board.
+        self._diagram_layer: Optional[pygame.Surface] = None
+        self._arrow_layer: Optional[pygame.Surface] = None
+        # What the last game frame was drawn from (see render), and where the
+        # performance overlay went; None until a frame is on the screen.
+        self._frame_keys: Optional[tuple] = None
+        self._perf_rect: Optional[pygame.Rect] = None
+        # The panel as last drawn, and what it was drawn from: put back as it
+        # is after the menu has covered it, redrawn only when its key changes.
+        self._panel_layer: Optional[pygame.Surface] = None
+        self._panel_layer_key: Optional[tuple] = None
+        # Move-list rows by (number, white, black, which ply is the latest),
+        # and the house-rule hints the list shows before the first move.
+        self._move_rows: Dict[tuple, pygame.Surface] = {}
+        self._rule_hints: Optional[pygame.Surface] = None
         # Set once per frame so buttons can light up under the pointer without
         # every caller having to thread the mouse position through.
         self._mouse = (-1, -1)
@@ -131,7 +239,7 @@ class GUIRenderer:
     @staticmethod
     def _load_font(size: int, bold: bool = False) -> pygame.font.Font:
         try:
-            font = pygame.font.Font(_resource_path("assets/FreeSerif.ttf"), size)
+            font = pygame.font.Font(io.BytesIO(_font_data()), size)
         except Exception as e:
             print(f"Serif font not available ({e}). Using default font.")
             font = pygame.font.Font(None, size)
@@ -142,34 +250,107 @@ class GUIRenderer:
 
     def _piece_font(self, size: Optional[int]) -> pygame.font.Font:
         """The glyph font at a given size, cached. None means the board size."""
-        if size is None:
+        if size is None or size == PIECE_FONT_SIZE:
             return self.font
         font = self._piece_fonts.get(size)
         if font is None:
             font = self._piece_fonts[size] = self._load_font(size)
         return font
 
+    def loading_steps(self) -> List[Tuple[str, Callable[[], object]]]:
+        """What the game needs beyond the menu, for the startup loader."""
+        return [("fonts", self.open_fonts), ("piece sheet", self.piece_atlas)]
+
+    def open_fonts(self):
+        """Open every font the menu has not needed yet."""
+        for name, value in vars(GUIRenderer).items():
+            if isinstance(value, _Font):
+                getattr(self, name)
+
+    def piece_atlas(self) -> PieceAtlas:
+        """The piece sheet, loaded or drawn the first time it is needed."""
+        if self._atlas is None:
+            self._atlas = self._load_piece_atlas()
+        return self._atlas
+
+    def _load_piece_atlas(self) -> PieceAtlas:
+        path = _resource_path(atlas.ATLAS_PATH)
+        loaded = PieceAtlas.load(path, self.atlas_signature())
+        if loaded is not None:
+            return loaded
+        return self.draw_piece_atlas()
+
+    def draw_piece_atlas(self) -> PieceAtlas:
+        return PieceAtlas.pack({key: self._draw_sprite(*key) for key in ATLAS_SPRITES})
+
+    def atlas_signature(self) -> str:
+        """What the sprites depend on, so a saved sheet can be checked."""
+        colours = (
+            "white_piece",
+            "black_piece",
+            "piece_outline_light",
+            "piece_outline_dark",
+        )
+        return atlas.signature(
+            {
+                "colours": {name: self.COLORS[name] for name in colours},
+                "flat": {str(k): v for k, v in FLAT_PIECE_COLOURS.items()},
+                "glyphs": [Piece(t, True).glyph for t in PieceType],
+                "sprites": [
+                    [style, t.name, white, size]
+                    for style, t, white, size in ATLAS_SPRITES
+                ],
+                # The bundled face, or pygame's own if that is missing.
+                "font": os.path.isfile(_resource_path(SERIF_FONT)),
+            }
+        )
+
     def _piece_surface(
         self, piece: Piece, size: Optional[int] = None
     ) -> pygame.Surface:
-        key = (piece.type, piece.is_white, size)
-        cached = self._piece_cache.get(key)
-        if cached is not None:
-            return cached
+        return self._sprite("outlined", piece.type, piece.is_white, size)
 
-        fill = (
-            self.COLORS["white_piece"] if piece.is_white else self.COLORS["black_piece"]
-        )
+    def _flat_piece_surface(
+        self, piece_type: PieceType, is_white: bool, size: int
+    ) -> pygame.Surface:
+        return self._sprite("flat", piece_type, is_white, size)
+
+    def _sprite(
+        self, style: str, piece_type: PieceType, is_white: bool, size: Optional[int]
+    ) -> pygame.Surface:
+        key = (style, piece_type, is_white, size or PIECE_FONT_SIZE)
+        counts = self.cache_counts["pieces"]
+        surface = self.piece_atlas().get(key) or self._piece_cache.get(key)
+        if surface is not None:
+            counts[0] += 1
+            return surface
+        counts[1] += 1
+        surface = self._piece_cache[key] = self._draw_sprite(*key)
+        return surface
+
+    def _draw_sprite(
+        self, style: str, piece_type: PieceType, is_white: bool, size: int
+    ) -> pygame.Surface:
+        if style == "flat":
+            return self._draw_flat_piece(piece_type, is_white, size)
+        return self._draw_outlined_piece(piece_type, is_white, size)
+
+    def _draw_outlined_piece(
+        self, piece_type: PieceType, is_white: bool, size: int
+    ) -> pygame.Surface:
+        """The board's pieces: a solid glyph with an outline stamped round it."""
+        fill = self.COLORS["white_piece"] if is_white else self.COLORS["black_piece"]
         outline = (
             self.COLORS["piece_outline_light"]
-            if piece.is_white
+            if is_white
             else self.COLORS["piece_outline_dark"]
         )
         font = self._piece_font(size)
         thickness = max(1, round(font.get_height() / 40))
+        glyph = Piece(piece_type, is_white).glyph
 
-        body = font.render(piece.glyph, True, fill)
-        edge = font.render(piece.glyph, True, outline)
+        body = font.render(glyph, True, fill)
+        edge = font.render(glyph, True, outline)
 
         surface = pygame.Surface(
             (body.get_width() + thickness * 2, body.get_height() + thickness * 2),
@@ -186,13 +367,11 @@ class GUIRenderer:
             )
         surface.blit(body, (thickness, thickness))
 
-        if piece.type == PieceType.SPY:
+        if piece_type == PieceType.SPY:
             self._add_hat(surface, fill, outline)
-
-        self._piece_cache[key] = surface
         return surface
 
-    def _flat_piece_surface(
+    def _draw_flat_piece(
         self, piece_type: PieceType, is_white: bool, size: int
     ) -> pygame.Surface:
         """A single-colour silhouette, for lists rather than the board.
@@ -201,18 +380,11 @@ class GUIRenderer:
         ring on the near-black panel, so pieces out of play are drawn as flat
         shapes in two panel tones instead.
         """
-        key = ("flat", piece_type, is_white, size)
-        cached = self._piece_cache.get(key)
-        if cached is not None:
-            return cached
-
-        colour = (232, 222, 202) if is_white else (132, 110, 86)
-        piece = Piece(piece_type, is_white)
-        surface = self._piece_font(size).render(piece.glyph, True, colour).copy()
+        colour = FLAT_PIECE_COLOURS[is_white]
+        glyph = Piece(piece_type, is_white).glyph
+        surface = self._piece_font(size).render(glyph, True, colour).copy()
         if piece_type == PieceType.SPY:
             self._add_hat(surface, colour, colour)
-
-        self._piece_cache[key] = surface
         return surface
 
     @staticmethod
@@ -317,6 +489,8 @@ class GUIRenderer:
             "rules": pygame.Rect(x, self.screen_height - 212, width, 52),
             "undo": pygame.Rect(x, self.screen_height - 148, width, 52),
             "menu": pygame.Rect(x, self.screen_height - 84, width, 52),
+            # Small switch beside the heading for the search statistics.
+            "stats": pygame.Rect(x + width - 64, 30, 64, 30),
         }
 
     def rules_overlay_close_rect(self) -> pygame.Rect:
@@ -363,12 +537,12 @@ class GUIRenderer:
         glyphs are placed one at a time. Cached, since the menu redraws every
         frame.
         """
-        key = (text, id(font), colour, tracking)
+        key = (text, font, colour, tracking)
         cached = self._tracked_cache.get(key)
         if cached is not None:
             return cached
 
-        glyphs = [(font.render(ch, True, colour), font.size(ch)[0]) for ch in text]
+        glyphs = [(self._text(font, ch, colour), font.size(ch)[0]) for ch in text]
         width = sum(advance for _, advance in glyphs) + tracking * max(len(text) - 1, 0)
         surface = pygame.Surface((width, font.get_height()), pygame.SRCALPHA)
         x = 0
@@ -376,7 +550,23 @@ class GUIRenderer:
             surface.blit(glyph, (x, 0))
             x += advance + tracking
 
-        self._tracked_cache[key] = surface
+        self._tracked_cache.put(key, surface)
+        return surface
+
+    def _text(
+        self, font: pygame.font.Font, text: str, colour, antialias: bool = True
+    ) -> pygame.Surface:
+        """font.render(), cached: most text on screen is the same every frame.
+
+        Strings that change as they animate, like the thinking ellipsis, have
+        only a few versions, which all stay cached. The surfaces are shared,
+        so callers must not draw on them.
+        """
+        key = (font, text, colour, antialias)
+        surface = self._text_cache.get(key)
+        if surface is None:
+            surface = font.render(text, antialias, colour)
+            self._text_cache.put(key, surface)
         return surface
 
     def _tracked_size(
@@ -528,10 +718,11 @@ class GUIRenderer:
             pygame.draw.rect(
                 screen, self.COLORS["accent"], rect, width=2, border_radius=6
             )
-        text = font.render(label, True, text_colour or self.COLORS["white_piece"])
+        text = self._text(font, label, text_colour or self.COLORS["white_piece"])
         screen.blit(text, text.get_rect(center=rect.center))
 
     def render_menu(self, screen: pygame.Surface, difficulty: str = "medium"):
+        self.invalidate()
         self._mouse = pygame.mouse.get_pos()
         self._draw_menu_background(screen)
         centre_x = self.screen_width // 2
@@ -546,7 +737,7 @@ class GUIRenderer:
             screen, "Chess 2", self.menu_title_font, MENU_INK, (centre_x, 152), 10
         )
         self._draw_hairline(screen, (centre_x, 212), 300)
-        tagline = self.menu_tagline_font.render(TAGLINE, True, MENU_INK_SOFT)
+        tagline = self._text(self.menu_tagline_font, TAGLINE, MENU_INK_SOFT)
         screen.blit(tagline, tagline.get_rect(center=(centre_x, 242)))
 
         self._draw_plate(
@@ -588,14 +779,12 @@ class GUIRenderer:
         screen.blit(underline, (word.left, word.bottom - 2))
 
     def render_rules(self, screen: pygame.Surface):
+        self.invalidate()
         self._mouse = pygame.mouse.get_pos()
         self._draw_menu_background(screen)
 
-        overlay = pygame.Surface(
-            (self.screen_width, self.screen_height), pygame.SRCALPHA
-        )
-        overlay.fill((28, 20, 15, 150))
-        screen.blit(overlay, (0, 0))
+        size = (self.screen_width, self.screen_height)
+        screen.blit(self._overlay("fill", (28, 20, 15), 150, size), (0, 0))
 
         # Hold the text to a readable column instead of letting it run the full
         # width of the window.
@@ -656,11 +845,11 @@ class GUIRenderer:
             text = rule.lstrip("•").strip()
             lines = self._wrap(text, font, area.width - indent)
             screen.blit(
-                font.render("•", True, bullet_colour or colour), (area.left, y)
+                self._text(font, "•", bullet_colour or colour), (area.left, y)
             )
             for line in lines:
                 screen.blit(
-                    font.render(line, True, colour), (area.left + indent, y)
+                    self._text(font, line, colour), (area.left + indent, y)
                 )
                 y += line_height
             y += gap
@@ -696,8 +885,19 @@ class GUIRenderer:
         anim: Optional["MoveAnimation"] = None,
         effect: Optional["SquareEffect"] = None,
         notice: Optional["Notice"] = None,
-    ):
-        self._mouse = pygame.mouse.get_pos()
+        show_stats: bool = False,
+        search_stats: Optional[SearchStats] = None,
+        frame_stats: Optional["FrameStats"] = None,
+        mouse: Optional[Tuple[int, int]] = None,
+    ) -> List[pygame.Rect]:
+        """Draw a game frame; with `frame_stats`, the performance overlay too.
+
+        Only what changed since the last frame is drawn. Returns the areas
+        drawn, for pygame.display.update(); empty when nothing changed.
+        `mouse` stands in for the pointer's position, e.g. (-1, -1) for a
+        replay nobody is pointing at.
+        """
+        self._mouse = pygame.mouse.get_pos() if mouse is None else mouse
         # Whether the board is waiting on this player, which decides if squares
         # light up under the pointer.
         interactive = (
@@ -707,47 +907,386 @@ class GUIRenderer:
             and not promoting
             and not showing_rules
         )
-        self._draw_board(screen)
-        self._draw_highlights(screen, state, interactive)
-        self._draw_labels(screen)
-        self._draw_pieces(screen, state, anim)
-        self._draw_effect(screen, effect)
-        self._draw_panel(screen, state, game_mode, difficulty, thinking)
-        self._draw_notice(screen, notice)
+        for phase in RENDER_PHASES:
+            self.phase_ms[phase] = 0.0
+
+        # What each part of the screen depends on. Parts whose inputs are the
+        # same as last frame are left alone, and only the rest is redrawn and
+        # pushed to the display.
+        squares = self._square_keys(state, interactive)
+        panel = self._panel_key(
+            state, game_mode, difficulty, thinking, show_stats, search_stats
+        )
+        scene = self._scene_key(state, promoting, showing_rules, anim, effect, notice)
+        previous = self._frame_keys
+        self._frame_keys = (squares, panel, scene)
+
+        if previous is None or scene != previous[2]:
+            dirty = list(range(64))
+        else:
+            dirty = [i for i in range(64) if squares[i] != previous[0][i]]
+        if self._perf_rect is not None:
+            # Uncover what the performance overlay sat on, or redraw it fresh.
+            under = self._perf_rect.collidelistall(
+                [self._square_rect(i) for i in range(64)]
+            )
+            dirty = sorted(set(dirty).union(under))
+            self._perf_rect = None
+        covered = showing_rules or promoting or state.game_over
+        if dirty and covered:
+            # An overlay spans the board and has to be redrawn over any of it.
+            dirty = list(range(64))
+
+        updated = []
+        if len(dirty) == 64:
+            self._draw_squares(screen, state, interactive, anim, effect)
+            self._timed("overlays", self._draw_notice, screen, notice)
+            if showing_rules:
+                self._timed("overlays", self._draw_rules_overlay, screen)
+            elif promoting:
+                self._timed("overlays", self._draw_promotion, screen, state)
+            elif state.game_over:
+                self._timed("overlays", self._draw_game_over, screen, state)
+            updated.append(pygame.Rect(0, 0, self.board_size, self.board_size))
+        else:
+            for i in dirty:
+                rect = self._square_rect(i)
+                screen.set_clip(rect)
+                self._draw_squares(screen, state, interactive, anim, effect)
+                updated.append(rect)
+            screen.set_clip(None)
+
+        if previous is None or panel != previous[1]:
+            area = pygame.Rect(self.board_size, 0, PANEL_WIDTH, self.screen_height)
+            if panel == self._panel_layer_key:
+                screen.blit(self._panel_layer, area)
+            else:
+                self._timed(
+                    "panel",
+                    self._draw_panel,
+                    screen,
+                    state,
+                    game_mode,
+                    difficulty,
+                    thinking,
+                    search_stats if show_stats and game_mode == "ai" else None,
+                    show_stats,
+                )
+                self._panel_layer = screen.subsurface(area).copy()
+                self._panel_layer_key = panel
+            updated.append(area)
+
+        if frame_stats is not None:
+            self._perf_rect = self._draw_perf_overlay(screen, frame_stats)
+            updated.append(self._perf_rect)
+        return updated
+
+    def render_diagram(
+        self,
+        surface: pygame.Surface,
+        state: GameState,
+        highlights: Iterable[Tuple[int, int]] = (),
+        arrows: Iterable[Tuple[Tuple[int, int], Tuple[int, int]]] = (),
+    ):
+        """Draw the board alone, as a diagram to publish (see gui.diagram).
+
+        The last move and a king in check are marked as in the game, but
+        nothing that answers the pointer. `highlights` are tinted like a
+        selected square, and `arrows` are drawn over the pieces.
+        """
+        if self._diagram_layer is None:
+            self._diagram_layer = self._build_board_layer(shadow=False)
+        surface.blit(self._diagram_layer, (0, 0))
+        if state.last_move:
+            self._draw_last_move_highlight(surface, state.last_move)
+        self._draw_check_highlight(surface, state)
+        for pos in highlights:
+            self._draw_selected_highlight(surface, pos)
+        self._draw_pieces(surface, state)
+        arrows = list(arrows)
+        if arrows:
+            self._draw_arrows(surface, arrows)
+
+    def _draw_arrows(
+        self,
+        surface: pygame.Surface,
+        arrows: List[Tuple[Tuple[int, int], Tuple[int, int]]],
+    ):
+        # Drawn opaque onto a clear layer and laid over the board at once, so
+        # where two arrows cross they are no darker than either.
+        if self._arrow_layer is None:
+            self._arrow_layer = pygame.Surface(
+                (self.board_size, self.board_size), pygame.SRCALPHA
+            )
+        layer = self._arrow_layer
+        layer.fill((0, 0, 0, 0))
+        colour = (*self.COLORS["arrow"], 255)
+        size = self.square_size
+        for start, end in arrows:
+            tail = pygame.Vector2(start[1] + 0.5, start[0] + 0.5) * size
+            tip = pygame.Vector2(end[1] + 0.5, end[0] + 0.5) * size
+            if tail == tip:
+                continue
+            forward = (tip - tail).normalize()
+            side = pygame.Vector2(-forward.y, forward.x)
+            # Stop short of the centre so the piece there stays visible, and
+            # leave the tail's piece uncovered too.
+            tip -= forward * size * 0.2
+            tail += forward * size * 0.25
+            neck = tip - forward * size * 0.38
+            shaft, head = side * size * 0.08, side * size * 0.22
+            points = [
+                tail + shaft,
+                neck + shaft,
+                neck + head,
+                tip,
+                neck - head,
+                neck - shaft,
+                tail - shaft,
+            ]
+            pygame.draw.polygon(layer, colour, points)
+        layer.set_alpha(170)
+        surface.blit(layer, (0, 0))
+
+    def invalidate(self):
+        """Forget what is on the screen, so the next frame is drawn in full.
+
+        For when something else has drawn over the window, e.g. the menu.
+        """
+        self._frame_keys = None
+        self._perf_rect = None
+
+    def _draw_squares(
+        self,
+        screen: pygame.Surface,
+        state: GameState,
+        interactive: bool,
+        anim: Optional["MoveAnimation"],
+        effect: Optional["SquareEffect"],
+    ):
+        """The board and what is on it, within the screen's clip if one is set."""
+        self._timed("board", self._draw_board, screen)
+        self._timed("highlights", self._draw_highlights, screen, state, interactive)
+        self._timed("pieces", self._draw_pieces, screen, state, anim)
+        self._timed("pieces", self._draw_effect, screen, effect)
+
+    def _square_rect(self, index: int) -> pygame.Rect:
+        row, col = divmod(index, 8)
+        return pygame.Rect(
+            col * self.square_size,
+            row * self.square_size,
+            self.square_size,
+            self.square_size,
+        )
+
+    def _square_keys(self, state: GameState, interactive: bool) -> List[tuple]:
+        """For each square, its piece and the highlights on it."""
+        marks: Dict[Tuple[int, int], tuple] = defaultdict(tuple)
+        for pos in state.last_move or ():
+            marks[pos] += ("last",)
+        king = self._checked_king(state)
+        if king is not None:
+            marks[king] += ("check",)
+        if interactive:
+            hover = self._hover_kind(state)
+            if hover is not None:
+                marks[hover[0]] += ("hover", hover[1])
+        if state.selected_piece:
+            marks[state.selected_piece] += ("selected", state.dragging)
+            selected = state.board.get_piece(state.selected_piece)
+            converting = selected is not None and selected.type == PieceType.SPY
+            for move in state.possible_moves:
+                marks[move] += ("move", converting)
+
+        keys = []
+        for row, pieces in enumerate(state.board.board):
+            for col, piece in enumerate(pieces):
+                keys.append(
+                    (
+                        None if piece is None else (piece.type, piece.is_white),
+                        marks.get((row, col)),
+                    )
+                )
+        return keys
+
+    def _panel_key(
+        self,
+        state: GameState,
+        game_mode: str,
+        difficulty: str,
+        thinking: bool,
+        show_stats: bool,
+        search_stats: Optional[SearchStats],
+    ) -> tuple:
+        """Everything the panel shows, including which button is lit."""
+        stats = None
+        if show_stats and search_stats is not None:
+            stats = (
+                id(search_stats),
+                search_stats.nodes,
+                search_stats.depth,
+                len(search_stats.iterations),
+            )
+        return (
+            game_mode,
+            difficulty,
+            # The ellipsis of "thinking" moves on every 350 ms.
+            pygame.time.get_ticks() // 350 if thinking else None,
+            state.is_white_turn,
+            state.game_over,
+            state.game_result,
+            self._checked_king(state),
+            len(state.move_log),
+            state.move_log[-1:],
+            tuple(state.captured),
+            state.can_undo(),
+            show_stats,
+            stats,
+            tuple(
+                rect.collidepoint(self._mouse)
+                for rect in self.panel_button_rects().values()
+            ),
+        )
+
+    def _scene_key(
+        self,
+        state: GameState,
+        promoting: bool,
+        showing_rules: bool,
+        anim: Optional["MoveAnimation"],
+        effect: Optional["SquareEffect"],
+        notice: Optional["Notice"],
+    ) -> tuple:
+        """What moves across squares or covers the whole board.
+
+        Any change to it redraws the board in full: an animation does so on
+        every frame until it ends.
+        """
         if showing_rules:
-            self._draw_rules_overlay(screen)
+            buttons = [self.rules_overlay_close_rect()]
         elif promoting:
-            self._draw_promotion(screen, state)
+            buttons = [rect for _, rect in self.promotion_rects()]
         elif state.game_over:
-            self._draw_game_over(screen, state)
+            buttons = list(self.game_over_rects().values())
+        else:
+            buttons = []
+        return (
+            anim.progress if anim is not None and not anim.done else None,
+            effect.progress if effect is not None and not effect.done else None,
+            notice.progress if notice is not None and not notice.done else None,
+            self._mouse if state.dragging else None,
+            showing_rules,
+            promoting,
+            state.game_result if state.game_over else None,
+            tuple(rect.collidepoint(self._mouse) for rect in buttons),
+        )
+
+    def _timed(self, phase: str, draw, *args):
+        start = time.perf_counter()
+        draw(*args)
+        self.phase_ms[phase] += (time.perf_counter() - start) * 1e3
+
+    def _draw_perf_overlay(
+        self, screen: pygame.Surface, stats: "FrameStats"
+    ) -> pygame.Rect:
+        """Frame rate, recent frame times and where the last frame's time went.
+
+        For tracking down lag on slow devices and in the browser build, so it
+        sits over the corner of the board rather than taking space in the
+        panel, and is drawn last, after everything it measures.
+        """
+        font = self.label_font
+        frame_ms = stats.frame_ms
+        lines = [
+            f"{stats.fps:.0f} fps, {stats.average_ms:.1f} ms,"
+            f" worst {max(frame_ms, default=0.0):.1f} ms",
+        ]
+        graph_y = len(lines)
+        lines += [
+            f"events {stats.events_ms:.2f} ms, search {stats.search_ms:.1f} ms",
+            "  ".join(
+                f"{phase} {self.phase_ms[phase]:.2f}" for phase in RENDER_PHASES[:3]
+            ),
+            "  ".join(
+                f"{phase} {self.phase_ms[phase]:.2f}" for phase in RENDER_PHASES[3:]
+            ),
+        ]
+        for name, (hits, misses) in self.cache_counts.items():
+            lines.append(f"{name} cache {hits:,} hits, {misses:,} misses")
+
+        line_height = 20
+        graph_height = 36
+        width = max(240, *(font.size(line)[0] for line in lines)) + 16
+        # In steps, so the cached backdrop is not redrawn for every width the
+        # figures happen to take.
+        width += -width % 32
+        height = len(lines) * line_height + graph_height + 16
+        screen.blit(self._overlay("fill", (0, 0, 0), 200, (width, height)), (8, 8))
+
+        x, y = 16, 14
+        for i, line in enumerate(lines):
+            if i == graph_y:
+                self._draw_sparkline(
+                    screen, pygame.Rect(x, y + 2, width - 16, graph_height - 4), stats
+                )
+                y += graph_height
+            # Not through the text cache: these figures change every frame and
+            # would only push out the text that does not.
+            screen.blit(font.render(line, True, self.COLORS["panel_text"]), (x, y))
+            y += line_height
+        return pygame.Rect(8, 8, width, height)
+
+    def _draw_sparkline(
+        self, screen: pygame.Surface, rect: pygame.Rect, stats: "FrameStats"
+    ):
+        """Recent frame times, newest on the right, with a line at 60 fps."""
+        # Scaled to at least two 60 fps frames, so a steady game sits mid-way.
+        scale = max(max(stats.frame_ms, default=0.0), 2000 / 60)
+        target_y = rect.bottom - round(rect.height * (1000 / 60) / scale)
+        pygame.draw.line(
+            screen,
+            self.COLORS["panel_muted"],
+            (rect.left, target_y),
+            (rect.right, target_y),
+        )
+        step = rect.width / max(PERF_SAMPLES - 1, 1)
+        offset = PERF_SAMPLES - len(stats.frame_ms)
+        points = [
+            (
+                rect.left + round((offset + i) * step),
+                rect.bottom - round(rect.height * ms / scale),
+            )
+            for i, ms in enumerate(stats.frame_ms)
+        ]
+        if len(points) > 1:
+            pygame.draw.lines(screen, self.COLORS["accent"], False, points)
 
     def _draw_notice(self, screen: pygame.Surface, notice: Optional["Notice"]):
         """A banner across the top of the board, for a rule that just fired."""
         if notice is None or notice.done:
             return
 
-        text = self.info_font.render(notice.text, True, self.COLORS["accent"])
+        text = self._text(self.info_font, notice.text, self.COLORS["accent"])
         card = text.get_rect().inflate(56, 28)
         card.center = (self.board_size // 2, 54)
 
-        panel = pygame.Surface(card.size, pygame.SRCALPHA)
-        pygame.draw.rect(panel, (22, 16, 13, 236), panel.get_rect(), border_radius=8)
+        panel = self._overlay("card", (22, 16, 13), 236, card.size)
         # Fade out at the end rather than blinking off.
         alpha = int(255 * min(1.0, (1 - notice.progress) * 5))
         panel.set_alpha(alpha)
         text.set_alpha(alpha)
         screen.blit(panel, card.topleft)
         screen.blit(text, text.get_rect(center=card.center))
+        # Both are cached, and shared: leave them opaque for the next user.
+        panel.set_alpha(None)
+        text.set_alpha(None)
 
     def _draw_rules_overlay(self, screen: pygame.Surface):
         """The house rules, over the board, without leaving the game."""
-        overlay = pygame.Surface((self.board_size, self.board_size), pygame.SRCALPHA)
-        overlay.fill((22, 16, 13, 235))
-        screen.blit(overlay, (0, 0))
+        size = (self.board_size, self.board_size)
+        screen.blit(self._overlay("fill", (22, 16, 13), 235, size), (0, 0))
 
-        title = self.game_over_font.render(
-            "House Rules", True, self.COLORS["accent"]
-        )
+        title = self._text(self.game_over_font, "House Rules", self.COLORS["accent"])
         screen.blit(title, title.get_rect(center=(self.board_size // 2, 56)))
 
         self._draw_rule_list(
@@ -769,6 +1308,8 @@ class GUIRenderer:
         game_mode: str,
         difficulty: str,
         thinking: bool,
+        search_stats: Optional[SearchStats] = None,
+        show_stats: bool = False,
     ):
         panel = pygame.Rect(self.board_size, 0, PANEL_WIDTH, self.screen_height)
         pygame.draw.rect(screen, self.COLORS["panel"], panel)
@@ -776,8 +1317,16 @@ class GUIRenderer:
         x = self.board_size + 24
         y = 28
 
-        heading = self.heading_font.render("Chess 2", True, self.COLORS["accent"])
+        heading = self._text(self.heading_font, "Chess 2", self.COLORS["accent"])
         screen.blit(heading, (x, y))
+        if game_mode == "ai":
+            self._draw_button(
+                screen,
+                self.panel_button_rects()["stats"],
+                "Stats",
+                self.label_font,
+                colour=self.COLORS["accent"] if show_stats else None,
+            )
         y += 44
 
         if game_mode == "ai":
@@ -785,7 +1334,7 @@ class GUIRenderer:
         else:
             subtitle = "Local Multiplayer"
         screen.blit(
-            self.small_font.render(subtitle, True, self.COLORS["panel_muted"]), (x, y)
+            self._text(self.small_font, subtitle, self.COLORS["panel_muted"]), (x, y)
         )
         y += 34
 
@@ -806,7 +1355,7 @@ class GUIRenderer:
             if state.board.is_in_check(state.is_white_turn):
                 status += " - check!"
         screen.blit(
-            self.small_font.render(status, True, self.COLORS["panel_text"]), (x, y)
+            self._text(self.small_font, status, self.COLORS["panel_text"]), (x, y)
         )
         y += 40
 
@@ -816,6 +1365,8 @@ class GUIRenderer:
         )
         y += 16
 
+        if show_stats and game_mode == "ai":
+            y = self._draw_search_stats(screen, search_stats, x, y, width)
         y = self._draw_captured(screen, state, x, y, width)
         self._draw_move_list(screen, state, x, y)
 
@@ -837,6 +1388,51 @@ class GUIRenderer:
         )
         self._draw_button(screen, buttons["menu"], "Main Menu", self.info_font)
 
+    def _draw_search_stats(
+        self,
+        screen: pygame.Surface,
+        stats: Optional[SearchStats],
+        x: int,
+        y: int,
+        width: int,
+    ) -> int:
+        """Figures from the computer's latest search, live while it thinks.
+
+        A debugging aid, so plain text: enough to see whether a slow move was
+        a deep search, a poorly ordered one, or a table that kept missing.
+        """
+        heading = self._text(self.list_font, "Search", self.COLORS["accent"])
+        screen.blit(heading, (x, y))
+        y += 28
+        if stats is None:
+            lines = ["No search yet (book and Easy moves are instant)"]
+        else:
+            quiescence = stats.qnodes / stats.nodes if stats.nodes else 0.0
+            lines = [
+                f"Depth {stats.depth}, selective {stats.max_depth}",
+                f"{stats.nodes:,} nodes, {quiescence:.0%} quiescence",
+                f"{stats.nps:,} nodes/s over {stats.elapsed:.1f}s",
+                f"TT hits {stats.tt_hit_rate:.0%} of {stats.tt_probes:,}",
+                f"Cutoffs {stats.cutoffs:,},"
+                f" {stats.first_move_cutoff_rate:.0%} on the first move",
+                f"Branching {stats.branching_factor:.1f}",
+            ]
+            if stats.iterations:
+                last = stats.iterations[-1]
+                lines.append(f"Depth {last.depth} took {last.seconds:.2f}s")
+        for line in lines:
+            for part in self._wrap(line, self.label_font, width):
+                screen.blit(
+                    self._text(self.label_font, part, self.COLORS["panel_text"]),
+                    (x, y),
+                )
+                y += 22
+
+        pygame.draw.line(
+            screen, self.COLORS["button_disabled"], (x, y + 6), (x + width, y + 6)
+        )
+        return y + 22
+
     def _draw_captured(
         self, screen: pygame.Surface, state: GameState, x: int, y: int, width: int
     ) -> int:
@@ -849,12 +1445,13 @@ class GUIRenderer:
             return y
 
         balance = state.material_balance()
-        heading = self.list_font.render("Out of play", True, self.COLORS["accent"])
+        heading = self._text(self.list_font, "Out of play", self.COLORS["accent"])
         screen.blit(heading, (x, y))
         if balance:
             leader = "White" if balance > 0 else "Black"
-            badge = self.list_font.render(
-                f"{leader} +{abs(balance) / 100:.1f}", True, self.COLORS["panel_text"]
+            badge = self._text(
+                self.list_font,
+                f"{leader} +{abs(balance) / 100:.1f}", self.COLORS["panel_text"],
             )
             screen.blit(badge, (x + width - badge.get_width(), y))
         y += 30
@@ -865,7 +1462,9 @@ class GUIRenderer:
                 continue
             step = min(22, max(12, (width - 24) // len(lost)))
             for i, piece_type in enumerate(lost):
-                surface = self._flat_piece_surface(piece_type, is_white, 30)
+                surface = self._flat_piece_surface(
+                    piece_type, is_white, TRAY_PIECE_SIZE
+                )
                 screen.blit(
                     surface, surface.get_rect(center=(x + 11 + i * step, y + 12))
                 )
@@ -887,65 +1486,86 @@ class GUIRenderer:
         # the house rules -- they are the whole point of the game and easy to
         # miss otherwise.
         if not state.move_log:
-            screen.blit(
-                self.small_font.render(
-                    "What's different", True, self.COLORS["accent"]
-                ),
-                (x, y),
-            )
-            y += 30
-            for hint in SHORT_RULES:
-                lines = self._wrap(hint, self.list_font, PANEL_WIDTH - 66)
-                screen.blit(
-                    self.list_font.render("•", True, self.COLORS["accent"]), (x, y)
-                )
-                for line in lines:
-                    screen.blit(
-                        self.list_font.render(
-                            line, True, self.COLORS["panel_muted"]
-                        ),
-                        (x + 16, y),
-                    )
-                    y += 24
-                y += 6
+            if self._rule_hints is None:
+                self._rule_hints = self._render_rule_hints()
+            screen.blit(self._rule_hints, (x, y))
             return
 
-        rows = []
-        for i in range(0, len(state.move_log), 2):
-            rows.append(
-                (
-                    f"{i // 2 + 1}.",
-                    state.move_log[i],
-                    state.move_log[i + 1] if i + 1 < len(state.move_log) else "",
-                )
+        # Only the rows that fit are looked at, so a long game costs no more
+        # to draw than a short one.
+        log = state.move_log
+        latest = len(log) - 1
+        total_rows = (len(log) + 1) // 2
+        first = max(total_rows - max_rows, 0)
+        for row_index in range(first, total_rows):
+            white = log[row_index * 2]
+            black = log[row_index * 2 + 1] if row_index * 2 + 1 < len(log) else ""
+            current = latest - row_index * 2 if latest // 2 == row_index else None
+            screen.blit(self._move_row(row_index + 1, white, black, current), (x, y))
+            y += line_height
+
+    def _move_row(
+        self, number: int, white: str, black: str, current: Optional[int]
+    ) -> pygame.Surface:
+        """One row of the move list; `current` is which of its plies is latest.
+
+        Explicit columns: the font is proportional, so padded strings would not
+        line up. The move just played is picked out in the accent colour so it
+        can be found at a glance.
+        """
+        key = (number, white, black, current)
+        row = self._move_rows.get(key)
+        if row is not None:
+            return row
+
+        if len(self._move_rows) >= MOVE_ROW_CACHE:
+            self._move_rows.clear()
+        row = pygame.Surface(
+            (PANEL_WIDTH - 48, self.list_font.get_height()), pygame.SRCALPHA
+        )
+        row.blit(
+            self._text(self.list_font, f"{number}.", self.COLORS["panel_muted"]),
+            (0, 0),
+        )
+        for ply, text, offset in ((0, white, 38), (1, black, 142)):
+            if not text:
+                continue
+            colour = (
+                self.COLORS["accent"] if ply == current else self.COLORS["panel_text"]
             )
+            row.blit(self._text(self.list_font, text, colour), (offset, 0))
+        self._move_rows[key] = row
+        return row
 
-        # Explicit columns: the font is proportional, so padded strings would
-        # not line up. The move just played is picked out in the accent colour
-        # so it can be found at a glance.
-        latest = len(state.move_log) - 1
-        shown = rows[-max_rows:]
-        first = len(rows) - len(shown)
-        for row_index, (number, white, black) in enumerate(shown, first):
-            screen.blit(
-                self.list_font.render(number, True, self.COLORS["panel_muted"]), (x, y)
+    def _render_rule_hints(self) -> pygame.Surface:
+        lines = [
+            self._wrap(hint, self.list_font, PANEL_WIDTH - 66) for hint in SHORT_RULES
+        ]
+        height = 30 + sum(len(wrapped) * 24 + 6 for wrapped in lines)
+        surface = pygame.Surface((PANEL_WIDTH - 24, height), pygame.SRCALPHA)
+        surface.blit(
+            self._text(self.small_font, "What's different", self.COLORS["accent"]),
+            (0, 0),
+        )
+        y = 30
+        for wrapped in lines:
+            surface.blit(
+                self._text(self.list_font, "•", self.COLORS["accent"]), (0, y)
             )
-            for ply, text, offset in ((0, white, 38), (1, black, 142)):
-                if not text:
-                    continue
-                current = row_index * 2 + ply == latest
-                colour = self.COLORS["accent"] if current else self.COLORS["panel_text"]
-                screen.blit(self.list_font.render(text, True, colour), (x + offset, y))
-            y += line_height
+            for line in wrapped:
+                surface.blit(
+                    self._text(self.list_font, line, self.COLORS["panel_muted"]),
+                    (16, y),
+                )
+                y += 24
+            y += 6
+        return surface
 
     def _draw_promotion(self, screen: pygame.Surface, state: GameState):
-        overlay = pygame.Surface((self.board_size, self.board_size), pygame.SRCALPHA)
-        overlay.fill((20, 15, 12, 190))
-        screen.blit(overlay, (0, 0))
+        size = (self.board_size, self.board_size)
+        screen.blit(self._overlay("fill", (20, 15, 12), 190, size), (0, 0))
 
-        prompt = self.info_font.render(
-            "Promote to:", True, self.COLORS["panel_text"]
-        )
+        prompt = self._text(self.info_font, "Promote to:", self.COLORS["panel_text"])
         screen.blit(
             prompt,
             prompt.get_rect(
@@ -971,6 +1591,12 @@ class GUIRenderer:
             screen.blit(piece_surface, piece_surface.get_rect(center=rect.center))
 
     def _draw_board(self, screen: pygame.Surface):
+        if self._board_layer is None:
+            self._board_layer = self._build_board_layer()
+        screen.blit(self._board_layer, (0, 0))
+
+    def _build_board_layer(self, shadow: bool = True) -> pygame.Surface:
+        layer = pygame.Surface((self.board_size, self.board_size))
         for row in range(8):
             for col in range(8):
                 color = (
@@ -979,7 +1605,7 @@ class GUIRenderer:
                     else self.COLORS["dark_square"]
                 )
                 pygame.draw.rect(
-                    screen,
+                    layer,
                     color,
                     (
                         col * self.square_size,
@@ -991,12 +1617,20 @@ class GUIRenderer:
 
         # A short falloff along the panel edge, so the panel reads as sitting
         # above the board rather than butting up against it.
-        shadow = pygame.Surface((10, self.board_size), pygame.SRCALPHA)
-        for i in range(10):
-            pygame.draw.line(
-                shadow, (30, 20, 12, 60 - i * 6), (9 - i, 0), (9 - i, self.board_size)
-            )
-        screen.blit(shadow, (self.board_size - 10, 0))
+        if shadow:
+            falloff = pygame.Surface((10, self.board_size), pygame.SRCALPHA)
+            for i in range(10):
+                pygame.draw.line(
+                    falloff,
+                    (30, 20, 12, 60 - i * 6),
+                    (9 - i, 0),
+                    (9 - i, self.board_size),
+                )
+            layer.blit(falloff, (self.board_size - 10, 0))
+        # The coordinates sit under the highlights now, but those are
+        # translucent, so they still show through.
+        self._draw_labels(layer)
+        return layer
 
     def _draw_highlights(
         self, screen: pygame.Surface, state: GameState, interactive: bool = False
@@ -1013,18 +1647,67 @@ class GUIRenderer:
             self._draw_selected_highlight(screen, state.selected_piece)
             self._draw_legal_moves(screen, state)
 
-    def _outline_square(
-        self, screen: pygame.Surface, pos: Tuple[int, int], colour, alpha, width=3
+    def _overlay(
+        self, kind: str, colour, alpha: int, size: Tuple[int, int], width: int = 0
+    ) -> pygame.Surface:
+        """A translucent shape filling `size`, drawn once and then reused.
+
+        Highlights, move hints and scrims are redrawn whenever their squares
+        are, and a selected queen or knight has a dozen of them, so making a
+        fresh alpha surface for each added up. The size is part of the key:
+        a new square size simply draws new ones.
+
+        kind is "fill", "outline" (`width` thick), "card" (rounded), "dot",
+        "ring" (`width` thick) or "double_ring", the spy's conversion mark.
+        """
+        key = (kind, colour, alpha, size, width)
+        surface = self._overlay_cache.get(key)
+        if surface is not None:
+            return surface
+
+        surface = pygame.Surface(size, pygame.SRCALPHA)
+        bounds = surface.get_rect()
+        rgba = (*colour, alpha)
+        radius = min(size) // 2 - 4
+        if kind == "fill":
+            surface.fill(rgba)
+        elif kind == "outline":
+            pygame.draw.rect(surface, rgba, bounds, width=width)
+        elif kind == "card":
+            pygame.draw.rect(surface, rgba, bounds, border_radius=8)
+        elif kind == "dot":
+            pygame.draw.circle(surface, rgba, bounds.center, min(size) // 7)
+        elif kind == "ring":
+            pygame.draw.circle(surface, rgba, bounds.center, radius, width=width)
+        elif kind == "double_ring":
+            for r, a in ((radius, alpha), (radius - 9, alpha - 60)):
+                pygame.draw.circle(
+                    surface, (*colour, a), bounds.center, r, width=width
+                )
+        else:
+            raise ValueError(f"Unknown overlay: {kind}")
+        self._overlay_cache[key] = surface
+        return surface
+
+    def _square_overlay(
+        self,
+        screen: pygame.Surface,
+        pos: Tuple[int, int],
+        kind: str,
+        colour,
+        alpha: int,
+        width: int = 0,
     ):
-        surface = pygame.Surface((self.square_size, self.square_size), pygame.SRCALPHA)
-        pygame.draw.rect(
-            surface,
-            (*colour, alpha),
-            (0, 0, self.square_size, self.square_size),
-            width=width,
+        surface = self._overlay(
+            kind, colour, alpha, (self.square_size, self.square_size), width
         )
         screen.blit(surface, (pos[1] * self.square_size, pos[0] * self.square_size))
 
+    def _outline_square(
+        self, screen: pygame.Surface, pos: Tuple[int, int], colour, alpha, width=3
+    ):
+        self._square_overlay(screen, pos, "outline", colour, alpha, width)
+
     def _draw_hover_highlight(self, screen: pygame.Surface, state: GameState):
         """Ring the square under the pointer.
 
@@ -1032,20 +1715,32 @@ class GUIRenderer:
         available to pick up. An outline rather than a tint: a wash light enough
         not to muddy the wood was invisible on the pale squares.
         """
+        hover = self._hover_kind(state)
+        if hover is None:
+            return
+        square, reachable = hover
+        if reachable:
+            self._outline_square(screen, square, (252, 244, 224), 225, width=4)
+        else:
+            self._outline_square(screen, square, (252, 244, 224), 130)
+
+    def _hover_kind(
+        self, state: GameState
+    ) -> Optional[Tuple[Tuple[int, int], bool]]:
+        """(square, reachable by the selected piece) if it gets a hover ring."""
         square = self.square_at(self._mouse)
         if square is None:
-            return
+            return None
         if square in state.possible_moves:
-            self._outline_square(screen, square, (252, 244, 224), 225, width=4)
-        elif state.selected_piece is None:
+            return square, True
+        if state.selected_piece is None:
             piece = state.board.get_piece(square)
             if piece is not None and piece.is_white == state.is_white_turn:
-                self._outline_square(screen, square, (252, 244, 224), 130)
+                return square, False
+        return None
 
     def _tint_square(self, screen: pygame.Surface, pos: Tuple[int, int], colour, alpha):
-        surface = pygame.Surface((self.square_size, self.square_size), pygame.SRCALPHA)
-        surface.fill((*colour, alpha))
-        screen.blit(surface, (pos[1] * self.square_size, pos[0] * self.square_size))
+        self._square_overlay(screen, pos, "fill", colour, alpha)
 
     def _draw_selected_highlight(self, screen: pygame.Surface, pos: Tuple[int, int]):
         self._tint_square(screen, pos, self.COLORS["selected"], 130)
@@ -1056,8 +1751,14 @@ class GUIRenderer:
         Left on after checkmate, where it points at the king that could not get
         out of it -- the side to move is the mated one.
         """
+        king = self._checked_king(state)
+        if king is not None:
+            self._tint_square(screen, king, self.COLORS["check"], 120)
+
+    def _checked_king(self, state: GameState) -> Optional[Tuple[int, int]]:
+        """The square of the side to move's king, if it is in check."""
         if not state.board.is_in_check(state.is_white_turn):
-            return
+            return None
         for r in range(8):
             for c in range(8):
                 piece = state.board.board[r][c]
@@ -1066,8 +1767,8 @@ class GUIRenderer:
                     and piece.type == PieceType.KING
                     and piece.is_white == state.is_white_turn
                 ):
-                    self._tint_square(screen, (r, c), self.COLORS["check"], 120)
-                    return
+                    return r, c
+        return None
 
     def _draw_legal_moves(self, screen: pygame.Surface, state: GameState):
         """A dot marks a quiet move, a ring a capture.
@@ -1083,37 +1784,20 @@ class GUIRenderer:
         )
         converting = selected is not None and selected.type == PieceType.SPY
 
-        radius = self.square_size // 2 - 4
         for move in state.possible_moves:
-            overlay = pygame.Surface(
-                (self.square_size, self.square_size), pygame.SRCALPHA
-            )
-            local = (self.square_size // 2, self.square_size // 2)
             occupied = state.board.get_piece(move) is not None
             if occupied and converting:
-                for r, alpha in ((radius, 190), (radius - 9, 130)):
-                    pygame.draw.circle(
-                        overlay, (*self.COLORS["convert"], alpha), local, r, width=4
-                    )
+                self._square_overlay(
+                    screen, move, "double_ring", self.COLORS["convert"], 190, 4
+                )
             elif occupied:
-                pygame.draw.circle(
-                    overlay,
-                    (*self.COLORS["legal_moves"], 120),
-                    local,
-                    radius,
-                    width=6,
+                self._square_overlay(
+                    screen, move, "ring", self.COLORS["legal_moves"], 120, 6
                 )
             else:
-                pygame.draw.circle(
-                    overlay,
-                    (*self.COLORS["legal_moves"], 110),
-                    local,
-                    self.square_size // 7,
+                self._square_overlay(
+                    screen, move, "dot", self.COLORS["legal_moves"], 110
                 )
-            screen.blit(
-                overlay,
-                (move[1] * self.square_size, move[0] * self.square_size),
-            )
 
     def _draw_effect(self, screen: pygame.Surface, effect: Optional["SquareEffect"]):
         """A ring bursting out of a square: the spy's conversion landing."""
@@ -1145,11 +1829,7 @@ class GUIRenderer:
         self, screen: pygame.Surface, last_move: Tuple[Tuple[int, int], Tuple[int, int]]
     ):
         for pos in last_move:
-            surface = pygame.Surface(
-                (self.square_size, self.square_size), pygame.SRCALPHA
-            )
-            surface.fill((*self.COLORS["last_move"], 100))
-            screen.blit(surface, (pos[1] * self.square_size, pos[0] * self.square_size))
+            self._tint_square(screen, pos, self.COLORS["last_move"], 100)
 
     def _draw_pieces(
         self,
@@ -1228,8 +1908,8 @@ class GUIRenderer:
         """
         pad = 6
         for i in range(8):
-            file_label = self.label_font.render(
-                chr(ord("a") + i), True, self._square_label_colour(7, i)
+            file_label = self._text(
+                self.label_font, chr(ord("a") + i), self._square_label_colour(7, i)
             )
             screen.blit(
                 file_label,
@@ -1240,8 +1920,8 @@ class GUIRenderer:
                     )
                 ),
             )
-            rank_label = self.label_font.render(
-                str(8 - i), True, self._square_label_colour(i, 7)
+            rank_label = self._text(
+                self.label_font, str(8 - i), self._square_label_colour(i, 7)
             )
             screen.blit(
                 rank_label,
@@ -1265,12 +1945,11 @@ class GUIRenderer:
         centre_x = self.board_size // 2
         centre_y = self.board_size // 2
 
-        banner = pygame.Surface((self.board_size, 220), pygame.SRCALPHA)
-        banner.fill((20, 15, 12, 208))
+        banner = self._overlay("fill", (20, 15, 12), 208, (self.board_size, 220))
         screen.blit(banner, (0, centre_y - 110))
 
-        text = self.game_over_font.render(
-            texts[state.game_result], True, self.COLORS["panel_text"]
+        text = self._text(
+            self.game_over_font, texts[state.game_result], self.COLORS["panel_text"]
         )
         screen.blit(text, text.get_rect(center=(centre_x, centre_y - 56)))
 
@@ -1279,6 +1958,11 @@ class GUIRenderer:
         self._draw_button(screen, buttons["menu"], "Main Menu", self.info_font)
 
 
+# Milliseconds, for the animations: pygame's clock in the game, a virtual one
+# when a replay is exported frame by frame (see gui.replay).
+Clock = Callable[[], int]
+
+
 class MoveAnimation:
     """Slides the pieces of a move from their old squares to their new ones.
 
@@ -1289,17 +1973,20 @@ class MoveAnimation:
 
     DURATION_MS = 150
 
-    def __init__(self, segments, duration: int = DURATION_MS):
+    def __init__(
+        self, segments, duration: int = DURATION_MS, clock: Optional[Clock] = None
+    ):
         # [(piece, from_square, to_square)] -- more than one for castling.
         self.segments = segments
         self.duration = duration
-        self.start_ms = pygame.time.get_ticks()
+        self.clock = clock or pygame.time.get_ticks
+        self.start_ms = self.clock()
 
     @property
     def progress(self) -> float:
         if self.duration <= 0:
             return 1.0
-        return min(1.0, (pygame.time.get_ticks() - self.start_ms) / self.duration)
+        return min(1.0, (self.clock() - self.start_ms) / self.duration)
 
     @property
     def done(self) -> bool:
@@ -1313,18 +2000,74 @@ class MoveAnimation:
         return {end for _, _, end in self.segments}
 
 
+class LRUCache:
+    """A dict that forgets its least recently used entries past `size`."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries: OrderedDict = OrderedDict()
+        # [hits, misses]
+        self.counts = [0, 0]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.counts[1] += 1
+            return None
+        self.counts[0] += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+class FrameStats:
+    """Timings of the last few frames, kept by the app for the overlay."""
+
+    def __init__(self, samples: int = PERF_SAMPLES):
+        self.frame_ms: deque = deque(maxlen=samples)
+        # Of the last frame: handling input, and thinking for the computer.
+        self.events_ms = 0.0
+        self.search_ms = 0.0
+        self._last: Optional[float] = None
+
+    def tick(self):
+        """Mark the end of a frame."""
+        now = time.perf_counter()
+        if self._last is not None:
+            self.frame_ms.append((now - self._last) * 1e3)
+        self._last = now
+
+    @property
+    def average_ms(self) -> float:
+        return sum(self.frame_ms) / len(self.frame_ms) if self.frame_ms else 0.0
+
+    @property
+    def fps(self) -> float:
+        average = self.average_ms
+        return 1000 / average if average else 0.0
+
+
 class _Timed:
     """Shared clock for the short-lived visual flourishes."""
 
     DURATION_MS = 500
 
-    def __init__(self, duration: Optional[int] = None):
+    def __init__(self, duration: Optional[int] = None, clock: Optional[Clock] = None):
         self.duration = self.DURATION_MS if duration is None else duration
-        self.start_ms = pygame.time.get_ticks()
+        self.clock = clock or pygame.time.get_ticks
+        self.start_ms = self.clock()
 
     @property
     def progress(self) -> float:
-        return min(1.0, (pygame.time.get_ticks() - self.start_ms) / self.duration)
+        return min(1.0, (self.clock() - self.start_ms) / self.duration)
 
     @property
     def done(self) -> bool:
@@ -1336,8 +2079,13 @@ class SquareEffect(_Timed):
 
     DURATION_MS = 520
 
-    def __init__(self, pos: Tuple[int, int], duration: Optional[int] = None):
-        super().__init__(duration)
+    def __init__(
+        self,
+        pos: Tuple[int, int],
+        duration: Optional[int] = None,
+        clock: Optional[Clock] = None,
+    ):
+        super().__init__(duration, clock)
         self.pos = pos
 
 
@@ -1346,6 +2094,42 @@ class Notice(_Timed):
 
     DURATION_MS = 2600
 
-    def __init__(self, text: str, duration: Optional[int] = None):
-        super().__init__(duration)
+    def __init__(
+        self, text: str, duration: Optional[int] = None, clock: Optional[Clock] = None
+    ):
+        super().__init__(duration, clock)
         self.text = text
+
+
+def move_visuals(
+    state: GameState,
+    mover: Piece,
+    start: Tuple[int, int],
+    end: Tuple[int, int],
+    clock: Optional[Clock] = None,
+) -> Tuple[Optional[MoveAnimation], Optional[SquareEffect], Optional[Notice]]:
+    """The slide, burst and banner that go with a move just made on `state`.
+
+    `mover` is the piece that stood on `start` before the move.
+    """
+    landed = state.board.get_piece(end)
+    # A spy dies converting, so slide the spy in rather than the piece it left
+    # behind on the square.
+    drawn = mover if state.last_move_kind == "convert" else landed or mover
+    segments = [(Piece(drawn.type, drawn.is_white), start, end)]
+    if state.last_move_kind == "castle":
+        row = start[0]
+        rook_from = (row, 7 if end[1] > start[1] else 0)
+        rook_to = (row, end[1] - 1 if end[1] > start[1] else end[1] + 1)
+        segments.append((Piece(PieceType.ROOK, mover.is_white), rook_from, rook_to))
+
+    effect = None
+    if state.last_move_kind == "convert":
+        effect = SquareEffect(end, clock=clock)
+    notice = None
+    if state.stalemate_skipped:
+        # The opponent had no legal move, so the house rule handed the turn
+        # straight back. Say so, or it reads as the same side moving twice.
+        side = "White" if state.is_white_turn else "Black"
+        notice = Notice(f"Stalemate - {side} moves again", clock=clock)
+    return MoveAnimation(segments, clock=clock), effect, notice
@@ -0,0 +1,287 @@
+"""Replays of games, exported as animated GIFs or as numbered PNG frames.
+
+    python -m gui.replay game.txt --out replay.gif [--size 400] [--panel]
+    python -m gui.replay game.txt --out frames/
+
+The game record is the first line of the input (or of stdin, given '-') with
+moves in it, written as for gui.diagram: `startpos moves e2e4 e7e5 ...`, or
+`fen <FEN> moves ...`. Each move is played through GameState and shown the way
+the game shows it -- the slide, the spy's burst, the stalemate banner and, at
+the end, the game-over card -- by the same renderer, offscreen.
+
+The animations run on a virtual clock that moves on by exactly one frame per
+frame drawn, so a replay comes out the same however fast the machine is. Each
+frame is handed to the writer as soon as it is drawn, so a long game takes no
+more memory than a short one. Between frames the renderer redraws only what
+changed, and only that part of the picture is compared with the last frame:
+a frame that looks the same is not written again, the one before is shown for
+longer instead.
+
+An output ending in .gif is a GIF (see gui.gif); anything else is a directory
+of PNGs, one per distinct frame, with a `frames.txt` giving how long each is
+shown, in the form of ffmpeg's concat demuxer:
+
+    ffmpeg -f concat -i frames/frames.txt replay.mp4
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from dataclasses import replace
+from typing import Iterator, List, Optional, Tuple
+
+import pygame
+
+from game import uci
+from gui import gif
+from gui.diagram import Diagram, game_state, open_renderer, read_diagrams
+from gui.renderer import (
+    WINDOW_HEIGHT,
+    WINDOW_WIDTH,
+    GUIRenderer,
+    move_visuals,
+)
+
+DEFAULT_SIZE = 400
+# A frame every 20 ms. GIF delays are whole hundredths of a second, so frame
+# times are kept to multiples of 10 ms, and browsers slow down anything
+# shorter than 20 ms.
+FRAME_MS = 20
+# How long each position stays up after its move has landed, and the last one.
+PAUSE_MS = 700
+END_MS = 3000
+FRAME_LIST = "frames.txt"
+
+
+class VirtualClock:
+    """Milliseconds that pass only when told to, for MoveAnimation and friends."""
+
+    def __init__(self, now: int = 0):
+        self.now = now
+
+    def __call__(self) -> int:
+        return self.now
+
+    def advance(self, ms: int):
+        self.now += ms
+
+
+def read_game(lines) -> Diagram:
+    """The first game record in the lines; ValueError if there is none."""
+    for diagram, error in read_diagrams(lines):
+        if error is not None:
+            raise ValueError(error)
+        if diagram.moves:
+            return diagram
+    raise ValueError("No game record (a line with moves) found")
+
+
+def frames(
+    renderer: GUIRenderer,
+    canvas: pygame.Surface,
+    game: Diagram,
+    frame_ms: int = FRAME_MS,
+    pause_ms: int = PAUSE_MS,
+    end_ms: int = END_MS,
+) -> Iterator[Tuple[List[pygame.Rect], int]]:
+    """Draw the replay into `canvas` a frame at a time.
+
+    Yields, after each frame, the areas the renderer drew and how many
+    milliseconds the frame is shown for. Raises ValueError at a move that
+    cannot be played.
+    """
+    clock = VirtualClock()
+    state = game_state(replace(game, moves=()))
+    anim = effect = notice = None
+
+    def hold(ms: int) -> Iterator[Tuple[List[pygame.Rect], int]]:
+        nonlocal anim, effect, notice
+        for _ in range(max(1, -(-ms // frame_ms))):
+            # Finished flourishes are dropped, as the game loop drops them.
+            if anim is not None and anim.done:
+                anim = None
+            if effect is not None and effect.done:
+                effect = None
+            if notice is not None and notice.done:
+                notice = None
+            # Nobody is pointing at the board, so nothing lights up under a
+            # pointer.
+            rects = renderer.render(
+                canvas, state, anim=anim, effect=effect, notice=notice, mouse=(-1, -1)
+            )
+            yield rects, frame_ms
+            clock.advance(frame_ms)
+
+    yield from hold(pause_ms)
+    for text in game.moves:
+        (start, end), promotion = uci.parse_move(text)
+        if state.game_over or end not in state.get_legal_moves(start):
+            raise ValueError(f"Illegal move {text}")
+        mover = state.board.get_piece(start)
+        state.make_move(start, end, promotion)
+        anim, new_effect, new_notice = move_visuals(state, mover, start, end, clock)
+        effect = new_effect or effect
+        notice = new_notice or notice
+        yield from hold(anim.duration + (end_ms if state.game_over else pause_ms))
+    if not state.game_over:
+        yield from hold(end_ms - pause_ms)
+
+
+class FrameWriter:
+    """Writes distinct frames as PNGs into a directory, with their durations."""
+
+    def __init__(self, out_dir: str):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.frames = 0
+        self._previous: Optional[pygame.Surface] = None
+        self._list = open(os.path.join(out_dir, FRAME_LIST), "w")
+        # The last frame saved, as (file name, milliseconds shown so far).
+        self._pending: Optional[Tuple[str, int]] = None
+
+    def add(self, frame: pygame.Surface, duration_ms: int, area=None):
+        """Like GifWriter.add."""
+        if self._previous is not None:
+            bounds = self._previous.get_rect()
+            area = bounds if area is None else pygame.Rect(area).clip(bounds)
+            changed = gif.changed_rect(self._previous, frame, area)
+            if changed is None:
+                name, shown = self._pending
+                self._pending = (name, shown + duration_ms)
+                return
+            self._previous.blit(frame, changed, changed)
+        else:
+            self._previous = frame.copy()
+
+        self._flush()
+        self.frames += 1
+        name = f"frame-{self.frames:05d}.png"
+        pygame.image.save(frame, os.path.join(self.out_dir, name))
+        self._pending = (name, duration_ms)
+
+    def close(self):
+        name = self._pending[0] if self._pending else None
+        self._flush()
+        if name is not None:
+            # The concat demuxer ignores the last duration unless the file is
+            # listed once more after it.
+            self._list.write(f"file '{name}'\n")
+        self._list.close()
+
+    def _flush(self):
+        if self._pending is None:
+            return
+        name, shown = self._pending
+        self._list.write(f"file '{name}'\nduration {shown / 1000:g}\n")
+        self._pending = None
+
+
+def export(
+    game: Diagram,
+    out: str,
+    size: int = DEFAULT_SIZE,
+    panel: bool = False,
+    frame_ms: int = FRAME_MS,
+) -> dict:
+    """Replay the game into `out`, a .gif file or a directory, and report.
+
+    The picture is the board, or with `panel` the whole window, scaled to
+    `size` pixels wide.
+    """
+    started = time.perf_counter()
+    renderer = open_renderer()
+    canvas = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+    width = WINDOW_WIDTH if panel else renderer.board_size
+    view = pygame.Rect(0, 0, width, WINDOW_HEIGHT)
+    scale = size / view.width
+    output_size = (size, round(view.height * scale))
+    scaled = pygame.Surface(output_size)
+
+    if out.lower().endswith(".gif"):
+        f = open(out, "wb")
+        writer = gif.GifWriter(f, output_size)
+    else:
+        f = None
+        writer = FrameWriter(out)
+    drawn = 0
+    shown_ms = 0
+    try:
+        for rects, duration in frames(renderer, canvas, game, frame_ms):
+            drawn += 1
+            shown_ms += duration
+            rects = [rect.clip(view) for rect in rects]
+            rects = [rect for rect in rects if rect.width and rect.height]
+            if not rects:
+                area = pygame.Rect(0, 0, 0, 0)
+            else:
+                pygame.transform.smoothscale(
+                    canvas.subsurface(view), output_size, scaled
+                )
+                drawn_area = rects[0].unionall(rects[1:])
+                # Scaling smears each change a pixel or so past its edges.
+                area = pygame.Rect(
+                    int(drawn_area.x * scale),
+                    int(drawn_area.y * scale),
+                    int(drawn_area.width * scale) + 2,
+                    int(drawn_area.height * scale) + 2,
+                ).inflate(4, 4)
+            writer.add(scaled, duration, area)
+    finally:
+        writer.close()
+        if f is not None:
+            f.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "moves": len(game.moves),
+        "drawn": drawn,
+        "written": writer.frames,
+        "replay_seconds": shown_ms / 1000,
+        "seconds": round(seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a Chess 2 game replay")
+    parser.add_argument("input", help="a game record; '-' for stdin")
+    parser.add_argument(
+        "--out", default="replay.gif", help="a .gif file, or a directory for PNGs"
+    )
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="pixels wide")
+    parser.add_argument(
+        "--panel", action="store_true", help="show the side panel beside the board"
+    )
+    parser.add_argument(
+        "--frame-ms", type=int, default=FRAME_MS, help="a multiple of 10"
+    )
+    args = parser.parse_args()
+    if args.size < 1:
+        parser.error("--size must be positive")
+    if args.frame_ms < 10 or args.frame_ms % 10:
+        parser.error("--frame-ms must be a positive multiple of 10")
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    try:
+        lines = sys.stdin if args.input == "-" else open(args.input)
+    except OSError as e:
+        parser.error(f"Cannot read {args.input}: {e}")
+    try:
+        with lines:
+            game = read_game(lines)
+        report = export(game, args.out, args.size, args.panel, args.frame_ms)
+    except (ValueError, OSError, pygame.error) as e:
+        logging.error(f"Cannot export {args.input}: {e}")
+        sys.exit(1)
+    logging.info(
+        f"{report['moves']} moves, {report['replay_seconds']}s of replay:"
+        f" {report['written']} of {report['drawn']} frames written to"
+        f" {args.out} in {report['seconds']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Opt-in timing of the game's hot paths, per subsystem.
+
+    CHESS2_PROFILE=1 python src/main.py               summary on exit
+    CHESS2_PROFILE=chess2.folded python src/main.py   plus collapsed stacks
+    python -m gui.app --profile chess2.folded         the same, as a flag
+
+When on, the functions in TARGETS -- move generation and check detection in
+ChessBoard, GameState.make_move and _update_game_status, the search, and the
+steps of GUIRenderer.render -- are wrapped to count their calls and time them.
+On exit a summary table goes to stderr, and if a file was named, the time
+spent in each call stack is written to it in the collapsed format that
+flamegraph.pl and speedscope read, in microseconds.
+
+When off nothing is wrapped, so it costs nothing at all. Only modules already
+imported when profiling is switched on are wrapped: the GUI is not pulled into
+the engine's tools.
+"""
+
+import atexit
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, TextIO, Tuple
+
+ENV_VAR = "CHESS2_PROFILE"
+
+# module: (class or None for module-level functions, names)
+TARGETS: Dict[str, List[Tuple[Optional[str], Sequence[str]]]] = {
+    "core.board": [
+        (
+            "ChessBoard",
+            (
+                "get_moves",
+                "legal_moves_for",
+                "has_legal_moves",
+                "_pinned",
+                "_get_pawn_moves",
+                "_get_knight_moves",
+                "_get_spy_moves",
+                "_get_bishop_moves",
+                "_get_rook_moves",
+                "_get_queen_moves",
+                "_get_king_moves",
+                "_get_castling_moves",
+                "is_in_check",
+                "_is_square_attacked",
+                "apply_move",
+                "undo_move",
+                "static_exchange",
+            ),
+        ),
+    ],
+    "game.state": [
+        (
+            "GameState",
+            (
+                "make_move",
+                "_update_game_status",
+                "get_legal_moves",
+                "undo",
+                "_get_position_string",
+            ),
+        ),
+    ],
+    "game.ai": [
+        (None, ("think", "evaluate")),
+        ("_Search", ("best_move", "negamax", "quiesce")),
+    ],
+    "game.book": [("OpeningBook", ("choose",))],
+    "game.tablebase": [("Tablebases", ("probe",))],
+    "gui.renderer": [
+        (
+            "GUIRenderer",
+            (
+                "render",
+                "render_menu",
+                "render_rules",
+                "_draw_board",
+                "_draw_labels",
+                "_draw_highlights",
+                "_draw_legal_moves",
+                "_draw_pieces",
+                "_draw_animated_pieces",
+                "_draw_dragged_piece",
+                "_draw_effect",
+                "_draw_panel",
+                "_draw_captured",
+                "_draw_move_list",
+                "_draw_search_stats",
+                "_draw_promotion",
+                "_draw_notice",
+                "_draw_rules_overlay",
+                "_draw_game_over",
+            ),
+        ),
+    ],
+}
+
+
+class Profiler:
+    """Call counts and times per function, and time per call stack."""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = defaultdict(int)
+        # Inclusive time, counted once however deep a function recurses.
+        self.total: Dict[str, float] = defaultdict(float)
+        # Exclusive time: without the wrapped functions it called.
+        self.own: Dict[str, float] = defaultdict(float)
+        self.stacks: Dict[Tuple[str, ...], float] = defaultdict(float)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _frames(self) -> List[list]:
+        frames = getattr(self._local, "frames", None)
+        if frames is None:
+            frames = self._local.frames = []
+        return frames
+
+    def enter(self, name: str):
+        # [name, start, time spent in wrapped callees]
+        self._frames().append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        now = time.perf_counter()
+        frames = self._frames()
+        name, start, inner = frames.pop()
+        elapsed = now - start
+        if frames:
+            frames[-1][2] += elapsed
+        stack = tuple(frame[0] for frame in frames) + (name,)
+        with self._lock:
+            self.calls[name] += 1
+            self.own[name] += elapsed - inner
+            if name not in stack[:-1]:
+                self.total[name] += elapsed
+            self.stacks[stack] += elapsed - inner
+
+    def wrap(self, func: Callable, name: str) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            # Timed from the call to the result, awaits included. The GUI
+            # awaits one search at a time, so the stack stays nested.
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                self.enter(name)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.exit()
+
+            return timed_async
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            self.enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.exit()
+
+        return timed
+
+    def summary(self, limit: int = 40) -> str:
+        """A table of the functions taking the most time of their own."""
+        lines = [
+            f"{'calls':>10} {'total ms':>10} {'own ms':>10} {'us/call':>9}  function"
+        ]
+        names = sorted(self.own, key=self.own.get, reverse=True)[:limit]
+        for name in names:
+            calls = self.calls[name]
+            lines.append(
+                f"{calls:>10} {self.total[name] * 1e3:>10.1f}"
+                f" {self.own[name] * 1e3:>10.1f}"
+                f" {self.total[name] / calls * 1e6:>9.1f}  {name}"
+            )
+        return "\n".join(lines)
+
+    def write_collapsed(self, f: TextIO):
+        """One 'outer;inner;innermost microseconds' line per call stack."""
+        for stack, seconds in sorted(self.stacks.items()):
+            micros = round(seconds * 1e6)
+            if micros:
+                f.write(f"{';'.join(stack)} {micros}\n")
+
+
+_PROFILER: Optional[Profiler] = None
+# (owner, attribute, original) for everything wrapped, to undo it.
+_WRAPPED: List[Tuple[object, str, Callable]] = []
+
+
+def active() -> Optional[Profiler]:
+    return _PROFILER
+
+
+def enable(output: Optional[str] = None, at_exit: bool = True) -> Profiler:
+    """Wrap the TARGETS of the modules imported so far and start counting.
+
+    With `at_exit` the summary is printed, and `output` if given gets the
+    collapsed stacks, when the program ends.
+    """
+    global _PROFILER
+    if _PROFILER is not None:
+        return _PROFILER
+    _PROFILER = profiler = Profiler()
+
+    for module_name, owners in TARGETS.items():
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        short = module_name.rsplit(".", 1)[-1]
+        for owner_name, names in owners:
+            owner = module if owner_name is None else getattr(module, owner_name)
+            for name in names:
+                func = vars(owner).get(name)
+                if not inspect.isfunction(func):
+                    logging.warning(f"Profiling: no function {module_name} {name}")
+                    continue
+                label = func.__qualname__ if owner_name else f"{short}.{name}"
+                setattr(owner, name, profiler.wrap(func, label))
+                _WRAPPED.append((owner, name, func))
+
+    if at_exit:
+        atexit.register(_dump, profiler, output)
+    logging.info(f"Profiling {len(_WRAPPED)} functions")
+    return profiler
+
+
+def disable() -> Optional[Profiler]:
+    """Unwrap everything; returns the profiler with what it counted."""
+    global _PROFILER
+    profiler, _PROFILER = _PROFILER, None
+    while _WRAPPED:
+        owner, name, func = _WRAPPED.pop()
+        setattr(owner, name, func)
+    return profiler
+
+
+def _dump(profiler: Profiler, output: Optional[str]):
+    print(profiler.summary(), file=sys.stderr)
+    if output:
+        try:
+            with open(output, "w") as f:
+                profiler.write_collapsed(f)
+        except OSError as e:
+            logging.error(f"Could not write the profile to {output}: {e}")
+            return
+        print(f"Collapsed stacks written to {output}", file=sys.stderr)
+
+
+def configure(flag: Optional[str] = None) -> Optional[Profiler]:
+    """Switch profiling on from a --profile flag or the environment.
+
+    `flag` is the flag's value: '-' for a summary only, or a file for the
+    collapsed stacks too. Without the flag, CHESS2_PROFILE works the same
+    way, with 1 for a summary only.
+    """
+    if flag is None:
+        flag = os.environ.get(ENV_VAR, "")
+        if flag in ("", "0"):
+            return None
+        if flag == "1":
+            flag = "-"
+    return enable(None if flag == "-" else flag)
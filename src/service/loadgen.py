@@ -0,0 +1,177 @@
+"""Load generator for the analysis service: throughput and latency under load.
+
+    python -m service.loadgen --url http://127.0.0.1:8765 --clients 32 --requests 500
+
+Each client keeps one HTTP connection open and sends analysis requests back to
+back, cycling through a handful of opening positions. Several clients asking
+about the same position at once is deliberate: that is what request coalescing
+is for, and the service's /stats afterwards shows how much of it happened.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+from core.board import ChessBoard
+from core.fen import board_to_fen
+from game.uci import play_moves
+
+# Short opening lines, played out from the start position for the request mix.
+OPENINGS = [
+    [],
+    ["e2e4"],
+    ["e2e4", "d7d5"],
+    ["d2d4", "g8f6"],
+    ["h2g4", "h7g5"],
+    ["g1f3", "e7e5", "b1c3"],
+    ["e2e4", "e7e5", "d1h5", "b8c6"],
+    ["c2c4", "c7c5", "b1c3", "b8c6"],
+]
+
+
+def opening_fens() -> List[str]:
+    fens = []
+    for moves in OPENINGS:
+        board = ChessBoard()
+        is_white, illegal = play_moves(board, True, moves)
+        if illegal is not None:
+            raise ValueError(f"Opening line has an illegal move: {illegal}")
+        fens.append(board_to_fen(board, is_white))
+    return fens
+
+
+class _Connection:
+    """One keep-alive HTTP/1.1 connection to the service."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, payload: Optional[dict] = None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.writer.write(
+            (
+                f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {self.host}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n"
+            ).encode()
+            + body
+        )
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def _client(
+    host: str,
+    port: int,
+    fens: List[str],
+    count: int,
+    request: dict,
+    results: List[Tuple[float, int]],
+    rng: random.Random,
+):
+    connection = _Connection(host, port)
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            status, _ = await connection.request(
+                "POST", "/analyse", {**request, "fen": rng.choice(fens)}
+            )
+            results.append((time.perf_counter() - started, status))
+    finally:
+        connection.close()
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(
+    url: str, clients: int, requests: int, depth: int, deadline_ms: Optional[int]
+) -> dict:
+    parsed = urlparse(url)
+    host, port = parsed.hostname or "127.0.0.1", parsed.port or 80
+    fens = opening_fens()
+    request = {"depth": depth}
+    if deadline_ms is not None:
+        request["deadline_ms"] = deadline_ms
+
+    results: List[Tuple[float, int]] = []
+    share, extra = divmod(requests, clients)
+    per_client = [share + (i < extra) for i in range(clients)]
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _client(host, port, fens, count, request, results, random.Random(i))
+            for i, count in enumerate(per_client)
+        )
+    )
+    elapsed = time.perf_counter() - started
+
+    stats_connection = _Connection(host, port)
+    try:
+        _, server_stats = await stats_connection.request("GET", "/stats")
+    finally:
+        stats_connection.close()
+
+    latencies = [latency for latency, status in results if status == 200]
+    report = {
+        "requests": len(results),
+        "ok": len(latencies),
+        "errors": len(results) - len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "server": server_stats,
+    }
+    if latencies:
+        report.update(
+            p50_ms=round(_percentile(latencies, 0.50) * 1000, 1),
+            p99_ms=round(_percentile(latencies, 0.99) * 1000, 1),
+            max_ms=round(max(latencies) * 1000, 1),
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the analysis service")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--deadline-ms", type=int, default=None)
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        run(args.url, args.clients, args.requests, args.depth, args.deadline_ms)
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
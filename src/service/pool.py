@@ -0,0 +1,260 @@
+"""A pool of warm engine processes for the analysis service.
+
+Each worker process keeps one transposition table for its whole life, so
+positions that come up again -- the same opening, a client re-asking after
+a move -- start from what earlier searches found instead of from nothing.
+
+Requests wait in a queue ordered by deadline (earliest first) rather than by
+arrival, so a client that needs an answer soon is not stuck behind a batch
+that can wait. Identical requests that arrive while one is queued or running
+are not searched again: they share its result, as long as that search may run
+until their own deadline. Each request still times out on its own deadline,
+without failing the others waiting on the same search.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from core.fen import START_FEN, board_from_fen, board_to_fen
+from game import ai, uci
+
+DEFAULT_HASH_MB = 64
+DEFAULT_DEPTH = 4
+
+# Seconds a request may wait and search for when it does not set a deadline.
+DEFAULT_DEADLINE = 60.0
+
+# Depth ceiling for requests that give only a time limit.
+MAX_DEPTH = uci.MAX_DEPTH
+
+# Seconds kept back from a request's deadline for handing the answer back.
+DEADLINE_MARGIN = 0.02
+
+# Seconds by which a request's deadline may fall after a search's and still
+# share it: requests sent together with the same deadline arrive a little apart.
+SHARE_SLACK = 0.05
+
+# Per-process state of the workers.
+_WORKER_TABLE: Optional[ai.TranspositionTable] = None
+
+
+class Overloaded(Exception):
+    """Too many requests are already waiting."""
+
+
+class DeadlineExpired(Exception):
+    """The request's deadline passed before a worker was free."""
+
+
+def _init_worker(hash_mb: int):
+    global _WORKER_TABLE
+    _WORKER_TABLE = ai.TranspositionTable(hash_mb)
+
+
+def _analyse(fen: str, depth: int, seconds: Optional[float]) -> dict:
+    """Search a position in a worker process; a JSON-ready result."""
+    board, is_white = board_from_fen(fen)
+    started = time.perf_counter()
+    result = {"bestmove": None, "score": None, "depth": 0, "nodes": 0}
+
+    def on_iteration(finished: int, score: int, found: List[ai.Move]):
+        kind, value = uci.format_score(score).split()
+        result.update(depth=finished, score={kind: int(value)})
+
+    search = ai._Search(
+        board,
+        table=_WORKER_TABLE,
+        deadline=started + seconds if seconds is not None else None,
+        on_iteration=on_iteration,
+    )
+    move = asyncio.run(search.best_move(depth, is_white))
+    if move is not None:
+        result["bestmove"] = uci.format_move(board, move)
+    result["nodes"] = search.nodes
+    result["time_ms"] = int((time.perf_counter() - started) * 1000)
+    return result
+
+
+class _Job:
+    """One search, shared by every request that asked for it."""
+
+    def __init__(self, key: Tuple, deadline: float):
+        self.key = key
+        self.deadline = deadline
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Requests still waiting for the result; once none are, a job that has
+        # not started is dropped.
+        self.waiters = 1
+
+
+class EnginePool:
+    """Schedules analysis requests onto a fixed set of engine processes."""
+
+    def __init__(
+        self, workers: int = 2, hash_mb: int = DEFAULT_HASH_MB, max_queue: int = 1000
+    ):
+        self.workers = workers
+        self.hash_mb = hash_mb
+        self.max_queue = max_queue
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._dispatchers: List[asyncio.Task] = []
+        # (deadline, sequence, job)
+        self._queue: List[Tuple[float, int, _Job]] = []
+        self._sequence = itertools.count()
+        self._ready: Optional[asyncio.Condition] = None
+        # Jobs queued or running, by what they search. There can be several for
+        # one key when their deadlines differ.
+        self._jobs: Dict[Tuple, List[_Job]] = {}
+        self.stats = {"requests": 0, "coalesced": 0, "searched": 0, "expired": 0}
+
+    async def start(self):
+        """Start the worker processes and warm them up."""
+        # Spawned rather than forked, so a worker never inherits the server's
+        # event loop or sockets.
+        self._executor = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.hash_mb,),
+        )
+        self._ready = asyncio.Condition()
+        loop = asyncio.get_running_loop()
+        # One small search per worker starts every process and gets the
+        # imports out of the way before the first real request.
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, _analyse, START_FEN, 1, None)
+                for _ in range(self.workers)
+            )
+        )
+        self._dispatchers = [
+            asyncio.ensure_future(self._dispatch()) for _ in range(self.workers)
+        ]
+
+    async def close(self):
+        for task in self._dispatchers:
+            task.cancel()
+        self._dispatchers = []
+        for _, _, job in self._queue:
+            if not job.future.done():
+                job.future.cancel()
+        self._queue = []
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    async def analyse(
+        self,
+        fen: str,
+        depth: Optional[int] = None,
+        movetime: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ) -> dict:
+        """Best move and score for a position.
+
+        `movetime` and `deadline` are in seconds, the deadline counted from now;
+        the search stops early to meet it, and a request still waiting when it
+        passes fails with DeadlineExpired. Raises ValueError for a bad FEN and
+        Overloaded when the queue is full.
+        """
+        board, is_white = board_from_fen(fen)
+        if depth is None:
+            depth = MAX_DEPTH if movetime is not None else DEFAULT_DEPTH
+        depth = max(1, min(depth, MAX_DEPTH))
+        # Normalised, so FENs that differ only in move counters share a search.
+        key = (board_to_fen(board, is_white), depth, movetime)
+        if deadline is None:
+            deadline = DEFAULT_DEADLINE
+        due = time.perf_counter() + deadline
+        self.stats["requests"] += 1
+
+        # Only a search allowed to run at least as long as this request's own
+        # would is shared; bringing a search's deadline forward would cut it
+        # short, or expire it, for the requests already waiting on it.
+        jobs = self._jobs.get(key, ())
+        job = next((j for j in jobs if j.deadline >= due - SHARE_SLACK), None)
+        if job is not None:
+            self.stats["coalesced"] += 1
+            job.waiters += 1
+        else:
+            if self.queued >= self.max_queue:
+                raise Overloaded
+            job = _Job(key, due)
+            self._jobs.setdefault(key, []).append(job)
+            await self._push(job)
+
+        # Shielded: one waiter giving up must not cancel the search for the
+        # others. A request due before the search's own deadline gives up on
+        # its own; the rest are answered, or expired, with the search.
+        timeout = due - time.perf_counter() if due < job.deadline else None
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except asyncio.TimeoutError:
+            job.waiters -= 1
+            self.stats["expired"] += 1
+            raise DeadlineExpired from None
+        except asyncio.CancelledError:
+            job.waiters -= 1
+            raise
+
+    async def _push(self, job: _Job):
+        heapq.heappush(self._queue, (job.deadline, next(self._sequence), job))
+        async with self._ready:
+            self._ready.notify()
+
+    async def _next_job(self) -> _Job:
+        async with self._ready:
+            while True:
+                while self._queue:
+                    _, _, job = heapq.heappop(self._queue)
+                    if job.waiters > 0:
+                        return job
+                    job.future.cancel()
+                    self._forget(job)
+                await self._ready.wait()
+
+    def _forget(self, job: _Job):
+        jobs = self._jobs.get(job.key, [])
+        if job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del self._jobs[job.key]
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._next_job()
+            fen, depth, movetime = job.key
+            remaining = job.deadline - time.perf_counter() - DEADLINE_MARGIN
+            try:
+                if remaining <= 0:
+                    self.stats["expired"] += 1
+                    raise DeadlineExpired
+                seconds = remaining if movetime is None else min(movetime, remaining)
+                self.stats["searched"] += 1
+                result = await loop.run_in_executor(
+                    self._executor, _analyse, fen, depth, seconds
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not isinstance(e, DeadlineExpired):
+                    logging.error(f"Analysis of {fen} failed: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                result["shared_by"] = job.waiters
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._forget(job)
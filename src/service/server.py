@@ -0,0 +1,321 @@
+"""Local analysis service: best move and evaluation over HTTP and WebSocket.
+
+    chess2-service --port 8765 --workers 4
+
+HTTP:
+    POST /analyse   {"fen": ..., "depth": 4, "movetime_ms": 500, "deadline_ms": 2000}
+    GET  /stats     request counters and queue length
+    GET  /health
+
+WebSocket (/ws): send the same JSON objects as messages, with an "id" to match
+answers to questions; any number can be in flight on one connection, and
+answers come back as they finish rather than in order.
+
+Every field but "fen" is optional. The answer is
+    {"bestmove": "e2e4", "score": {"cp": 12}, "depth": 4, "nodes": ..., ...}
+with the score from the side to move's point of view, {"mate": n} once a mate
+is found, and "bestmove" null when the side to move has no moves.
+
+Only the standard library is used, so the service runs wherever the engine
+does. It is meant for local use: there is no TLS and no authentication.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import struct
+from typing import Optional, Tuple
+
+from service.pool import DEFAULT_HASH_MB, DeadlineExpired, EnginePool, Overloaded
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Requests and WebSocket messages are small JSON objects; anything much bigger
+# is a mistake or abuse.
+MAX_BODY = 64 * 1024
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class RequestError(Exception):
+    """A request the service cannot answer, with the HTTP status to say so."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AnalysisServer:
+    def __init__(self, pool: EnginePool):
+        self.pool = pool
+
+    async def answer(self, request: dict) -> dict:
+        """Run one analysis request; raises RequestError if it cannot be done."""
+        fen = request.get("fen")
+        if not isinstance(fen, str):
+            raise RequestError(400, "missing fen")
+        try:
+            depth = _optional_number(request, "depth")
+            movetime = _optional_number(request, "movetime_ms")
+            deadline = _optional_number(request, "deadline_ms")
+            return await self.pool.analyse(
+                fen,
+                depth=int(depth) if depth is not None else None,
+                movetime=movetime / 1000 if movetime is not None else None,
+                deadline=deadline / 1000 if deadline is not None else None,
+            )
+        except ValueError as e:
+            raise RequestError(400, str(e))
+        except Overloaded:
+            raise RequestError(503, "too many requests queued")
+        except DeadlineExpired:
+            raise RequestError(504, "deadline passed before a worker was free")
+        except Exception as e:
+            # A worker died or the pool broke (BrokenProcessPool and the like):
+            # still an answer for the client, with the details in the log.
+            logging.exception(f"Analysis of {fen} failed")
+            raise RequestError(500, f"analysis failed: {e}")
+
+    # ------------------------------------------------------------------- HTTP
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            # Keep-alive: serve requests on the connection until it closes.
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers)
+                    break
+                status, payload = await self._route(method, path, body)
+                _write_response(writer, status, payload)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except RequestError as e:
+            _write_response(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, dict]:
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/stats":
+            return 200, {**self.pool.stats, "queued": self.pool.queued}
+        if path != "/analyse" or method != "POST":
+            return 404, {"error": f"no such endpoint: {method} {path}"}
+        try:
+            request = json.loads(body or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+            return 200, await self.answer(request)
+        except ValueError as e:
+            return 400, {"error": f"bad request: {e}"}
+        except RequestError as e:
+            return e.status, {"error": str(e)}
+
+    # -------------------------------------------------------------- WebSocket
+
+    async def _websocket(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: dict
+    ):
+        key = headers.get("sec-websocket-key")
+        if key is None:
+            raise RequestError(400, "missing Sec-WebSocket-Key")
+        accept = base64.b64encode(
+            hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()
+        ).decode()
+        writer.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode()
+        )
+        await writer.drain()
+
+        pending = set()
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                if frame is None:
+                    break
+                opcode, payload = frame
+                if opcode == 0x8:  # close
+                    writer.write(_frame(0x8, payload[:2]))
+                    break
+                if opcode == 0x9:  # ping
+                    writer.write(_frame(0xA, payload))
+                    continue
+                if opcode != 0x1:  # only text messages carry requests
+                    continue
+                task = asyncio.ensure_future(self._ws_answer(writer, payload))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _ws_answer(self, writer: asyncio.StreamWriter, payload: bytes):
+        message_id = None
+        try:
+            request = json.loads(payload)
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+            message_id = request.get("id")
+            reply = await self.answer(request)
+        except ValueError as e:
+            reply = {"error": f"bad request: {e}"}
+        except RequestError as e:
+            reply = {"error": str(e)}
+        reply = {**reply, "id": message_id}
+        try:
+            writer.write(_frame(0x1, json.dumps(reply).encode()))
+            await writer.drain()
+        except ConnectionError:
+            pass  # the client left without waiting for its answer
+
+
+def _optional_number(request: dict, field: str) -> Optional[float]:
+    value = request.get(field)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{field} must be a positive number")
+    return value
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, dict, bytes]]:
+    """(method, path, lower-cased headers, body), or None at end of stream."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise RequestError(400, "malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise RequestError(400, "bad Content-Length")
+    if length > MAX_BODY:
+        raise RequestError(413, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?", 1)[0], headers, body
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, payload: dict):
+    body = json.dumps(payload).encode()
+    writer.write(
+        (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode()
+        + body
+    )
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Optional[Tuple[int, bytes]]:
+    """(opcode, payload) of the next client frame, or None at end of stream.
+
+    Clients do not fragment small JSON messages in practice, so continuation
+    frames are not reassembled.
+    """
+    try:
+        first, second = await reader.readexactly(2)
+    except asyncio.IncompleteReadError:
+        return None
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    if length > MAX_BODY:
+        return None
+    mask = await reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+    payload = await reader.readexactly(length)
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def _frame(opcode: int, payload: bytes) -> bytes:
+    """A final, unmasked server frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 2**16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def serve(host: str, port: int, workers: int, hash_mb: int):
+    pool = EnginePool(workers, hash_mb)
+    await pool.start()
+    server = AnalysisServer(pool)
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    logging.info(f"Analysis service on http://{host}:{port} with {workers} workers")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chess 2 analysis service")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=2, help="engine processes")
+    parser.add_argument(
+        "--hash", type=int, default=DEFAULT_HASH_MB, help="hash table per worker, in MB"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.hash))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
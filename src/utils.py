@@ -1,6 +1,11 @@
 import os
 import sys
 
+try:
+    import mmap
+except ImportError:  # not in every build, e.g. the browser (pygbag)
+    mmap = None
+
 
 def _resource_path(relative_path):
     if sys.platform == "emscripten":
@@ -14,3 +19,18 @@ def _resource_path(relative_path):
         )
 
     return os.path.join(base_path, relative_path)
+
+
+def map_readonly(path):
+    """The bytes of a file, memory-mapped where possible.
+
+    Mapped files are paged in on demand and shared between processes; where
+    mmap is unavailable (e.g. the browser build) or fails, the file is read.
+    """
+    with open(path, "rb") as f:
+        if mmap is not None:
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                pass  # e.g. an empty file, which cannot be mapped
+        return f.read()
@@ -0,0 +1,195 @@
+"""Microbenchmarks for the board's hot paths, per function and game phase.
+
+    PYTHONPATH=src python tests/bench_board.py [--json] [--filter legal]
+
+The whole-search benchmark (game.bench) says whether the engine got faster;
+this says where. Each case times one function over fixed opening, middlegame
+and endgame positions and reports the best of several runs in microseconds
+per call -- per piece for the per-piece functions, per move for making moves
+-- so a change to one function can be measured on its own.
+
+Not collected by pytest (no test_ prefix); test_bench.py runs every case once
+so the suite cannot quietly break.
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.board import ChessBoard
+from core.fen import board_from_fen
+from core.piece import PieceType
+from game import ai
+from game.bench import POSITIONS
+from game.state import GameState
+
+# The engine benchmark's suite, by phase.
+CORPUS = {
+    "opening": POSITIONS[:3],
+    "middlegame": POSITIONS[3:11],
+    "endgame": POSITIONS[11:],
+}
+
+DEFAULT_REPEAT = 5
+# Roughly how long each timed run lasts. Long enough to dwarf the timer's own
+# overhead, short enough that the whole suite takes well under a minute.
+RUN_SECONDS = 0.05
+
+# A case gets a position and returns the function to time and how many
+# operations one call of it stands for; None skips the position, e.g. get_moves
+# for a piece type that is not on the board.
+Case = Callable[[ChessBoard, bool], Optional[Tuple[Callable[[], object], int]]]
+
+
+def _squares(board: ChessBoard, is_white: bool, piece_type=None):
+    return [
+        (r, c)
+        for r in range(8)
+        for c in range(8)
+        if board.board[r][c] is not None
+        and board.board[r][c].is_white == is_white
+        and (piece_type is None or board.board[r][c].type == piece_type)
+    ]
+
+
+def _get_moves(piece_type: PieceType) -> Case:
+    def case(board: ChessBoard, is_white: bool):
+        squares = _squares(board, is_white, piece_type)
+        if not squares:
+            return None
+
+        def run():
+            for square in squares:
+                board.get_moves(square)
+
+        return run, len(squares)
+
+    return case
+
+
+def _king_attacked(board: ChessBoard, is_white: bool):
+    king = board._king_position(is_white)
+    return lambda: board._is_square_attacked(king, not is_white), 1
+
+
+def _apply_move(board: ChessBoard, is_white: bool):
+    moves = board.legal_moves_for(is_white)
+
+    def run():
+        for move in moves:
+            board.undo_move(board.apply_move(*move))
+
+    return run, len(moves)
+
+
+def _restore(board: ChessBoard, is_white: bool):
+    snap = board.snapshot()
+    return lambda: board.restore(snap), 1
+
+
+def _game_state(board: ChessBoard, is_white: bool) -> GameState:
+    state = GameState()
+    state.board = board
+    state.is_white_turn = is_white
+    return state
+
+
+def _state_legal_moves(board: ChessBoard, is_white: bool):
+    state = _game_state(board, is_white)
+    squares = _squares(board, is_white)
+
+    def run():
+        for square in squares:
+            state.get_legal_moves(square)
+
+    return run, len(squares)
+
+
+def _position_string(board: ChessBoard, is_white: bool):
+    return _game_state(board, is_white)._get_position_string, 1
+
+
+CASES: Dict[str, Case] = {
+    **{f"get_moves[{t.name.lower()}]": _get_moves(t) for t in PieceType},
+    "is_in_check": lambda board, w: (lambda: board.is_in_check(w), 1),
+    "_is_square_attacked[king]": _king_attacked,
+    "legal_moves_for": lambda board, w: (lambda: board.legal_moves_for(w), 1),
+    "has_legal_moves": lambda board, w: (lambda: board.has_legal_moves(w), 1),
+    "snapshot": lambda board, w: (board.snapshot, 1),
+    "restore": _restore,
+    "apply_move+undo_move": _apply_move,
+    "GameState.get_legal_moves": _state_legal_moves,
+    "_get_position_string": _position_string,
+    "evaluate": lambda board, w: (lambda: ai.evaluate(board, w), 1),
+}
+
+
+def measure(
+    case: Case, fens: List[str], repeat: int = DEFAULT_REPEAT, quick: bool = False
+) -> Optional[float]:
+    """Microseconds per operation over the positions; the best of `repeat`.
+
+    None if no position has anything to time. `quick` runs everything once,
+    for checking that the cases still work.
+    """
+    total_seconds = 0.0
+    total_ops = 0
+    for fen in fens:
+        board, is_white = board_from_fen(fen)
+        prepared = case(board, is_white)
+        if prepared is None:
+            continue
+        run, ops = prepared
+        if not ops:
+            continue
+        timer = timeit.Timer(run)
+        number, best = 1, timer.timeit(1)
+        if not quick:
+            number = max(1, int(RUN_SECONDS / max(best, 1e-9)))
+            best = min(timer.repeat(repeat, number))
+        total_seconds += best / number
+        total_ops += ops
+    return round(total_seconds / total_ops * 1e6, 3) if total_ops else None
+
+
+def run(
+    filter_text: str = "", repeat: int = DEFAULT_REPEAT, quick: bool = False
+) -> Dict[str, Dict[str, Optional[float]]]:
+    """{case: {phase: microseconds per operation}} for the matching cases."""
+    return {
+        name: {
+            phase: measure(case, fens, repeat, quick) for phase, fens in CORPUS.items()
+        }
+        for name, case in CASES.items()
+        if filter_text in name
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the board's hot paths")
+    parser.add_argument("--filter", default="", help="only cases containing this")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args()
+
+    results = run(args.filter, args.repeat)
+    if args.json:
+        json.dump({"unit": "us", "results": results}, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'microseconds per call':<28}" + "".join(f"{p:>12}" for p in CORPUS))
+    for name, phases in results.items():
+        print(
+            f"{name:<28}"
+            + "".join(
+                f"{phases[p]:>12.2f}" if phases[p] is not None else f"{'-':>12}"
+                for p in CORPUS
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
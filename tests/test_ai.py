@@ -0,0 +1,203 @@
+import asyncio
+
+from core.board import ChessBoard
+from core.piece import Piece, PieceType
+from game import ai, book, tablebase
+from game.state import GameState
+
+
+def _empty_state() -> GameState:
+    state = GameState()
+    for row in range(8):
+        for col in range(8):
+            state.board.board[row][col] = None
+    return state
+
+
+def test_search_finds_mate_in_one():
+    """The root search, windows and all, still spots a back-rank mate"""
+    state = _empty_state()
+    board = state.board
+    board.board[0][6] = Piece(PieceType.KING, False, True)  # black king g8
+    board.board[1][5] = Piece(PieceType.PAWN, False)
+    board.board[1][6] = Piece(PieceType.PAWN, False)
+    board.board[1][7] = Piece(PieceType.PAWN, False)
+    board.board[7][0] = Piece(PieceType.ROOK, True, True)  # white rook a1
+    board.board[7][6] = Piece(PieceType.KING, True, True)
+
+    move = asyncio.run(ai._Search(board).best_move(3, True))
+    assert move == ((7, 0), (0, 0))
+
+
+def test_windowed_search_matches_full_window():
+    """PVS and aspiration windows change the cost of a search, not its score"""
+    state = GameState()
+    assert state.make_move((6, 4), (4, 4))
+    assert state.make_move((1, 3), (3, 3))
+    board = state.board
+
+    search = ai._Search(board)
+    moves = board.legal_moves_for(True)
+    full, _, _ = asyncio.run(
+        search._search_root(moves, 2, True, -ai.MATE_SCORE * 2, ai.MATE_SCORE * 2)
+    )
+
+    best = asyncio.run(ai._Search(board).best_move(2, True))
+    state.board.apply_move(*best)
+    reply = -asyncio.run(
+        ai._Search(board).negamax(1, False, -ai.MATE_SCORE * 2, ai.MATE_SCORE * 2)
+    )
+    assert reply == full
+
+    # The same root score with every later move searched in the full window.
+    # Pruning is off, since what it cuts depends on the window it is given.
+    plain = ("pvs", "null_move", "lmr")
+    scores = [
+        asyncio.run(
+            ai._Search(board, disabled=disabled).negamax(
+                3, True, -ai.MATE_SCORE * 2, ai.MATE_SCORE * 2
+            )
+        )
+        for disabled in (plain, plain[1:])
+    ]
+    assert scores[0] == scores[1]
+
+
+def test_stalemate_is_searched_as_a_pass():
+    """A stalemated side hands the move back, so a mate that follows is seen"""
+    state = _empty_state()
+    board = state.board
+    board.board[0][0] = Piece(PieceType.KING, False, True)  # black king a8
+    board.board[2][1] = Piece(PieceType.KING, True, True)  # white king b6
+    board.board[2][3] = Piece(PieceType.QUEEN, True)  # white queen d6
+
+    assert not board.legal_moves_for(False)
+    assert not board.is_in_check(False)
+    # Black cannot move, so white moves again and mates with Qd8.
+    score = asyncio.run(
+        ai._Search(board).negamax(3, False, -ai.MATE_SCORE * 2, ai.MATE_SCORE * 2)
+    )
+    assert score <= -ai.MATE_SCORE
+
+
+def test_book_moves_are_found_and_played(tmp_path, monkeypatch):
+    """Medium and Hard play a legal book move instead of searching"""
+    board = ChessBoard()
+    key = board.zobrist_key(True)
+    path = str(tmp_path / "book.bin")
+    book.write_book(
+        path,
+        [
+            (key - 1, ((6, 0), (5, 0)), 1),
+            (key, ((6, 4), (4, 4)), 3),
+            (key, ((6, 3), (4, 3)), 1),
+            (key, ((7, 0), (0, 0)), 500),  # illegal here, so never played
+            (key + 1, ((6, 0), (5, 0)), 1),
+        ],
+    )
+    opening_book = book.OpeningBook(path)
+    assert sorted(opening_book.moves(key))[:2] == [
+        (((6, 3), (4, 3)), 1),
+        (((6, 4), (4, 4)), 3),
+    ]
+    assert opening_book.moves(key + 2) == []
+
+    monkeypatch.setattr(book, "_BOOK", opening_book)
+    monkeypatch.setattr(book, "_BOOK_LOADED", True)
+    played = {asyncio.run(ai.choose_move(board, True, ai.MEDIUM)) for _ in range(20)}
+    assert played <= {((6, 4), (4, 4)), ((6, 3), (4, 3))}
+
+    move, stats = asyncio.run(ai.think(board, True, ai.HARD))
+    assert move in {((6, 4), (4, 4)), ((6, 3), (4, 3))} and stats is None
+    opening_book.close()
+
+
+def test_tablebase_values_agree_with_their_moves():
+    """Each shipped position scores as well as its best move, mate for mate"""
+    tablebases = tablebase.default_tablebases()
+    layout = tablebases.table("KRvK").layout
+    checked = 0
+    for index in range(0, layout.size, 97):
+        squares, is_white = layout.squares(index)
+        if len(set(squares)) < layout.men or layout.index(squares, is_white) != index:
+            continue
+        board = _empty_state().board
+        for (piece_type, white), square in zip(layout.pieces, squares):
+            board.board[square // 8][square % 8] = Piece(piece_type, white, True)
+        if board.is_in_check(not is_white):
+            continue
+
+        value = tablebases.probe(board, is_white)
+        found = tablebases.best_move(board, is_white)
+        if found is None:  # no moves: mated, or stalemated and passing
+            expected = -1 if board.is_in_check(is_white) else value
+        else:
+            expected = found[1]
+        assert value == expected
+        checked += 1
+    assert checked > 100
+
+
+def test_tablebases_are_probed_unless_castling_is_possible():
+    """Unmoved kings and rooks only stop a probe while they could castle"""
+    board = _empty_state().board
+    board.board[0][4] = Piece(PieceType.KING, False)  # black king e8, unmoved
+    board.board[7][4] = Piece(PieceType.KING, True)  # white king e1, unmoved
+    board.board[7][1] = Piece(PieceType.ROOK, True)  # white rook b1, unmoved
+    tablebases = tablebase.default_tablebases()
+    assert tablebases.probe(board, True) is not None
+
+    # A rook on h1 could castle, blocked or not, so the tables do not apply.
+    board.board[7][7], board.board[7][1] = board.board[7][1], None
+    board.board[7][6] = Piece(PieceType.KING, False, True)  # in the way, on g1
+    board.board[0][4] = None
+    assert tablebases.probe(board, True) is None
+
+
+def test_four_man_table_is_shipped():
+    """Spy against rook is covered, from either side of the board"""
+    board = _empty_state().board
+    board.board[7][0] = Piece(PieceType.KING, True, True)  # white king a1
+    board.board[5][2] = Piece(PieceType.SPY, True, True)  # white spy c3
+    board.board[0][7] = Piece(PieceType.KING, False, True)  # black king h8
+    board.board[3][3] = Piece(PieceType.ROOK, False, True)  # black rook d5
+    tablebases = tablebase.default_tablebases()
+    for is_white in (True, False):
+        value = tablebases.probe(board, is_white)
+        assert value is not None
+        assert tablebases.best_move(board, is_white)[1] == value
+
+
+def test_search_plays_tablebase_mate():
+    """With the queen alone left, the search plays the tablebase's mate"""
+    board = _empty_state().board
+    board.board[0][7] = Piece(PieceType.KING, False, True)  # black king h8
+    board.board[2][6] = Piece(PieceType.KING, True, True)  # white king g6
+    board.board[1][1] = Piece(PieceType.QUEEN, True, True)  # white queen b7
+    assert tablebase.default_tablebases().probe(board, True) == 1
+
+    reports = []
+    search = ai._Search(board, on_iteration=lambda *report: reports.append(report))
+    move = asyncio.run(search.best_move(4, True))
+    board.apply_move(*move)
+    assert board.is_in_check(False) and not board.legal_moves_for(False)
+    assert reports and reports[0][1] >= ai.MATE_SCORE
+
+
+def test_search_reports_statistics():
+    """The statistics add up, and the callback sees them while searching"""
+    state = GameState()
+    assert state.make_move((6, 4), (4, 4))
+    reports = []
+    search = ai._Search(state.board, yield_every=50, on_stats=reports.append)
+    asyncio.run(search.best_move(3, False))
+
+    stats = search.stats
+    assert reports and reports[-1] is stats
+    assert stats.nodes == search.nodes
+    assert 0 < stats.qnodes < stats.nodes
+    assert 0 < stats.tt_hits <= stats.tt_probes
+    assert 0 < stats.first_move_cutoffs <= stats.cutoffs
+    assert [i.depth for i in stats.iterations] == [1, 2, 3] and stats.depth == 3
+    assert sum(i.nodes for i in stats.iterations) == stats.nodes
+    assert stats.max_depth >= 3 and stats.branching_factor > 1
@@ -0,0 +1,32 @@
+import asyncio
+import os
+
+import pytest
+
+# No window needed: SDL's dummy driver draws into memory.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+pygame = pytest.importorskip("pygame")
+
+from gui.app import ChessApp  # noqa: E402
+
+
+def test_event_that_ends_an_idle_wait_is_handled_first():
+    """A quick tap arrives down then up, even when it wakes an idle game"""
+    app = ChessApp()
+    try:
+        app.in_menu = False
+        seen = []
+        app._handle_game_events = lambda event: seen.append(event.type)
+        pygame.event.clear()
+        for kind in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+            pygame.event.post(pygame.event.Event(kind, button=1, pos=(10, 10)))
+
+        asyncio.run(app._wait_for_event(100))
+        app._handle_events()
+        assert [kind for kind in seen if kind != pygame.MOUSEMOTION] == [
+            pygame.MOUSEBUTTONDOWN,
+            pygame.MOUSEBUTTONUP,
+        ]
+    finally:
+        pygame.quit()
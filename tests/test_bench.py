@@ -0,0 +1,39 @@
+import bench_board
+
+from game import bench
+
+
+def test_bench_signature_is_repeatable():
+    """Same settings, same nodes, same moves: the signature is a fingerprint"""
+    positions = bench.POSITIONS[:2] + bench.POSITIONS[-2:]
+    first = bench.run(depth=2, positions=positions)
+    second = bench.run(depth=2, positions=positions)
+
+    assert first["signature"] == second["signature"] > 0
+    assert [p["move"] for p in first["positions"]] == [
+        p["move"] for p in second["positions"]
+    ]
+    assert bench.compare(second, first, threshold=100.0) == []
+
+
+def test_bench_reports_a_changed_signature():
+    positions = bench.POSITIONS[:1]
+    baseline = bench.run(depth=1, positions=positions)
+    report = bench.run(depth=1, positions=positions)
+    report["signature"] += 1
+    report["positions"][0]["nodes"] += 1
+    report["nps"] = baseline["nps"] // 2
+
+    problems = bench.compare(report, baseline, threshold=5.0)
+    assert problems[0].startswith("Signature changed")
+    assert any(line.startswith("NPS regressed") for line in problems)
+
+
+def test_board_microbenchmarks_run():
+    """Every microbenchmark case still runs on every phase it applies to"""
+    results = bench_board.run(quick=True)
+    assert set(results) == set(bench_board.CASES)
+    for name, phases in results.items():
+        assert set(phases) == set(bench_board.CORPUS)
+        assert all(v is None or v > 0 for v in phases.values()), name
+    assert all(v is not None for v in results["legal_moves_for"].values())
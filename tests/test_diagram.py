@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+# No window needed: SDL's dummy driver draws into memory.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pygame = pytest.importorskip("pygame")
+
+from core.fen import START_FEN  # noqa: E402
+from gui import diagram  # noqa: E402
+
+KNIGHT_FEN = "rnbqk1nr/1ppp1p1s/7p/3N2p1/1p1PP1P1/6pP/PPPP3S/R1BQKB1R w KQkq - 0 8"
+
+
+def test_lines_describe_diagrams():
+    parsed = diagram.parse_line(
+        f"puzzle: fen {KNIGHT_FEN} highlight d5 arrow d5e7 d5c7", "unused"
+    )
+    assert parsed == diagram.Diagram(
+        "puzzle", KNIGHT_FEN, (), ("d5",), ("d5e7", "d5c7")
+    )
+    assert diagram.parse_line(KNIGHT_FEN, "bare").fen == KNIGHT_FEN
+    assert diagram.parse_line("startpos moves e2e4", "game").moves == ("e2e4",)
+    assert diagram.parse_line("# a comment", "x") is None
+    with pytest.raises(ValueError):
+        diagram.parse_line("startpos highlight z9", "x")
+
+
+def test_every_move_of_a_game_record():
+    items = list(diagram.read_diagrams(["game: startpos moves e2e4 e7e5"], True))
+    assert [d.name for d, _ in items] == ["game-000", "game-001", "game-002"]
+    assert items[0][0].fen == START_FEN and items[2][0].moves == ("e2e4", "e7e5")
+
+
+def test_export_writes_pngs_and_reports_bad_lines(tmp_path):
+    lines = [
+        f"knight: fen {KNIGHT_FEN} highlight d5 arrow d5e7",
+        "game: startpos moves e2e4 e7e5 g1f3",
+        "illegal: startpos moves e2e5",
+        "fen not-a-fen",
+    ]
+    report = diagram.export(diagram.read_diagrams(lines), str(tmp_path), size=200)
+
+    assert report["written"] == 2
+    assert len(report["errors"]) == 2
+    assert any("Illegal move e2e5" in error for error in report["errors"])
+    image = pygame.image.load(str(tmp_path / "knight.png"))
+    assert image.get_size() == (200, 200)
+    pygame.quit()
+
+
+def test_pool_draws_the_same_diagrams(tmp_path):
+    lines = [f"d{i}: startpos moves e2e4" for i in range(3)]
+    report = diagram.export(
+        diagram.read_diagrams(lines), str(tmp_path / "pool"), size=100, workers=2
+    )
+    assert report["written"] == 3 and not report["errors"]
+    diagram.export(diagram.read_diagrams(lines[:1]), str(tmp_path / "here"), size=100)
+
+    def pixels(path):
+        return pygame.image.tobytes(pygame.image.load(str(path)), "RGB")
+
+    assert pixels(tmp_path / "pool" / "d0.png") == pixels(tmp_path / "here" / "d0.png")
+    pygame.quit()
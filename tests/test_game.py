@@ -1,5 +1,6 @@
 import pytest
 
+from core.fen import START_FEN, board_from_fen, board_to_fen
 from core.piece import Piece, PieceType
 from game.state import GameState
 
@@ -132,3 +133,67 @@ def test_stalemate_switches_turn(fresh_state):
     assert state.game_result is None
     # Flagged so the GUI can announce it instead of white seeming to move twice.
     assert state.stalemate_skipped
+
+
+def _bare_kings() -> GameState:
+    state = GameState()
+    for row in range(8):
+        for col in range(8):
+            state.board.board[row][col] = None
+    state.board.board[7][4] = Piece(PieceType.KING, True, True)
+    state.board.board[0][4] = Piece(PieceType.KING, False, True)
+    return state
+
+
+def test_exchange_counts_spy_conversion_as_a_swing():
+    """Converting a defended rook gains it, loses the spy, then loses the rook"""
+    board = _bare_kings().board
+    board.board[4][3] = Piece(PieceType.SPY, True)  # d4
+    board.board[2][4] = Piece(PieceType.ROOK, False)  # e6
+    board.board[1][4] = Piece(PieceType.PAWN, False)  # e7 guards e6 head-on
+
+    assert board.static_exchange((4, 3), (2, 4)) == 2 * 500 - 350 - 500
+    # The exchange is only worked out, never left on the board.
+    assert board.get_piece((4, 3)).type == PieceType.SPY
+    assert not board.get_piece((2, 4)).is_white
+
+
+def test_exchange_bishop_cannot_recapture_queen():
+    """A queen converted under a bishop's nose stays converted"""
+    board = _bare_kings().board
+    board.board[4][3] = Piece(PieceType.SPY, True)  # d4
+    board.board[2][4] = Piece(PieceType.QUEEN, False)  # e6
+    board.board[0][2] = Piece(PieceType.BISHOP, False)  # c8 eyes e6
+
+    assert board.static_exchange((4, 3), (2, 4)) == 2 * 900 - 350
+
+
+def test_fen_round_trip_keeps_castling_rights(fresh_state):
+    """FEN castling rights follow whether the king and rooks have moved"""
+    board, is_white = board_from_fen(START_FEN)
+    assert is_white
+    assert board.snapshot() == fresh_state.board.snapshot()
+
+    assert fresh_state.make_move((6, 7), (4, 6))  # spy h2-g4
+    assert fresh_state.make_move((1, 0), (2, 0))
+    assert fresh_state.make_move((7, 7), (6, 7))  # Rh1-h2
+    fen = board_to_fen(fresh_state.board, fresh_state.is_white_turn)
+    assert fen.split()[1:3] == ["b", "Qkq"]
+
+    board, is_white = board_from_fen(fen)
+    assert not is_white
+    # Only kings' and rooks' has_moved survive, which is all the position key
+    # looks at.
+    assert board.zobrist_key(False) == fresh_state.board.zobrist_key(False)
+
+
+def test_unmoves_reverse_quiet_moves(fresh_state):
+    """Every quiet move can be walked back to where it started"""
+    board = fresh_state.board
+    for is_white in (True, False):
+        for start, end in board.legal_moves_for(is_white):
+            if board.get_piece(end) is not None:
+                continue
+            undo = board.apply_move(start, end)
+            assert start in board.get_unmoves(end)
+            board.undo_move(undo)
@@ -0,0 +1,29 @@
+from gui.loader import StagedLoader, StartupTimer
+
+
+def test_steps_run_in_order_within_the_budget():
+    timer = StartupTimer()
+    loader = StagedLoader(timer)
+    ran = []
+    for name in ("sounds", "fonts", "pieces"):
+        loader.add(name, lambda name=name: ran.append(name))
+
+    # Each run makes progress, however small the budget.
+    assert not loader.run(0)
+    assert ran == ["sounds"]
+    loader.finish()
+    assert loader.done and ran == ["sounds", "fonts", "pieces"]
+    assert [stage for stage, _, _ in timer.stages] == ran
+
+
+def test_startup_report_lists_every_stage():
+    timer = StartupTimer()
+    timer.mark("window")
+    timer.record("fonts", 2.5)
+    timer.mark("first frame")
+
+    assert timer.elapsed_ms("window") <= timer.elapsed_ms("first frame")
+    assert timer.elapsed_ms("loaded") is None
+    lines = timer.report().splitlines()
+    assert len(lines) == 4
+    assert lines[2].split() == ["2.5", lines[2].split()[1], "fonts"]
@@ -0,0 +1,100 @@
+from core.fen import board_from_fen
+from core.piece import PieceType
+from game import pgn
+from game.record import GameRecord
+from game.state import GameState
+
+# Adapted fool's mate, as in test_game.
+FOOLS_MATE = """[Event "Casual game"]
+[Site "?"]
+[Date "2026.10.19"]
+[Round "?"]
+[White "?"]
+[Black "Computer"]
+[Result "0-1"]
+[Difficulty "hard"]
+
+1. f2-f3 e7-e6 2. g2-g4 Bf8-d6 3. h3-h4 Qd8xh4+ 4. Ng1-g3 Qh4xg3# 0-1
+"""
+# Black is stalemated after white's king move, so white moves again.
+STALEMATE_FEN = "k7/2Q5/K7/8/8/8/8/8 w - - 0 1"
+
+
+def _read(text: str):
+    return list(pgn.read_games(text.splitlines(keepends=True)))
+
+
+def test_games_are_read_and_written_as_the_move_list_shows_them():
+    [(game, error)] = _read(FOOLS_MATE)
+    assert error is None
+    assert game.tags["Black"] == "Computer"
+    record = game.record
+    assert record.result == "black_wins" and record.difficulty == "hard"
+    assert record.moves[0] == (((6, 5), (5, 5)), PieceType.QUEEN)
+
+    state = GameState.from_record(record)
+    assert state.game_result == "black_wins"
+    assert state.move_log[-2:] == ["Ng1-g3", "Qh4xg3#"]
+    tags = {"Event": "Casual game", "Black": "Computer"}
+    assert pgn.format_game(record, tags) == FOOLS_MATE
+
+
+def test_stalemate_passes_and_set_up_positions():
+    state = GameState()
+    state.board, state.is_white_turn = board_from_fen(STALEMATE_FEN)
+    assert state.make_move((2, 0), (2, 1))
+    assert state.make_move((1, 2), (0, 2))
+    text = pgn.format_game(state.to_record(date=0))
+    assert '[FEN "k7/2Q5/K7/8/8/8/8/8 w - - 0 1"]' in text
+    assert "1. Ka6-b6 2. Qc7-c8# 1-0" in text
+
+    [(game, error)] = _read(text)
+    assert error is None and game.record == state.to_record(date=0)
+
+
+def test_other_tools_games_and_bad_games():
+    text = """% a line for another program
+[Event "Annotated"]
+[Result "1-0"]
+
+1. e2-e4 {a comment
+over two lines} e7-e5 $1 (1... d7-d5 2. e4xd5) 2. Ng1-f3!? ; the usual
+2... Nb8-c6
+
+[Event "Bad"]
+1. e2-e5 e7-e5 2. Ng1-f3 *
+
+[Event "Wrong separator"]
+1. e2xe4 *
+
+1. e2e4 d7-d5 2. e4xd5 1/2-1/2
+"""
+    items = _read(text)
+    assert len(items) == 4
+    (first, error), (_, bad), (_, separator), (last, _) = items
+    assert error is None
+    # No result token: the tag stands in for it.
+    assert first.record.result == "white_wins"
+    assert [move for move, _ in first.record.moves] == [
+        ((6, 4), (4, 4)),
+        ((1, 4), (3, 4)),
+        ((7, 6), (5, 5)),
+        ((0, 1), (2, 2)),
+    ]
+    assert bad.startswith("game 2 (line 9): move 1: e2-e5")
+    assert "should be written with '-'" in separator
+    assert last.record.result == "draw" and len(last.record.moves) == 3
+
+
+def test_writer_appends_games(tmp_path):
+    path = str(tmp_path / "games.pgn")
+    [(game, _)] = _read(FOOLS_MATE)
+    with pgn.PgnWriter(path) as writer:
+        writer.write(game.record)
+    with pgn.PgnWriter(path) as writer:
+        writer.write(GameRecord(), {"Event": "Not started"})
+
+    with open(path) as f:
+        games = [game for game, _ in pgn.read_games(f)]
+    assert [game.tags["Event"] for game in games] == ["?", "Not started"]
+    assert games[0].record == game.record and games[1].record.moves == ()
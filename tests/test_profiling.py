@@ -0,0 +1,39 @@
+import asyncio
+import io
+
+import profiling
+from core.board import ChessBoard
+from game import ai
+
+
+def test_profiling_is_off_unless_asked(monkeypatch):
+    monkeypatch.delenv(profiling.ENV_VAR, raising=False)
+    original = ChessBoard.get_moves
+    assert profiling.configure() is None
+    assert profiling.active() is None
+    assert ChessBoard.get_moves is original
+
+
+def test_profiling_counts_calls_and_stacks():
+    original = ChessBoard.legal_moves_for
+    profiler = profiling.enable(at_exit=False)
+    try:
+        assert ChessBoard.legal_moves_for is not original
+        board = ChessBoard()
+        board.legal_moves_for(True)
+        asyncio.run(ai._Search(board).best_move(2, True))
+    finally:
+        assert profiling.disable() is profiler
+    assert ChessBoard.legal_moves_for is original
+
+    assert profiler.calls["ChessBoard.legal_moves_for"] > 1
+    assert profiler.calls["_Search.best_move"] == 1
+    # The search's time includes everything it called, once.
+    assert profiler.total["_Search.best_move"] >= profiler.total["_Search.negamax"]
+    assert "ChessBoard.get_moves" in profiler.summary()
+
+    out = io.StringIO()
+    profiler.write_collapsed(out)
+    lines = out.getvalue().splitlines()
+    assert "ChessBoard.legal_moves_for" in [line.split()[0] for line in lines]
+    assert any(line.startswith("_Search.best_move;_Search.negamax;") for line in lines)
@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+from core.fen import START_FEN, board_from_fen
+from core.piece import PieceType
+from game import record
+from game.record import ArchiveWriter, GameArchive, GameRecord
+from game.state import GameState
+
+# Adapted fool's mate, as in test_game: black mates on the eighth ply.
+FOOLS_MATE = [
+    ((6, 5), (5, 5)),
+    ((1, 4), (2, 4)),
+    ((6, 6), (4, 6)),
+    ((0, 5), (2, 3)),
+    ((5, 7), (4, 7)),
+    ((0, 3), (4, 7)),
+    ((7, 6), (5, 6)),
+    ((4, 7), (5, 6)),
+]
+PROMOTION_FEN = "k7/4P3/8/8/8/8/8/K7 w - - 0 1"
+
+
+def _fools_mate() -> GameState:
+    state = GameState()
+    for move in FOOLS_MATE:
+        assert state.make_move(*move)
+    return state
+
+
+def test_records_are_two_bytes_a_ply_and_replay_exactly():
+    state = _fools_mate()
+    game = state.to_record("hard", date=1_700_000_000)
+    assert game.result == "black_wins" and game.fen == START_FEN
+    data = game.to_bytes()
+    assert len(data) == 9 + 2 * len(FOOLS_MATE)
+    assert GameRecord.from_bytes(data) == game
+
+    replayed = GameState.from_record(game)
+    assert replayed.move_log == state.move_log
+    assert replayed.game_over and replayed.game_result == "black_wins"
+
+    with pytest.raises(ValueError):
+        GameRecord.from_bytes(data[:-1])
+    with pytest.raises(ValueError, match="off the board"):
+        GameRecord(((((8, 0), (0, 0)), PieceType.QUEEN),)).to_bytes()
+    with pytest.raises(ValueError, match="promotion"):
+        GameRecord(((FOOLS_MATE[0], PieceType.KING),)).to_bytes()
+    with pytest.raises(ValueError):
+        GameState.from_record(GameRecord(((FOOLS_MATE[1], PieceType.QUEEN),)))
+
+
+def test_records_keep_the_start_position_and_promotions():
+    state = GameState()
+    state.board, state.is_white_turn = board_from_fen(PROMOTION_FEN)
+    assert state.make_move((1, 4), (0, 4), PieceType.KNIGHT)
+    assert state.make_move((0, 0), (1, 0))
+    state.undo()
+    game = GameRecord.from_bytes(state.to_record(date=0).to_bytes())
+    assert game.fen == PROMOTION_FEN
+    assert game.moves == ((((1, 4), (0, 4)), PieceType.KNIGHT),)
+
+    replayed = GameState.from_record(game)
+    assert replayed.board.get_piece((0, 4)).type == PieceType.KNIGHT
+    assert replayed.move_log == ["e7-e8=N"]
+
+
+def test_archive_appends_and_reads_games_in_place(tmp_path):
+    path = str(tmp_path / "games.c2ga")
+    games = [
+        _fools_mate().to_record(difficulty, date=day * 86400)
+        for day, difficulty in enumerate(record.DIFFICULTIES)
+    ]
+    with ArchiveWriter(path) as writer:
+        for game in games[:2]:
+            writer.append(game)
+    with ArchiveWriter(path) as writer:
+        for game in games[2:]:
+            writer.append(game)
+
+    with GameArchive(path) as archive:
+        assert len(archive) == len(games)
+        assert archive[2] == games[2] and archive[-1] == games[-1]
+        assert list(archive) == games
+        with pytest.raises(IndexError):
+            archive[len(games)]
+
+    # An index entry cut short by an interrupted write is ignored, and a lost
+    # index is rebuilt from the games themselves.
+    with open(record.index_path(path), "ab") as f:
+        f.write(b"\x01\x02\x03")
+    with GameArchive(path) as archive:
+        assert len(archive) == len(games)
+    os.remove(record.index_path(path))
+    assert record.rebuild_index(path) == len(games)
+    with GameArchive(path) as archive:
+        assert list(archive) == games
+
+    other = tmp_path / "other.c2ga"
+    other.write_bytes(b"not an archive")
+    with pytest.raises(ValueError):
+        ArchiveWriter(str(other))
+
+
+def test_replays_count_repetitions_from_the_records_start():
+    """The set-up position is the first of three, as in a game played from it"""
+    shuffle = [((7, 0), (7, 1)), ((0, 0), (0, 1)), ((7, 1), (7, 0)), ((0, 1), (0, 0))]
+    moves = tuple((move, PieceType.QUEEN) for move in shuffle * 2)
+    assert not GameState.from_record(GameRecord(moves[:4], fen=PROMOTION_FEN)).game_over
+    replayed = GameState.from_record(GameRecord(moves, fen=PROMOTION_FEN))
+    assert replayed.game_result == "draw"
@@ -0,0 +1,160 @@
+import copy
+import os
+
+import pytest
+
+# No window needed: SDL's dummy driver draws into memory.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+pygame = pytest.importorskip("pygame")
+
+from game.state import GameState  # noqa: E402
+from gui import atlas, bench  # noqa: E402
+from gui.atlas import PieceAtlas  # noqa: E402
+from gui.renderer import (  # noqa: E402
+    ATLAS_SPRITES,
+    WINDOW_HEIGHT,
+    WINDOW_WIDTH,
+    GUIRenderer,
+    LRUCache,
+)
+from utils import _resource_path  # noqa: E402
+
+
+@pytest.fixture
+def screen():
+    pygame.init()
+    yield pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    pygame.quit()
+
+
+def _pixels(surface) -> bytes:
+    return pygame.image.tobytes(surface, "RGB")
+
+
+def test_idle_frames_draw_nothing(screen):
+    renderer = GUIRenderer()
+    state = GameState()
+    assert renderer.render(screen, state)
+    assert renderer.render(screen, state) == []
+
+
+def test_partial_redraw_matches_full_redraw(screen):
+    """Redrawing only what changed leaves the same picture as starting over"""
+    renderer = GUIRenderer()
+    state = GameState()
+    renderer.render(screen, state)
+
+    state.selected_piece = (6, 4)
+    state.possible_moves = state.get_legal_moves((6, 4))
+    changed = renderer.render(screen, state)
+    assert 0 < len(changed) < 64
+
+    state.make_move((6, 4), (4, 4))
+    state.selected_piece = None
+    state.possible_moves = set()
+    changed = renderer.render(screen, state)
+    # The squares the pawn left, the squares its hints were on and the panel.
+    assert pygame.Rect(800, 0, 320, 800) in changed
+    assert pygame.Rect(0, 0, 100, 100) not in changed
+
+    partial = _pixels(screen)
+    renderer.invalidate()
+    renderer.render(screen, state)
+    assert _pixels(screen) == partial
+
+
+def test_move_hints_are_drawn_from_cached_surfaces(screen):
+    renderer = GUIRenderer()
+    state = GameState()
+    state.selected_piece = (7, 1)  # a knight, with its extra jumps
+    state.possible_moves = state.get_legal_moves((7, 1))
+    renderer.render(screen, state)
+    cached = len(renderer._overlay_cache)
+    assert cached
+
+    renderer.invalidate()
+    renderer.render(screen, state)
+    assert len(renderer._overlay_cache) == cached
+
+
+def test_long_move_list_renders_only_the_visible_rows(screen):
+    renderer = GUIRenderer()
+    state = GameState()
+    state.move_log = [f"a{i % 8 + 1}-b{i % 8 + 1}" for i in range(301)]
+    renderer.render(screen, state)
+    visible = len(renderer._move_rows)
+    assert 0 < visible < 30
+
+    # Coming back from the menu puts the same panel back without redrawing it.
+    renderer.render_menu(screen)
+    renderer._move_rows.clear()
+    renderer.render(screen, state)
+    assert not renderer._move_rows
+
+
+def test_lru_cache_forgets_the_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.counts == [3, 1] and len(cache) == 2
+
+
+def test_text_is_rendered_once(screen):
+    renderer = GUIRenderer()
+    state = GameState()
+    renderer.render(screen, state, thinking=True)
+    hits, misses = renderer.cache_counts["text"]
+    renderer.invalidate()
+    renderer._panel_layer_key = None
+    renderer.render(screen, state, thinking=True)
+    assert renderer.cache_counts["text"][1] <= misses + 1  # the next ellipsis
+    assert renderer.cache_counts["text"][0] > hits
+
+
+def test_piece_sheet_round_trip(screen, tmp_path):
+    renderer = GUIRenderer()
+    drawn = renderer.draw_piece_atlas()
+    path = str(tmp_path / "pieces.png")
+    drawn.save(path, renderer.atlas_signature())
+
+    loaded = PieceAtlas.load(path, renderer.atlas_signature())
+    assert loaded is not None and loaded.rects == drawn.rects
+    key = ATLAS_SPRITES[0]
+    assert _pixels(loaded.get(key)) == _pixels(drawn.get(key))
+    assert PieceAtlas.load(path, "stale") is None
+
+    # The shipped sheet is current, or the game would draw it at every launch.
+    assert PieceAtlas.load(_resource_path(atlas.ATLAS_PATH), renderer.atlas_signature())
+
+
+def test_menu_opens_only_the_fonts_it_needs(screen):
+    renderer = GUIRenderer()
+    renderer.render_menu(screen)
+    opened = set(vars(renderer)) & set(vars(GUIRenderer))
+    assert "menu_title_font" in opened
+    assert "game_over_font" not in opened and renderer._atlas is None
+
+    for _, step in renderer.loading_steps():
+        step()
+    assert isinstance(vars(renderer)["game_over_font"], pygame.font.Font)
+    assert renderer._atlas is not None
+
+
+def test_render_benchmark_covers_every_scene(screen):
+    report = bench.run(frames=3)
+    assert set(report["scenes"]) == set(bench.SCENES)
+    for name, scene in report["scenes"].items():
+        assert 0 < scene["full"]["p50"] <= scene["full"]["max"], name
+    # A still scene draws nothing once it is up, so it makes nothing either.
+    assert report["scenes"]["opening"]["live"]["surfaces"] == 0
+    assert bench.compare(report, report, threshold=0.0) == []
+
+    worse = copy.deepcopy(report)
+    worse["scenes"]["knight"]["live"]["surfaces"] += 1
+    problems = bench.compare(worse, report, threshold=1000.0)
+    assert problems and problems[0].startswith("knight (live) allocates more")
@@ -0,0 +1,114 @@
+import io
+import os
+import random
+
+import pytest
+
+# No window needed: SDL's dummy driver draws into memory.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pygame = pytest.importorskip("pygame")
+
+from core.piece import Piece, PieceType  # noqa: E402
+from gui import gif, replay  # noqa: E402
+from gui.renderer import MoveAnimation, SquareEffect  # noqa: E402
+
+
+def _gif_frames(data: bytes):
+    """(delay in hundredths of a second, (x, y, w, h)) of each frame of a GIF."""
+    assert data[:6] == b"GIF89a" and data[-1:] == b"\x3b"
+    frames = []
+    delay = None
+    p = 13
+    while data[p] != 0x3B:
+        if data[p] == 0x21:
+            label, p = data[p + 1], p + 2
+            if label == 0xF9:
+                delay = int.from_bytes(data[p + 2 : p + 4], "little")
+        else:
+            assert data[p] == 0x2C
+            x, y, w, h = (
+                int.from_bytes(data[p + i : p + i + 2], "little") for i in (1, 3, 5, 7)
+            )
+            flags = data[p + 9]
+            p += 10 + 3 * (2 << (flags & 7)) + 1
+            frames.append((delay, (x, y, w, h)))
+        while data[p]:
+            p += data[p] + 1
+        p += 1
+    return frames
+
+
+def test_virtual_clock_drives_the_animations():
+    clock = replay.VirtualClock()
+    anim = MoveAnimation(
+        [(Piece(PieceType.KNIGHT, True), (7, 6), (5, 5))], duration=100, clock=clock
+    )
+    effect = SquareEffect((5, 5), clock=clock)
+    assert anim.progress == 0.0
+    clock.advance(50)
+    assert anim.progress == 0.5 and not anim.done
+    clock.advance(50)
+    assert anim.done and not effect.done
+    clock.advance(SquareEffect.DURATION_MS)
+    assert effect.done
+
+
+def test_gif_decodes_to_the_same_pixels():
+    # Noise in 200 colours: exact in one palette, and long enough to fill the
+    # compressor's table and start it afresh several times over.
+    rng = random.Random(1)
+    colours = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(200)]
+    surface = pygame.Surface((120, 90))
+    for y in range(90):
+        for x in range(120):
+            surface.set_at((x, y), rng.choice(colours))
+    out = io.BytesIO()
+    writer = gif.GifWriter(out, (120, 90))
+    writer.add(surface, 100)
+    writer.close()
+
+    loaded = pygame.image.load(io.BytesIO(out.getvalue()), "replay.gif")
+    assert loaded.get_size() == (120, 90)
+    assert pygame.image.tobytes(loaded, "RGB") == pygame.image.tobytes(surface, "RGB")
+
+
+def test_gif_writes_only_what_changed():
+    out = io.BytesIO()
+    writer = gif.GifWriter(out, (40, 30))
+    surface = pygame.Surface((40, 30))
+    surface.fill((200, 180, 150))
+    writer.add(surface, 40)
+    surface.fill((10, 20, 30), (5, 6, 3, 2))
+    writer.add(surface, 40)
+    writer.add(surface, 40)
+    writer.add(surface, 40, area=(0, 0, 0, 0))
+    writer.close()
+
+    assert writer.frames == 2
+    assert _gif_frames(out.getvalue()) == [(4, (0, 0, 40, 30)), (12, (5, 6, 3, 2))]
+
+
+def test_replay_export(tmp_path):
+    game = replay.read_game(["# a game", "startpos moves e2e4 e7e5 g1f3"])
+    assert game.moves == ("e2e4", "e7e5", "g1f3")
+
+    path = str(tmp_path / "replay.gif")
+    report = replay.export(game, path, size=80)
+    assert 1 < report["written"] < report["drawn"]
+    frames = _gif_frames(open(path, "rb").read())
+    assert len(frames) == report["written"]
+    shown = sum(delay for delay, _ in frames) / 100
+    assert shown == pytest.approx(report["replay_seconds"])
+    assert pygame.image.load(path).get_size() == (80, 80)
+
+    out_dir = tmp_path / "frames"
+    again = replay.export(game, str(out_dir), size=80)
+    assert again["written"] == report["written"]
+    pngs = sorted(name for name in os.listdir(out_dir) if name.endswith(".png"))
+    assert len(pngs) == report["written"]
+    listed = (out_dir / replay.FRAME_LIST).read_text().split("\n")
+    durations = [float(line.split()[1]) for line in listed if line.startswith("dur")]
+    assert sum(durations) == pytest.approx(report["replay_seconds"])
+
+    with pytest.raises(ValueError):
+        replay.read_game(["startpos"])
@@ -0,0 +1,127 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+from core.fen import START_FEN
+from service.loadgen import _Connection
+from service.pool import DeadlineExpired, EnginePool
+from service.server import AnalysisServer
+
+MATE_IN_ONE = "6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1"
+
+
+class _BrokenPool:
+    """A pool whose worker processes have died."""
+
+    async def analyse(self, fen, **limits):
+        raise BrokenProcessPool("a worker died")
+
+
+def test_identical_requests_share_one_search():
+    """Concurrent requests for one position are searched once"""
+
+    async def scenario():
+        pool = EnginePool(workers=1, hash_mb=1)
+        await pool.start()
+        try:
+            # The same position with different move counters still coalesces.
+            return await asyncio.gather(
+                pool.analyse(START_FEN, depth=2),
+                pool.analyse(START_FEN.replace("0 1", "0 7"), depth=2),
+                pool.analyse(START_FEN, depth=2),
+                pool.analyse(MATE_IN_ONE, depth=2),
+            ), pool.stats
+        finally:
+            await pool.close()
+
+    results, stats = asyncio.run(scenario())
+    assert results[0] is results[1] is results[2]
+    assert results[0]["shared_by"] == 3
+    assert results[3]["bestmove"] == "a1a8"
+    assert stats["searched"] == 2 and stats["coalesced"] == 2
+
+
+def test_a_request_that_gives_up_leaves_the_search_to_the_others():
+    """A short deadline or a cancelled request fails only its own caller"""
+
+    async def scenario():
+        pool = EnginePool(workers=1, hash_mb=1)
+        await pool.start()
+        try:
+            patient = asyncio.ensure_future(pool.analyse(START_FEN, depth=3))
+            await asyncio.sleep(0)
+            hasty = asyncio.ensure_future(
+                pool.analyse(START_FEN, depth=3, deadline=0.001)
+            )
+            cancelled = asyncio.ensure_future(pool.analyse(START_FEN, depth=3))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            outcomes = await asyncio.gather(
+                patient, hasty, cancelled, return_exceptions=True
+            )
+            return outcomes, pool.stats
+        finally:
+            await pool.close()
+
+    (result, hasty, cancelled), stats = asyncio.run(scenario())
+    assert result["bestmove"] is not None and result["shared_by"] == 1
+    assert isinstance(hasty, DeadlineExpired)
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert stats["searched"] == 1 and stats["expired"] == 1
+
+
+def test_http_analyse_round_trip():
+    """The service answers best-move requests and rejects bad positions"""
+
+    async def scenario():
+        pool = EnginePool(workers=1, hash_mb=1)
+        await pool.start()
+        listener = await asyncio.start_server(
+            AnalysisServer(pool).handle_connection, "127.0.0.1", 0
+        )
+        port = listener.sockets[0].getsockname()[1]
+        connection = _Connection("127.0.0.1", port)
+        try:
+            # Both requests go over one kept-alive connection.
+            good = await connection.request(
+                "POST", "/analyse", {"fen": MATE_IN_ONE, "depth": 2}
+            )
+            bad = await connection.request("POST", "/analyse", {"fen": "8/8 w"})
+            return good, bad
+        finally:
+            connection.close()
+            listener.close()
+            await pool.close()
+
+    (status, answer), (bad_status, _) = asyncio.run(scenario())
+    assert status == 200
+    assert answer["bestmove"] == "a1a8"
+    assert answer["score"] == {"mate": 1}
+    assert bad_status == 400
+
+
+def test_bad_headers_and_failed_workers_are_answered():
+    """Neither a bad Content-Length nor a dead worker leaves the client hanging"""
+
+    async def scenario():
+        listener = await asyncio.start_server(
+            AnalysisServer(_BrokenPool()).handle_connection, "127.0.0.1", 0
+        )
+        port = listener.sockets[0].getsockname()[1]
+        statuses = []
+        try:
+            for length in ("ten", "-5"):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                head = f"POST /analyse HTTP/1.1\r\nContent-Length: {length}\r\n\r\n"
+                writer.write(head.encode())
+                statuses.append(int((await reader.readline()).split()[1]))
+                writer.close()
+            connection = _Connection("127.0.0.1", port)
+            statuses.append(
+                (await connection.request("POST", "/analyse", {"fen": START_FEN}))[0]
+            )
+            connection.close()
+        finally:
+            listener.close()
+        return statuses
+
+    assert asyncio.run(scenario()) == [400, 400, 500]
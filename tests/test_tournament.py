@@ -0,0 +1,36 @@
+import pytest
+
+from game import tournament
+from game.tournament import Player
+
+
+def test_player_parse():
+    player = Player.parse("depth=3,time=0.5,-lmr,-null_move")
+    assert player == Player(depth=3, movetime=0.5, disabled=("lmr", "null_move"))
+    assert Player.parse(str(player)) == player
+    assert Player.parse(str(Player(hash_mb=64))).hash_mb == 64
+    # A time limit alone searches as deep as the time allows.
+    assert Player.parse("time=1").depth > 10
+    with pytest.raises(ValueError):
+        Player.parse("-quiescence")
+
+
+def test_elo_and_sprt():
+    elo, margin = tournament.elo_estimate(10, 0, 10)
+    assert elo == 0 and margin == pytest.approx(163.3, abs=0.1)
+    elo, margin = tournament.elo_estimate(60, 20, 20)
+    assert elo == pytest.approx(147.2, abs=0.1) and 0 < margin < elo
+
+    lower, upper = tournament.sprt_bounds(0.05, 0.05)
+    assert tournament.sprt_llr(200, 100, 100, 0, 20) > upper
+    assert tournament.sprt_llr(100, 100, 200, 0, 20) < lower
+
+
+def test_tournament_plays_both_colours():
+    """Each opening is played twice with colours swapped, in worker processes"""
+    result = tournament.run(
+        Player(depth=1), Player(depth=1), games=2, workers=1, max_plies=6
+    )
+    assert result["games"] == 2 and result["draws"] == 2
+    assert result["endings"] == {"max plies": 2}
+    assert result["nps"]["a"] > 0 and result["nps"]["b"] > 0
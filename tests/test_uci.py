@@ -0,0 +1,80 @@
+import asyncio
+import io
+import subprocess
+import sys
+from pathlib import Path
+
+from game import uci
+
+
+def _session(*commands: str) -> list:
+    out = io.StringIO()
+
+    async def drive():
+        engine = uci.Engine(out)
+        for command in commands:
+            await engine.handle(command)
+        await engine.wait()
+
+    asyncio.run(drive())
+    return out.getvalue().splitlines()
+
+
+def test_go_reports_progress_and_best_move():
+    """A FEN plus moves is set up, and the back-rank mate is announced"""
+    lines = _session(
+        "position fen 6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1 moves g1f1 g8h8 f1g1 h8g8",
+        "go depth 3",
+    )
+    assert lines[-1] == "bestmove a1a8"
+    info = lines[-2].split()
+    assert info[:2] == ["info", "depth"]
+    assert info[info.index("score") + 1 : info.index("score") + 3] == ["mate", "1"]
+    assert "nodes" in info and "nps" in info
+
+
+def test_engine_runs_without_pygame():
+    """The engine starts and answers without loading pygame"""
+    src = Path(__file__).parent.parent / "src"
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, game.uci; print('pygame' in sys.modules)",
+        ],
+        cwd=src,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
+
+    result = subprocess.run(
+        [sys.executable, "-m", "game.uci"],
+        cwd=src,
+        input="uci\nisready\nquit\n",
+        capture_output=True,
+        text=True,
+        timeout=30,
+        check=True,
+    )
+    assert result.stdout.splitlines()[-2:] == ["uciok", "readyok"]
+
+
+def test_stop_is_read_behind_commands_waiting_for_a_search():
+    """A position sent mid-search waits for it, but the stop after it still ends it"""
+    stdin = io.StringIO(
+        "go infinite\nposition startpos moves e2e4\nisready\ngo infinite\nstop\n"
+    )
+    out = io.StringIO()
+    asyncio.run(asyncio.wait_for(uci.run(stdin, out), timeout=30))
+    lines = out.getvalue().splitlines()
+    assert "readyok" in lines
+    assert len([line for line in lines if line.startswith("bestmove")]) == 2
+
+
+def test_clock_budget_keeps_a_floor():
+    """Even with the clock all but run out, a search gets ten milliseconds"""
+    engine = uci.Engine(io.StringIO())
+    assert engine._budget({"wtime": 1}) == 0.01
+    assert engine._budget({"wtime": 60_000, "movestogo": 30}) == 2.0